@@ -1,5 +1,19 @@
 """Placeholder async functions for future API integrations."""
 
+import httpx
+
+from config import settings
+
+# Shared by all CRM requests so connections are reused
+_http_client: httpx.AsyncClient | None = None
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(timeout=10.0)
+    return _http_client
+
 
 async def get_live_events(city: str | None = None, category: str | None = None) -> dict:
     """Fetch live/upcoming events. Placeholder for future integration."""
@@ -19,9 +33,16 @@ async def get_booking_status(booking_id: str) -> dict:
 
 
 async def submit_lead(lead_data: dict) -> dict:
-    """Submit a lead/inquiry. Currently logs only."""
+    """Forward a lead to the CRM webhook (settings.crm_webhook_url).
+    Raises on failure so the lead pipeline retries. Without a webhook
+    configured the lead pipeline keeps leads pending and does not call this."""
+    if not settings.crm_webhook_url:
+        raise RuntimeError("No CRM webhook configured")
+
+    resp = await _get_http_client().post(settings.crm_webhook_url, json=lead_data)
+    resp.raise_for_status()
     return {
-        "status": "captured",
+        "status": "forwarded",
         "message": "Lead submitted successfully. Our team will reach out within 24 hours.",
     }
 
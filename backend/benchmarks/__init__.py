@@ -0,0 +1,9 @@
+"""Benchmarks for the chat pipeline (run from backend/).
+
+  python -m benchmarks.micro            microbenchmarks of the pipeline stages
+  python -m benchmarks.load             end-to-end load test against a fake Ollama
+  python -m benchmarks.fake_ollama      the fake Ollama server on its own
+
+Both benchmarks write a JSON report (--output) and can compare it with an
+earlier one (--baseline), e.g. one saved on the previous commit.
+"""
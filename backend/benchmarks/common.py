@@ -0,0 +1,126 @@
+"""Helpers shared by the benchmarks: percentiles, memory, JSON reports."""
+
+import os
+import json
+import math
+import socket
+import platform
+import subprocess
+from datetime import datetime
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def offline_env() -> None:
+    """Never reach the network: the embedding model must already be in the
+    local Hugging Face cache (start the app once to download it)."""
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+    os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """Nearest-rank percentile of an already sorted list (0 if empty)."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+def latency_summary(values: list[float], unit: float = 1000.0) -> dict:
+    """count/mean/p50/p95/p99/max of durations in seconds, scaled by `unit`
+    (milliseconds by default)."""
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values) * unit, 3),
+        "p50": round(percentile(values, 50) * unit, 3),
+        "p95": round(percentile(values, 95) * unit, 3),
+        "p99": round(percentile(values, 99) * unit, 3),
+        "max": round(values[-1] * unit, 3),
+    }
+
+
+def memory_mb(pid: int | str = "self") -> dict:
+    """Current (VmRSS) and peak (VmHWM) resident memory of a process, in MB."""
+    result = {}
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "VmHWM"):
+                    result["rss" if key == "VmRSS" else "peak"] = round(int(value.split()[0]) / 1024, 1)
+    except OSError:
+        pass
+    return result
+
+
+def environment() -> dict:
+    """What the numbers were measured on."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR, capture_output=True, text=True, timeout=10,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {
+        "commit": commit or None,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def _flatten(data: dict, prefix: str = "") -> dict[str, float]:
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(results: dict, baseline_path: str) -> None:
+    """Print every numeric result next to the baseline report's value."""
+    baseline = json.loads(Path(baseline_path).read_text(encoding="utf-8"))
+    old = _flatten(baseline.get("results", {}))
+    print(f"\n  Compared with {baseline_path} (commit {baseline.get('environment', {}).get('commit')}):")
+    for name, value in _flatten(results).items():
+        if name not in old:
+            continue
+        before = old[name]
+        change = f"{(value - before) / before * 100:+.1f}%" if before else "n/a"
+        print(f"  {name:<55} {before:>12g} -> {value:>12g}  {change}")
+
+
+def report(name: str, config: dict, results: dict, output: str | None, baseline: str | None) -> dict:
+    """Assemble the JSON report, write it to `output` (if given) and print
+    the comparison with `baseline` (if given)."""
+    data = {"benchmark": name, "environment": environment(), "config": config, "results": results}
+    text = json.dumps(data, indent=2)
+    if output:
+        Path(output).write_text(text + "\n", encoding="utf-8")
+        print(f"\n  Report written to {output}")
+    else:
+        print(text)
+    if baseline:
+        compare(results, baseline)
+    return data
+
+
+def add_report_args(parser) -> None:
+    parser.add_argument("--output", "-o", help="write the JSON report to this file")
+    parser.add_argument("--baseline", "-b", help="JSON report to compare with")
@@ -0,0 +1,103 @@
+"""Fake Ollama server for load tests.
+
+Implements /api/tags and /api/chat (streaming and not) with a configurable
+prompt-processing delay and generation rate, and reports eval_count /
+eval_duration like Ollama does, so the chat pipeline can be load-tested
+without a GPU or a model.
+
+    python -m benchmarks.fake_ollama --port 11500 --tokens-per-second 30
+"""
+
+import json
+import asyncio
+import argparse
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+DEFAULT_ANSWER = (
+    "Thanks for reaching out! You can book tickets on our website in a few "
+    "steps: pick your event, choose the seats and pay securely online. "
+    "Your e-ticket arrives by email and WhatsApp right after payment."
+)
+
+
+def create_app(
+    model: str = "phi3:mini",
+    tokens_per_second: float = 30.0,
+    prompt_delay: float = 0.2,
+    answer: str = DEFAULT_ANSWER,
+) -> Starlette:
+    """ASGI app answering every chat with `answer`, one word per token."""
+    tokens = [word + " " for word in answer.split()]
+    token_delay = 1.0 / tokens_per_second if tokens_per_second > 0 else 0.0
+    stats = {"requests": 0, "inflight": 0}
+
+    def final(prompt_tokens: int) -> dict:
+        return {
+            "model": model,
+            "done": True,
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(prompt_delay * 1e9),
+            "eval_count": len(tokens),
+            "eval_duration": int(len(tokens) * token_delay * 1e9),
+        }
+
+    async def tags(request: Request) -> JSONResponse:
+        return JSONResponse({"models": [{"name": model}]})
+
+    async def chat(request: Request):
+        body = await request.json()
+        # Rough prompt size, like conversation_manager.estimate_tokens
+        prompt_tokens = sum(len(m.get("content", "")) // 4 + 1 for m in body.get("messages", []))
+        stats["requests"] += 1
+
+        if not body.get("stream", True):
+            stats["inflight"] += 1
+            try:
+                await asyncio.sleep(prompt_delay + len(tokens) * token_delay)
+            finally:
+                stats["inflight"] -= 1
+            return JSONResponse({"message": {"role": "assistant", "content": answer}, **final(prompt_tokens)})
+
+        async def generate():
+            stats["inflight"] += 1
+            try:
+                await asyncio.sleep(prompt_delay)
+                for token in tokens:
+                    await asyncio.sleep(token_delay)
+                    yield json.dumps({"model": model, "message": {"role": "assistant", "content": token}, "done": False}) + "\n"
+                yield json.dumps({"message": {"role": "assistant", "content": ""}, **final(prompt_tokens)}) + "\n"
+            finally:
+                stats["inflight"] -= 1
+
+        return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+    async def fake_stats(request: Request) -> JSONResponse:
+        return JSONResponse(stats)
+
+    return Starlette(routes=[
+        Route("/api/tags", tags),
+        Route("/api/chat", chat, methods=["POST"]),
+        Route("/stats", fake_stats),
+    ])
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--model", default="phi3:mini")
+    parser.add_argument("--tokens-per-second", type=float, default=30.0)
+    parser.add_argument("--prompt-delay", type=float, default=0.2, help="seconds before the first token")
+    args = parser.parse_args()
+
+    app = create_app(args.model, args.tokens_per_second, args.prompt_delay)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
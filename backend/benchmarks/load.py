@@ -0,0 +1,222 @@
+"""End-to-end load test of the chat API against a fake Ollama.
+
+Starts benchmarks.fake_ollama and the app (python main.py) as separate
+processes on free local ports, simulates `--concurrency` users holding
+`--turns`-message conversations, and reports request latency
+percentiles, time to first token (--stream), throughput, the answer paths
+the server took (llm, cache, fast_path, fallback, ...), its mean stage
+latencies and its memory.
+
+    python -m benchmarks.load --requests 300 --concurrency 16 --stream -o load.json
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+import httpx
+
+from benchmarks.common import (
+    BACKEND_DIR,
+    offline_env,
+    free_port,
+    latency_summary,
+    memory_mb,
+    add_report_args,
+    report,
+)
+from benchmarks.micro import MESSAGES
+
+
+def _start(args: list[str], env: dict, log: Path) -> subprocess.Popen:
+    # The child keeps its own handle on the log
+    with open(log, "w") as out:
+        return subprocess.Popen(
+            [sys.executable, *args],
+            cwd=BACKEND_DIR,
+            env=env,
+            stdout=out,
+            stderr=subprocess.STDOUT,
+        )
+
+
+async def _wait_ready(client: httpx.AsyncClient, url: str, proc: subprocess.Popen, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {proc.returncode}")
+        try:
+            if (await client.get(url, timeout=2.0)).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError(f"{url} not ready after {timeout:.0f}s")
+
+
+async def _chat(client: httpx.AsyncClient, base: str, brand: str, message: str, session_id: str, stream: bool) -> tuple[str | None, float, float | None]:
+    """One chat request. Returns (error or None, latency, time to first token)."""
+    body = {"message": message, "sessionId": session_id}
+    start = time.perf_counter()
+    first_token = None
+    try:
+        if not stream:
+            resp = await client.post(f"{base}/api/{brand}/chat", json=body)
+            if resp.status_code != 200:
+                error = f"HTTP {resp.status_code}"
+            else:
+                error = None if resp.json().get("success", False) else "success=false"
+            return error, time.perf_counter() - start, None
+
+        error = "no done event"
+        async with client.stream("POST", f"{base}/api/{brand}/chat/stream", json=body) as resp:
+            if resp.status_code != 200:
+                return f"HTTP {resp.status_code}", time.perf_counter() - start, None
+            async for line in resp.aiter_lines():
+                if line == "event: token" and first_token is None:
+                    first_token = time.perf_counter() - start
+                elif line == "event: error":
+                    error = "error event"
+                elif line == "event: done":
+                    error = None
+        return error, time.perf_counter() - start, first_token
+    except httpx.HTTPError as e:
+        return type(e).__name__, time.perf_counter() - start, first_token
+
+
+async def _drive(base: str, args: argparse.Namespace) -> dict:
+    conversations = [
+        [
+            # Unique text keeps the semantic cache and coalescing out of the
+            # way unless --repeat-questions is given
+            MESSAGES[(c + t) % len(MESSAGES)] + ("" if args.repeat_questions else f" (ref {c}-{t})")
+            for t in range(args.turns)
+        ]
+        for c in range(-(-args.requests // args.turns))
+    ]
+    queue: asyncio.Queue = asyncio.Queue()
+    for c, turns in enumerate(conversations):
+        queue.put_nowait((f"bench_{os.getpid()}_{c}", turns))
+
+    latencies, first_tokens = [], []
+    errors: dict[str, int] = {}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(timeout=120.0, limits=limits) as client:
+        async def user() -> None:
+            while not queue.empty():
+                session_id, turns = queue.get_nowait()
+                for message in turns:
+                    error, latency, first_token = await _chat(client, base, args.brand, message, session_id, args.stream)
+                    if error:
+                        errors[error] = errors.get(error, 0) + 1
+                        continue
+                    latencies.append(latency)
+                    if first_token is not None:
+                        first_tokens.append(first_token)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+
+    results = {
+        "requests": len(latencies) + sum(errors.values()),
+        "errors": sum(errors.values()),
+        "errors_by_reason": errors,
+        "duration_s": round(elapsed, 2),
+        "rps": round(len(latencies) / elapsed, 2),
+        "latency_ms": latency_summary(latencies),
+    }
+    if args.stream:
+        results["first_token_ms"] = latency_summary(first_tokens)
+    return results
+
+
+async def _run(args: argparse.Namespace) -> dict:
+    offline_env()
+    tmp = Path(tempfile.mkdtemp(prefix="chatbot_bench_"))
+    ollama_port, app_port = free_port(), free_port()
+
+    env = dict(os.environ)
+    env.update({
+        "OLLAMA_BASE_URL": f"http://127.0.0.1:{ollama_port}",
+        "OLLAMA_ENDPOINTS": "",
+        "OLLAMA_MODEL": args.model,
+        "APP_PORT": str(app_port),
+        "WORKERS": "1",
+        "LEADS_DB_PATH": str(tmp / "leads.db"),
+        "SESSION_DB_PATH": str(tmp / "sessions.db"),
+        "SESSION_JOURNAL_ENABLED": "false",
+        "PYTHONUNBUFFERED": "1",
+    })
+    fake = _start(
+        ["-m", "benchmarks.fake_ollama", "--port", str(ollama_port), "--model", args.model,
+         "--tokens-per-second", str(args.tokens_per_second), "--prompt-delay", str(args.prompt_delay)],
+        env, tmp / "fake_ollama.log",
+    )
+    app = _start(["main.py"], env, tmp / "app.log")
+    base = f"http://127.0.0.1:{app_port}"
+
+    try:
+        async with httpx.AsyncClient() as client:
+            await _wait_ready(client, f"http://127.0.0.1:{ollama_port}/api/tags", fake, 30)
+            print(f"  [BENCH] Starting the app (log: {tmp / 'app.log'})...")
+            await _wait_ready(client, f"{base}/health", app, args.startup_timeout)
+            for i in range(3):
+                await _chat(client, base, args.brand, f"warm up {i}", f"bench_warmup_{i}", args.stream)
+            before = (await client.get(f"{base}/health")).json()
+            memory_before = memory_mb(app.pid)
+
+        print(f"  [BENCH] {args.requests} requests, {args.concurrency} concurrent users...")
+        results = await _drive(base, args)
+
+        async with httpx.AsyncClient() as client:
+            after = (await client.get(f"{base}/health")).json()
+        paths_before = before.get("requests_by_path", {})
+        results["paths"] = {
+            path: count - paths_before.get(path, 0)
+            for path, count in after.get("requests_by_path", {}).items()
+            if count - paths_before.get(path, 0)
+        }
+        results["server_stage_mean_ms"] = {
+            stage: round(stats["mean"] * 1000, 3) for stage, stats in after.get("stage_latency", {}).items()
+        }
+        results["server_memory_mb"] = {"before": memory_before, "after": memory_mb(app.pid)}
+    finally:
+        for proc in (app, fake):
+            proc.terminate()
+        for proc in (app, fake):
+            try:
+                proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--turns", type=int, default=3, help="messages per conversation")
+    parser.add_argument("--stream", action="store_true", help="use the SSE endpoint")
+    parser.add_argument("--brand", default="ticket99")
+    parser.add_argument("--model", default="phi3:mini")
+    parser.add_argument("--tokens-per-second", type=float, default=30.0, help="fake Ollama generation rate")
+    parser.add_argument("--prompt-delay", type=float, default=0.2, help="fake Ollama seconds before the first token")
+    parser.add_argument("--repeat-questions", action="store_true", help="let the cache and coalescing answer repeats")
+    parser.add_argument("--startup-timeout", type=float, default=300.0)
+    add_report_args(parser)
+    args = parser.parse_args()
+
+    results = asyncio.run(_run(args))
+    config = {k: v for k, v in vars(args).items() if k not in ("output", "baseline")}
+    report("load", config, results, args.output, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
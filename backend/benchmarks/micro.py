@@ -0,0 +1,95 @@
+"""Microbenchmarks of the chat pipeline stages, in-process.
+
+    python -m benchmarks.micro [--seconds 2] [--output micro.json] [--baseline old.json]
+
+Each benchmark runs for about --seconds after a short warm-up; the report
+has ops/second and latency percentiles in microseconds per call. The
+vector index is built (or synced) first, like on app startup.
+"""
+
+import time
+import argparse
+from collections.abc import Callable
+
+from benchmarks.common import offline_env, latency_summary, add_report_args, report, memory_mb
+
+MESSAGES = [
+    "hello",
+    "how much does it cost to list an event?",
+    "I want a refund for my concert tickets",
+    "how do I organize a marathon and sell tickets online?",
+    "tell me about partnership opportunities for venues",
+    "what is the weather today?",
+    "mujhe Diwali event ke tickets kaise milenge?",
+    "¿Cómo puedo comprar entradas para el concierto?",
+    "where are you available in India?",
+    "can I get a GST invoice for my booking",
+]
+
+
+def bench(fn: Callable[[int], object], seconds: float, warmup: int = 5) -> dict:
+    """Call fn(i) repeatedly for about `seconds`; fn cycles through its inputs by i."""
+    for i in range(warmup):
+        fn(i)
+    timings = []
+    deadline = time.perf_counter() + seconds
+    i = 0
+    while time.perf_counter() < deadline or i < 10:
+        start = time.perf_counter()
+        fn(i)
+        timings.append(time.perf_counter() - start)
+        i += 1
+    total = sum(timings)
+    return {"ops_per_sec": round(len(timings) / total, 1), "us": latency_summary(timings, unit=1e6)}
+
+
+def run(seconds: float, brand: str) -> dict:
+    offline_env()
+    # Imported after offline_env(): config and the embedding model load on import
+    import vector_store
+    from intent_classifier import classify_intent
+    from conversation_manager import add_message
+    from language_detection import detect_language
+    from rag_chain import _build_prompt
+
+    print("  [BENCH] Preparing index...")
+    vector_store.initialize()
+    embeddings = [vector_store.embed_query(m) for m in MESSAGES]
+    rag_context = vector_store.search(brand, MESSAGES[1], top_k=3, query_embedding=embeddings[1])
+
+    session_id = "bench_micro"
+    for turn in range(10):
+        add_message(session_id, "user", MESSAGES[turn % len(MESSAGES)])
+        add_message(session_id, "assistant", "Sure, here is what you need to know about that. " * 4)
+
+    n = len(MESSAGES)
+    benchmarks = {
+        "classify_intent": lambda i: classify_intent(MESSAGES[i % n]),
+        "detect_language": lambda i: detect_language(MESSAGES[i % n], session_id),
+        # Uncached query embedding (the memoized path is a dict lookup)
+        "embed_query": lambda i: vector_store._encode_query(f"{MESSAGES[i % n]} {i}"),
+        "vector_search": lambda i: vector_store.search(brand, MESSAGES[i % n], top_k=3, query_embedding=embeddings[i % n]),
+        "build_prompt": lambda i: _build_prompt(brand, MESSAGES[i % n], session_id, "pricing", "en", rag_context),
+    }
+
+    results = {}
+    for name, fn in benchmarks.items():
+        results[name] = bench(fn, seconds)
+        print(f"  [BENCH] {name:<16} {results[name]['ops_per_sec']:>10} ops/s  p50 {results[name]['us']['p50']} us")
+    results["memory_mb"] = memory_mb()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=2.0, help="duration of each benchmark")
+    parser.add_argument("--brand", default="ticket99")
+    add_report_args(parser)
+    args = parser.parse_args()
+
+    results = run(args.seconds, args.brand)
+    report("micro", {"seconds": args.seconds, "brand": args.brand}, results, args.output, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
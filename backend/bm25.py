@@ -0,0 +1,107 @@
+"""In-memory BM25 keyword index and reciprocal rank fusion.
+
+vector_store builds one BM25Index per brand from the same items it embeds
+and fuses its ranking with the dense one, so exact terms (city names,
+"GST", plan names) that the embedding model ranks poorly still surface.
+Term weights are precomputed at build time; a query only sums posting
+weights.
+"""
+
+import re
+import math
+from collections import Counter
+from collections.abc import Hashable, Iterable
+
+_TOKEN = re.compile(r"\w+")
+# Function words, too common to say anything about relevance ("q" and "a"
+# are also the Q:/A: markers of indexed FAQ text)
+_STOPWORDS = frozenset("""
+    a an the is are was were be been am do does did have has had i you he she
+    it we they me my your our their this that these those what which who whom
+    how when where why can could will would should shall may might must to of
+    in on at for with from about by and or but if so as any some much many q
+""".split())
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased word tokens without stopwords, plural "s" stripped."""
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in _STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    def __init__(self, k1: float = 1.5, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self.ids: list[str] = []
+        self.metadatas: list[dict] = []
+        # term -> [(doc, weight)], weight = idf * saturated term frequency
+        self._postings: dict[str, list[tuple[int, float]]] = {}
+        self._idf: dict[str, float] = {}
+
+    def build(self, items: Iterable[tuple[str, str, dict]]) -> "BM25Index":
+        """Index (id, text, metadata) items, replacing previous contents."""
+        self.ids, self.metadatas, term_counts = [], [], []
+        for item_id, text, metadata in items:
+            self.ids.append(item_id)
+            self.metadatas.append(metadata)
+            term_counts.append(Counter(tokenize(text)))
+
+        n = len(term_counts)
+        lengths = [sum(counts.values()) for counts in term_counts]
+        avg_length = (sum(lengths) / n) if n else 0.0
+        document_frequency = Counter(term for counts in term_counts for term in counts)
+        self._idf = {
+            term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in document_frequency.items()
+        }
+
+        postings: dict[str, list[tuple[int, float]]] = {}
+        for doc, counts in enumerate(term_counts):
+            norm = self.k1 * (1 - self.b + self.b * lengths[doc] / avg_length) if avg_length else self.k1
+            for term, tf in counts.items():
+                weight = self._idf[term] * tf * (self.k1 + 1) / (tf + norm)
+                postings.setdefault(term, []).append((doc, weight))
+        self._postings = postings
+        return self
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def search(self, query: str, top_k: int) -> list[tuple[str, dict, float, float]]:
+        """Best matches as [(id, metadata, score, coverage)], highest score
+        first. coverage is the idf-weighted share of the query's terms that
+        the document contains (terms unknown to the index count fully)."""
+        terms = set(tokenize(query))
+        if not terms or not self.ids:
+            return []
+
+        unknown_idf = math.log(1 + (len(self.ids) + 0.5) / 0.5)
+        total_idf = sum(self._idf.get(term, unknown_idf) for term in terms)
+        scores: dict[int, float] = {}
+        matched_idf: dict[int, float] = {}
+        for term in terms:
+            for doc, weight in self._postings.get(term, ()):
+                scores[doc] = scores.get(doc, 0.0) + weight
+                matched_idf[doc] = matched_idf.get(doc, 0.0) + self._idf[term]
+
+        best = sorted(scores, key=scores.get, reverse=True)[:top_k]
+        return [
+            (self.ids[doc], self.metadatas[doc], scores[doc], matched_idf[doc] / total_idf)
+            for doc in best
+        ]
+
+
+def reciprocal_rank_fusion(rankings: list[list[Hashable]], k: int = 60) -> list[tuple[Hashable, float]]:
+    """Fuse rankings (best first) into one: each key scores the sum of
+    1 / (k + rank) over the rankings it appears in."""
+    scores: dict[Hashable, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,156 @@
+"""Structure-aware chunking of knowledge documents.
+
+Documents are read line by line (never whole) and split into sections at
+headings: Markdown "# Title", underlined titles ("Title" followed by a line
+of === or ---) and short ALL-CAPS lines. Within a section, paragraphs and
+then sentences are packed into chunks of at most `max_tokens` tokens as
+counted by the embedding model's tokenizer, so no chunk is truncated by
+its input window and no sentence is cut in half. The last sentences of a
+chunk (up to `overlap_tokens`) are repeated at the start of the next one
+in the same section. A chunk never spans two sections; each carries its
+section title.
+"""
+
+import re
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass
+from pathlib import Path
+
+_MARKDOWN_HEADING = re.compile(r"^#{1,6}\s+(.+?)\s*#*$")
+_UNDERLINE = re.compile(r"^\s*(=+|-+)\s*$")
+# Sentence ends: . ! ? followed by whitespace and an uppercase letter, digit or quote
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(])")
+
+
+@dataclass
+class Chunk:
+    text: str
+    section: str
+    tokens: int
+
+
+def _is_caps_heading(line: str) -> bool:
+    words = line.split()
+    return 0 < len(words) <= 8 and line.isupper() and not line.endswith((".", ",", ":"))
+
+
+def iter_paragraphs(lines: Iterable[str]) -> Iterator[tuple[str, str]]:
+    """Yield (section title, paragraph) from an iterable of lines. Lines of
+    a paragraph (e.g. list items) are kept together with their newlines."""
+    section = ""
+    paragraph: list[str] = []
+    pending: str | None = None  # previous line, a heading if underlined
+
+    def flush() -> Iterator[tuple[str, str]]:
+        if paragraph:
+            yield section, "\n".join(paragraph)
+            paragraph.clear()
+
+    for raw in lines:
+        line = raw.rstrip("\n").rstrip()
+        if pending is not None:
+            if _UNDERLINE.match(line):
+                yield from flush()
+                section, pending = pending.strip(), None
+                continue
+            paragraph.append(pending)
+            pending = None
+
+        stripped = line.strip()
+        if not stripped or _UNDERLINE.match(stripped):
+            # Blank line, horizontal rule or the underline of a caps heading
+            yield from flush()
+            continue
+        heading = _MARKDOWN_HEADING.match(stripped)
+        if heading or (not paragraph and _is_caps_heading(stripped)):
+            yield from flush()
+            section = heading.group(1) if heading else stripped
+            continue
+        if not paragraph:
+            # Could be the title of an underlined heading: decided on the next line
+            pending = line
+            continue
+        paragraph.append(line)
+
+    if pending is not None:
+        paragraph.append(pending)
+    yield from flush()
+
+
+def _split_long(text: str, count_tokens: Callable[[str], int], max_tokens: int) -> list[str]:
+    """Split text that is too long for one chunk into sentences, and
+    sentences that are still too long into word windows."""
+    pieces = []
+    for line in text.split("\n"):
+        for sentence in _SENTENCE_END.split(line.strip()):
+            if not sentence:
+                continue
+            if count_tokens(sentence) <= max_tokens:
+                pieces.append(sentence)
+                continue
+            words, window = sentence.split(), []
+            for word in words:
+                if window and count_tokens(" ".join(window + [word])) > max_tokens:
+                    pieces.append(" ".join(window))
+                    window = []
+                window.append(word)
+            if window:
+                pieces.append(" ".join(window))
+    return pieces
+
+
+def chunk_lines(
+    lines: Iterable[str],
+    count_tokens: Callable[[str], int],
+    max_tokens: int,
+    overlap_tokens: int = 0,
+) -> Iterator[Chunk]:
+    """Chunk a document given as an iterable of lines (see module docstring)."""
+    section = None
+    units: list[tuple[str, int]] = []  # (text, tokens) of the chunk being built
+    size = 0
+    fresh = 0  # units not repeated from the previous chunk
+
+    def emit() -> Chunk:
+        return Chunk("\n".join(text for text, _ in units), section or "", size)
+
+    for paragraph_section, paragraph in iter_paragraphs(lines):
+        if paragraph_section != section:
+            if fresh:
+                yield emit()
+            section, units, size, fresh = paragraph_section, [], 0, 0
+
+        tokens = count_tokens(paragraph)
+        pieces = [(paragraph, tokens)] if tokens <= max_tokens else [
+            (piece, count_tokens(piece)) for piece in _split_long(paragraph, count_tokens, max_tokens)
+        ]
+        for text, tokens in pieces:
+            if units and size + tokens > max_tokens:
+                if fresh:
+                    yield emit()
+                # Carry the last sentences over, as long as they fit the overlap
+                carried: list[tuple[str, int]] = []
+                carried_size = 0
+                for unit in reversed(units):
+                    if carried_size + unit[1] > overlap_tokens or carried_size + unit[1] + tokens > max_tokens:
+                        break
+                    carried.insert(0, unit)
+                    carried_size += unit[1]
+                units, size, fresh = carried, carried_size, 0
+            units.append((text, tokens))
+            size += tokens
+            fresh += 1
+
+    if fresh:
+        yield emit()
+
+
+def chunk_file(
+    path: str | Path,
+    count_tokens: Callable[[str], int],
+    max_tokens: int,
+    overlap_tokens: int = 0,
+) -> Iterator[Chunk]:
+    """Chunk a UTF-8 text file, streaming it line by line."""
+    with open(path, "r", encoding="utf-8") as f:
+        yield from chunk_lines(f, count_tokens, max_tokens, overlap_tokens)
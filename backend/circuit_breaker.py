@@ -0,0 +1,60 @@
+"""Circuit breaker for calls to an unreliable backend (Ollama).
+
+closed    -> calls go through; `failure_threshold` consecutive failures open it
+open      -> calls are refused instantly until `reset_timeout` has passed
+half_open -> one trial call (or background probe) is let through; success
+             closes the circuit, failure opens it again. A trial that ends
+             without either (a 4xx, a cancelled request) is released so the
+             next call can try; one that never reports back is given up on
+             after another `reset_timeout`.
+"""
+
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, reset_timeout: float, clock=time.monotonic) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._trial_started = 0.0
+
+    def allow(self) -> bool:
+        """Whether a call may be attempted now."""
+        if self.state == CLOSED:
+            return True
+        now = self._clock()
+        if self.state == OPEN and now - self.opened_at >= self.reset_timeout:
+            self.state = HALF_OPEN
+            self._trial_in_flight = False
+        if self.state == HALF_OPEN and (
+            not self._trial_in_flight or now - self._trial_started >= self.reset_timeout
+        ):
+            self._trial_in_flight = True
+            self._trial_started = now
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.state = CLOSED
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def release_trial(self) -> None:
+        """End a half-open trial that neither succeeded nor failed."""
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = OPEN
+            self.opened_at = self._clock()
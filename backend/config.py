@@ -8,9 +8,127 @@ BASE_DIR = Path(__file__).resolve().parent
 class Settings(BaseSettings):
     ollama_base_url: str = "http://localhost:11434"
     ollama_model: str = "phi3:mini"
+    ollama_keep_alive: str = "30m"
+    # Comma-separated Ollama URLs to load-balance across; empty = ollama_base_url.
+    # Per-brand models go in BRAND_CONFIGS "model".
+    ollama_endpoints: str = ""
+    # Circuit breaker (per endpoint): stop calling an Ollama instance after
+    # repeated failures and probe it in the background until it recovers
+    ollama_failure_threshold: int = 3
+    ollama_reset_timeout: float = 15.0  # seconds before a half-open retry
+    ollama_probe_interval: float = 10.0  # background health check period
+
+    # Lead capture: queued in memory, written to SQLite in batches, then
+    # forwarded to the CRM webhook in the background with retries
+    leads_db_path: str = str(BASE_DIR / "leads.db")
+    lead_queue_size: int = 10000
+    lead_batch_size: int = 100
+    lead_flush_interval: float = 0.5  # max seconds a lead waits in the queue
+    crm_webhook_url: str = ""  # empty = keep leads locally only
+    lead_forward_interval: float = 5.0
+    lead_max_attempts: int = 8
+    lead_retry_base: float = 10.0  # seconds, doubled after every failed attempt
+
+    # WhatsApp Business (Cloud API)
+    whatsapp_verify_token: str = "tickets99_whatsapp_verify"
+    whatsapp_access_token: str = ""  # empty = log replies instead of sending
+    whatsapp_api_url: str = "https://graph.facebook.com/v21.0"
+    whatsapp_default_brand: str = "ticket99"  # for numbers not in BRAND_CONFIGS
+    whatsapp_workers: int = 4  # concurrent WhatsApp generations
+    whatsapp_batch_window: float = 2.0  # seconds to collect a sender's consecutive messages
+    whatsapp_min_reply_interval: float = 1.0  # min seconds between messages to one number
+    whatsapp_send_retries: int = 3
+
+    # Prompt size. The whole prompt (system prompt with RAG context, summary,
+    # history and the message) is kept under this many estimated tokens,
+    # leaving room for the answer in Ollama's default 2048-token context.
+    prompt_token_budget: int = 1536
+    history_max_messages: int = 6
+    # Fold turns that fall out of the history window into a running summary,
+    # generated by the LLM in the background after a reply
+    history_summary_enabled: bool = False
+    history_summary_min_messages: int = 4  # summarize once this many have fallen out
+
+    # LLM admission control: concurrent generations, wait queue, load shedding
+    llm_max_inflight: int = 2  # per endpoint
+    llm_max_queue: int = 16
+    llm_queue_timeout: float = 30.0  # max seconds a request waits for a slot
+    llm_wait_budget: float = 20.0  # shed load when the predicted wait is longer
     app_port: int = 8000
+    # Uvicorn worker processes. With more than 1, the index is built once
+    # before the workers start and opened read-only by each of them.
+    workers: int = 1
     chroma_db_path: str = str(BASE_DIR / "chroma_db")
 
+    # Vector index backend: "chroma" or "numpy" (in-process, memory-mapped)
+    vector_backend: str = "chroma"
+    numpy_index_path: str = str(BASE_DIR / "numpy_index")
+    # Open the index without syncing it (built by a separate build step)
+    index_read_only: bool = False
+
+    # Session store: "memory" (single worker), "sqlite" or "redis" (shared)
+    session_store: str = "memory"
+    session_db_path: str = str(BASE_DIR / "sessions.db")
+    redis_url: str = "redis://localhost:6379/0"
+    # Messages kept per session, oldest dropped first (all stores), and the
+    # memory store's approximate total size (least recently active evicted)
+    session_max_messages: int = 50
+    session_memory_mb: float = 64
+    session_sweep_interval: float = 60.0  # seconds between expiry sweeps
+    # Write-behind journal for the memory store, replayed on startup so
+    # active conversations survive a restart
+    session_journal_enabled: bool = False
+    session_journal_path: str = str(BASE_DIR / "session_journal")
+    session_journal_flush_interval: float = 1.0  # seconds; one fsync per batch
+    session_journal_compact_interval: float = 300.0  # seconds between snapshots
+
+    # Document chunking (knowledge/<brand>_docs/*.txt): chunks follow
+    # headings, paragraphs and sentences and are sized in embedding tokens
+    chunk_max_tokens: int = 200  # capped to fit all-MiniLM-L6-v2's 256-token window
+    chunk_overlap_tokens: int = 32  # trailing sentences repeated in the next chunk
+
+    # Retrieval: "dense" (embeddings only) or "hybrid" (embeddings + BM25
+    # keyword search, fused by reciprocal rank)
+    retrieval_mode: str = "hybrid"
+    retrieval_candidates: int = 10  # results taken from each retriever before fusing
+    rrf_k: int = 60
+    # Chunks farther than this (cosine distance) are dropped, unless they
+    # are keyword hits containing bm25_min_coverage of the query's terms
+    # (idf-weighted). `python vector_store.py --calibrate` suggests a value.
+    retrieval_max_distance: float = 0.75
+    bm25_min_coverage: float = 0.6
+
+    # Query embeddings memoized by normalized text (LRU)
+    embedding_cache_size: int = 1024
+    # Concurrent query embeddings are micro-batched into one encode() call
+    embed_batch_window_ms: float = 5.0  # 0 disables batching
+    embed_batch_max_size: int = 32
+
+    # Intent classification: "keyword", "hybrid" (keywords, then intent
+    # centroids when no keyword matches) or "semantic" (centroids first)
+    intent_mode: str = "keyword"
+    semantic_intent_threshold: float = 0.6  # min cosine similarity to a centroid
+
+    # Language detection: non-Latin scripts are recognized by script alone;
+    # shorter messages reuse the session's language instead of guessing
+    language_min_chars: int = 20
+    language_min_confidence: float = 0.9  # langdetect probability to trust
+    language_cache_size: int = 10000  # sessions whose language is remembered
+
+    # Fast path: answer canned intents (see BRAND_CONFIGS "canned_intents")
+    # from templates, skipping embedding, retrieval and the LLM. Only for
+    # short messages whose every matched intent is canned.
+    fast_path_enabled: bool = True
+    fast_path_max_words: int = 6
+
+    # Semantic answer cache (reuses LLM answers for near-identical questions)
+    semantic_cache_enabled: bool = True
+    semantic_cache_threshold: float = 0.92  # cosine similarity needed for a hit
+    semantic_cache_ttl: int = 60 * 60  # seconds
+    semantic_cache_max_entries: int = 256  # per brand, LRU evicted
+    # Concurrent identical first-turn questions share one retrieval + generation
+    coalesce_requests: bool = True
+
     model_config = {"env_file": str(BASE_DIR / ".env"), "extra": "ignore"}
 
 
@@ -29,6 +147,13 @@ BRAND_CONFIGS = {
         "website": "https://www.tickets99.com",
         "primary_color": "#f97316",
         "secondary_color": "#ef4444",
+        # Intents answered straight from templates (no retrieval, no LLM),
+        # with the minimum classifier confidence required
+        "canned_intents": {"greeting": 0.9, "farewell": 0.9, "gratitude": 0.9},
+        # Ollama model for this brand (None = settings.ollama_model)
+        "model": None,
+        # WhatsApp Cloud API phone number id that belongs to this brand
+        "whatsapp_phone_number_id": "",
     },
     "eventitans": {
         "name": "Eventitans",
@@ -42,11 +167,16 @@ BRAND_CONFIGS = {
         "website": "https://www.eventitans.com",
         "primary_color": "#6366f1",
         "secondary_color": "#8b5cf6",
+        "canned_intents": {"greeting": 0.9, "farewell": 0.9, "gratitude": 0.9},
+        "model": None,
+        "whatsapp_phone_number_id": "",
     },
 }
 
 # Intent definitions - migrated from knowledge_base.py keyword lists
 # Priority order matters: earlier intents are checked first
+# "examples" are paraphrases used (with the keywords) to build the intent
+# centroids for semantic intent classification
 INTENT_DEFINITIONS = {
     "greeting": {
         "keywords": [
@@ -54,6 +184,11 @@ INTENT_DEFINITIONS = {
             "good morning", "good afternoon", "good evening",
             "greetings", "sup", "yo", "heya", "hola", "hy",
         ],
+        "examples": [
+            "hello there, anyone here?",
+            "hey, good to see you",
+            "hi bot",
+        ],
         "priority": 1,
     },
     "farewell": {
@@ -62,6 +197,11 @@ INTENT_DEFINITIONS = {
             "gtg", "gotta go", "take care", "good night", "goodnight",
             "bye bye", "byebye",
         ],
+        "examples": [
+            "ok I'm leaving now",
+            "that's all, talk to you later",
+            "bye for now",
+        ],
         "priority": 2,
     },
     "gratitude": {
@@ -69,14 +209,29 @@ INTENT_DEFINITIONS = {
             "thanks", "thank you", "thank u", "thankyou", "thx", "ty",
             "tysm", "appreciate", "thanks a lot", "thanks so much",
         ],
+        "examples": [
+            "that was really helpful",
+            "great, thanks for the help",
+            "awesome, much appreciated",
+        ],
         "priority": 3,
     },
     "refund": {
         "keywords": ["refund", "money back", "refund policy"],
+        "examples": [
+            "can I get my money returned",
+            "I want my payment reversed",
+            "how do I get reimbursed for my ticket",
+        ],
         "priority": 4,
     },
     "cancel": {
         "keywords": ["cancel", "cancellation"],
+        "examples": [
+            "I can't attend, how do I cancel my booking",
+            "the event was called off, what now",
+            "can I cancel my order",
+        ],
         "priority": 5,
     },
     "pricing": {
@@ -85,6 +240,11 @@ INTENT_DEFINITIONS = {
             "charge", "charges", "how much", "expensive", "cheap",
             "free", "money", "subscription", "plans", "rate", "rates",
         ],
+        "examples": [
+            "how much do you charge organizers",
+            "what does it cost to sell tickets",
+            "is there a monthly fee",
+        ],
         "priority": 6,
     },
     "organizer": {
@@ -94,6 +254,11 @@ INTENT_DEFINITIONS = {
             "list event", "manage event", "event management",
             "event platform", "how to create",
         ],
+        "examples": [
+            "I want to host a concert",
+            "how can I sell tickets for my workshop",
+            "I'm planning a conference and need a ticketing platform",
+        ],
         "priority": 7,
     },
     "attendee": {
@@ -103,6 +268,11 @@ INTENT_DEFINITIONS = {
             "browse event", "looking for event", "want to attend",
             "find tickets", "get tickets", "show me events",
         ],
+        "examples": [
+            "what shows are happening this weekend",
+            "I want to go to a concert",
+            "where can I book tickets for a comedy show",
+        ],
         "priority": 8,
     },
     "partnership": {
@@ -111,6 +281,11 @@ INTENT_DEFINITIONS = {
             "collaborate", "collaboration", "b2b", "bulk",
             "reseller", "venue partnership", "corporate solutions",
         ],
+        "examples": [
+            "can our company work with you",
+            "we want to sponsor an event",
+            "I run a venue and want to tie up with you",
+        ],
         "priority": 9,
     },
     "support": {
@@ -119,6 +294,11 @@ INTENT_DEFINITIONS = {
             "not working", "bug", "error", "something went wrong",
             "broken", "doesnt work", "cant access",
         ],
+        "examples": [
+            "my ticket is not showing up",
+            "I was charged but didn't get a ticket",
+            "the app keeps crashing",
+        ],
         "priority": 10,
     },
     "contact": {
@@ -126,6 +306,11 @@ INTENT_DEFINITIONS = {
             "contact", "reach", "call", "phone", "email",
             "whatsapp", "address", "office",
         ],
+        "examples": [
+            "how can I talk to someone",
+            "what is your customer care number",
+            "where is your office located",
+        ],
         "priority": 11,
     },
     "features": {
@@ -133,6 +318,11 @@ INTENT_DEFINITIONS = {
             "feature", "features", "what do you offer",
             "services", "functionality", "capabilities",
         ],
+        "examples": [
+            "what can your platform do",
+            "what tools do you provide",
+            "what do I get with your platform",
+        ],
         "priority": 12,
     },
     "about": {
@@ -141,6 +331,11 @@ INTENT_DEFINITIONS = {
             "what does tickets99 do", "about your company", "about your platform",
             "what is eventitans", "about eventitans", "tell me about eventitans",
         ],
+        "examples": [
+            "who are you",
+            "what is this company",
+            "tell me about your business",
+        ],
         "priority": 13,
     },
     "payment": {
@@ -149,6 +344,11 @@ INTENT_DEFINITIONS = {
             "stripe", "gpay", "paytm", "payment method",
             "how to pay", "payment options",
         ],
+        "examples": [
+            "can I pay with google pay",
+            "which payment methods do you accept",
+            "do you take credit cards",
+        ],
         "priority": 14,
     },
     "checkin": {
@@ -156,6 +356,11 @@ INTENT_DEFINITIONS = {
             "check-in", "checkin", "qr code", "qr",
             "scan", "entry", "barcode",
         ],
+        "examples": [
+            "how do attendees enter the venue",
+            "how does ticket scanning work at the gate",
+            "how do I verify tickets at the door",
+        ],
         "priority": 15,
     },
     "analytics": {
@@ -163,6 +368,11 @@ INTENT_DEFINITIONS = {
             "analytics", "dashboard", "reports",
             "insights", "statistics",
         ],
+        "examples": [
+            "can I see how many tickets I sold",
+            "do you have sales reports",
+            "how do I track my event performance",
+        ],
         "priority": 16,
     },
     "security": {
@@ -170,6 +380,11 @@ INTENT_DEFINITIONS = {
             "secure", "security", "safe", "trust",
             "reliable", "encryption", "privacy", "data protection",
         ],
+        "examples": [
+            "is my card information safe",
+            "do you store my personal data",
+            "is it safe to pay on your site",
+        ],
         "priority": 17,
     },
     "getting_started": {
@@ -178,6 +393,11 @@ INTENT_DEFINITIONS = {
             "create account", "onboard", "how do i begin",
             "how do i start", "getting started",
         ],
+        "examples": [
+            "how do I begin using your platform",
+            "what are the first steps to create an account",
+            "I'm new here, where do I start",
+        ],
         "priority": 18,
     },
     "cities": {
@@ -188,6 +408,11 @@ INTENT_DEFINITIONS = {
             "hyderabad", "delhi", "mumbai", "bangalore", "bengaluru",
             "jaipur", "chennai", "noida",
         ],
+        "examples": [
+            "do you have events in my city",
+            "are you available in Pune",
+            "which locations do you cover",
+        ],
         "priority": 19,
     },
     "discount": {
@@ -195,6 +420,11 @@ INTENT_DEFINITIONS = {
             "discount", "promo", "coupon", "offer",
             "early bird", "group discount", "promo code",
         ],
+        "examples": [
+            "do you have any deals",
+            "is there a coupon for students",
+            "can I get a cheaper ticket",
+        ],
         "priority": 20,
     },
 }
@@ -1,66 +1,203 @@
 import time
+import asyncio
+from collections.abc import Callable
 from typing import Any
 
-# In-memory session storage
-_sessions: dict[str, dict[str, Any]] = {}
+from config import settings
+from session_store import MemorySessionStore, SqliteSessionStore, RedisSessionStore
+from session_journal import SessionJournal
 
 # Session expiry: 30 minutes
 SESSION_TTL = 30 * 60
 
+_store: MemorySessionStore | SqliteSessionStore | RedisSessionStore | None = None
+
+
+def _get_store() -> MemorySessionStore | SqliteSessionStore | RedisSessionStore:
+    """Return the configured session store (settings.session_store)."""
+    global _store
+    if _store is None:
+        if settings.session_store == "memory":
+            _store = MemorySessionStore(
+                max_messages=settings.session_max_messages,
+                max_bytes=int(settings.session_memory_mb * 1024 * 1024),
+            )
+        elif settings.session_store == "sqlite":
+            _store = SqliteSessionStore(settings.session_db_path, max_messages=settings.session_max_messages)
+        elif settings.session_store == "redis":
+            _store = RedisSessionStore(settings.redis_url, ttl=SESSION_TTL, max_messages=settings.session_max_messages)
+        else:
+            raise ValueError(f"Unknown session_store: {settings.session_store}")
+    return _store
+
+
+# Write-behind journal of the memory store (settings.session_journal_enabled)
+_journal: SessionJournal | None = None
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough LLM token count. BPE vocabularies average about 4 bytes of UTF-8
+    per token, for English as well as for Indic scripts (3 bytes a char)."""
+    return len(text.encode("utf-8")) // 4 + 1
+
+
+def _message_tokens(message: dict[str, Any]) -> int:
+    # Messages stored before token counts were added have none
+    return message.get("tokens") or estimate_tokens(message["content"])
+
+
+async def run_session_io(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Call a session function from async code: in a worker thread for the
+    SQLite and Redis stores (blocking I/O), directly for the memory store
+    (not thread-safe, and nothing to wait for)."""
+    if isinstance(_get_store(), MemorySessionStore):
+        return fn(*args, **kwargs)
+    return await asyncio.to_thread(fn, *args, **kwargs)
+
 
 def get_or_create_session(session_id: str) -> dict[str, Any]:
     """Get existing session or create a new one."""
-    now = time.time()
-    if session_id not in _sessions:
-        _sessions[session_id] = {
-            "messages": [],
-            "created_at": now,
-            "last_active": now,
-        }
-    else:
-        _sessions[session_id]["last_active"] = now
-    return _sessions[session_id]
+    return _get_store().get_or_create(session_id)
+
+
+def touch_session(session_id: str) -> None:
+    """Create a session or mark it active, without reading its messages."""
+    _get_store().touch(session_id)
 
 
 def add_message(session_id: str, role: str, content: str) -> None:
     """Add a message to the session history."""
-    session = get_or_create_session(session_id)
-    session["messages"].append({
+    message = {
         "role": role,
         "content": content,
         "timestamp": time.time(),
-    })
+        "tokens": estimate_tokens(content),
+    }
+    _get_store().append(session_id, message)
+    if _journal:
+        _journal.record_append(session_id, message)
+
+
+def get_recent_history(
+    session_id: str,
+    max_messages: int = 6,
+    token_budget: int | None = None,
+) -> list[dict[str, str]]:
+    """Return last N messages as [{role, content}] for prompt assembly.
+
+    Messages already folded into the session summary are left out. With a
+    token_budget, the oldest messages are dropped until the rest fit.
+    """
+    store = _get_store()
+    messages = store.recent(session_id, max_messages)
+    summary = store.get_summary(session_id)
+    if summary:
+        messages = [m for m in messages if m["timestamp"] > summary[1]]
 
+    if token_budget is not None:
+        kept, used = [], 0
+        for m in reversed(messages):
+            used += _message_tokens(m)
+            if used > token_budget:
+                break
+            kept.append(m)
+        messages = kept[::-1]
 
-def get_recent_history(session_id: str, max_messages: int = 6) -> list[dict[str, str]]:
-    """Return last N messages as [{role, content}] for prompt assembly."""
-    session = _sessions.get(session_id)
-    if not session:
-        return []
-    messages = session["messages"][-max_messages:]
     return [{"role": m["role"], "content": m["content"]} for m in messages]
 
 
+def get_summary(session_id: str) -> str | None:
+    """Running summary of the turns no longer sent verbatim, if any."""
+    summary = _get_store().get_summary(session_id)
+    return summary[0] if summary else None
+
+
+def get_unsummarized_messages(session_id: str, limit: int = 64) -> list[dict[str, Any]]:
+    """Messages newer than the session summary (all, if there is none), oldest first."""
+    store = _get_store()
+    messages = store.recent(session_id, limit)
+    summary = store.get_summary(session_id)
+    if summary:
+        messages = [m for m in messages if m["timestamp"] > summary[1]]
+    return messages
+
+
+def set_summary(session_id: str, summary: str, until: float) -> None:
+    """Replace the session summary; it covers messages up to timestamp `until`."""
+    _get_store().set_summary(session_id, summary, until)
+    if _journal:
+        _journal.record_summary(session_id, summary, until)
+
+
 def get_message_count(session_id: str, role: str = "user") -> int:
     """Count messages of a specific role in the session."""
-    session = _sessions.get(session_id)
-    if not session:
-        return 0
-    return sum(1 for m in session["messages"] if m["role"] == role)
+    return _get_store().count(session_id, role)
 
 
 def clear_session(session_id: str) -> None:
     """Remove a specific session."""
-    _sessions.pop(session_id, None)
+    _get_store().delete(session_id)
+    if _journal:
+        _journal.record_delete(session_id)
 
 
 def cleanup_expired() -> int:
     """Remove sessions older than SESSION_TTL. Returns count of removed sessions."""
-    now = time.time()
-    expired = [
-        sid for sid, data in _sessions.items()
-        if now - data["last_active"] > SESSION_TTL
-    ]
-    for sid in expired:
-        del _sessions[sid]
-    return len(expired)
+    return _get_store().cleanup(SESSION_TTL)
+
+
+async def sweep_expired_sessions() -> None:
+    """Background task: run cleanup_expired every settings.session_sweep_interval."""
+    while True:
+        await asyncio.sleep(settings.session_sweep_interval)
+        try:
+            cleaned = cleanup_expired()
+        except Exception as e:
+            print(f"  [WARN] Session cleanup failed: {type(e).__name__}: {e}")
+            continue
+        if cleaned:
+            print(f"  [CLEANUP] Removed {cleaned} expired sessions")
+
+
+def open_session_journal() -> int | None:
+    """Enable the session journal and replay it into the memory store.
+    Returns the number of sessions restored, or None if the configured
+    store does not use a journal."""
+    global _journal
+    store = _get_store()
+    if not isinstance(store, MemorySessionStore):
+        print(f"  [WARN] Session journal only applies to the memory store, not '{settings.session_store}'")
+        return None
+
+    _journal = SessionJournal(settings.session_journal_path)
+    states = _journal.replay(SESSION_TTL, now=time.time())
+    for session_id, state in sorted(states.items(), key=lambda item: item[1]["last_active"]):
+        store.restore(session_id, state)
+    store.on_evict = _journal.record_delete
+    return len(states)
+
+
+async def run_session_journal() -> None:
+    """Background task: flush the journal every
+    settings.session_journal_flush_interval and compact it every
+    settings.session_journal_compact_interval (and once at start, folding
+    the replayed logs into a fresh snapshot)."""
+    store = _get_store()
+    loop = asyncio.get_running_loop()
+    next_compaction = loop.time()
+    while True:
+        try:
+            if loop.time() >= next_compaction:
+                await _journal.compact(store.export())
+                next_compaction = loop.time() + settings.session_journal_compact_interval
+            else:
+                await _journal.flush()
+        except OSError as e:
+            print(f"  [WARN] Session journal write failed: {e}")
+        await asyncio.sleep(settings.session_journal_flush_interval)
+
+
+def close_session_journal() -> None:
+    """Write out anything still queued (shutdown)."""
+    if _journal:
+        _journal.flush_sync()
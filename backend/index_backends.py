@@ -0,0 +1,258 @@
+"""Vector index backends used by vector_store.
+
+Both backends store, per collection, a set of (id, embedding, document,
+metadata) items and answer top-k cosine queries with results shaped as
+[(metadata, cosine_distance), ...], closest first. distances() gives the
+cosine distance of specific items (e.g. keyword hits the top-k missed).
+
+- ChromaIndex: ChromaDB persistent client (HNSW + SQLite).
+- NumpyIndex: brute-force search over a normalized float32 matrix held in
+  a memory-mapped .npy file, with ids/metadata in a JSON file beside it.
+  Files are replaced atomically, so any number of processes can read the
+  same index while it is rebuilt.
+"""
+
+import os
+import json
+import uuid
+from pathlib import Path
+
+import numpy as np
+import chromadb
+from chromadb.config import Settings as ChromaSettings
+
+
+def _cosine_distances(vectors: np.ndarray, embedding: list[float]) -> list[float]:
+    query = np.asarray(embedding, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1) * (np.linalg.norm(query) or 1.0)
+    similarities = (vectors @ query) / np.where(norms == 0, 1, norms)
+    return [float(d) for d in 1.0 - similarities]
+
+
+class ChromaIndex:
+    """Index backed by a ChromaDB persistent client."""
+
+    def __init__(self, path: str) -> None:
+        self.path = Path(path)
+        self._client = chromadb.PersistentClient(
+            path=str(self.path),
+            settings=ChromaSettings(anonymized_telemetry=False),
+        )
+
+    def _collection(self, name: str):
+        return self._client.get_or_create_collection(name=name, metadata={"hnsw:space": "cosine"})
+
+    def count(self, name: str) -> int:
+        try:
+            return self._client.get_collection(name).count()
+        except Exception:
+            return 0
+
+    def reset(self, name: str) -> None:
+        """Drop all items of a collection."""
+        try:
+            self._client.delete_collection(name)
+        except Exception:
+            pass
+        self._collection(name)
+
+    def upsert(self, name: str, ids: list[str], embeddings: list[list[float]], documents: list[str], metadatas: list[dict]) -> None:
+        self._collection(name).upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def delete(self, name: str, ids: list[str]) -> None:
+        self._collection(name).delete(ids=ids)
+
+    def commit(self, name: str) -> None:
+        """Chroma persists every write immediately."""
+
+    def query(self, name: str, embedding: list[float], top_k: int) -> list[tuple[dict, float]]:
+        try:
+            collection = self._client.get_collection(name)
+        except Exception:
+            return []
+
+        results = collection.query(
+            query_embeddings=[embedding],
+            n_results=top_k,
+            include=["metadatas", "distances"],
+        )
+        if not results or not results["metadatas"] or not results["distances"]:
+            return []
+        return list(zip(results["metadatas"][0], results["distances"][0]))
+
+    def distances(self, name: str, embedding: list[float], ids: list[str]) -> dict[str, float]:
+        try:
+            items = self._client.get_collection(name).get(ids=ids, include=["embeddings"])
+        except Exception:
+            return {}
+        if not items["ids"]:
+            return {}
+        return dict(zip(items["ids"], _cosine_distances(np.asarray(items["embeddings"], dtype=np.float32), embedding)))
+
+
+class NumpyIndex:
+    """In-process brute-force index persisted as a memory-mapped .npy matrix.
+
+    Layout per collection under `path`:
+      <name>.json          ids, documents, metadatas and the current matrix file
+      <name>.<version>.npy normalized float32 embeddings, one row per id
+
+    Writes are buffered in memory until commit(), which writes a new matrix
+    file and then atomically replaces the JSON that points to it; the
+    previous matrix is removed one commit later. Readers notice the new
+    JSON (by mtime) and remap.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = Path(path)
+        # name -> {"mtime", "ids", "documents", "metadatas", "matrix", "row"}
+        self._loaded: dict[str, dict] = {}
+        self._dirty: set[str] = set()
+
+    def _meta_path(self, name: str) -> Path:
+        return self.path / f"{name}.json"
+
+    def _load(self, name: str) -> dict:
+        """Return the in-memory view of a collection, reloading it if another
+        process committed a newer version."""
+        meta_path = self._meta_path(name)
+        cached = self._loaded.get(name)
+        if name in self._dirty:
+            return cached
+
+        for attempt in range(3):
+            try:
+                mtime = meta_path.stat().st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+            if cached is not None and cached["mtime"] == mtime:
+                return cached
+
+            data = {"mtime": mtime, "ids": [], "documents": [], "metadatas": [], "matrix": None}
+            if mtime is None:
+                break
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            data.update(ids=meta["ids"], documents=meta["documents"], metadatas=meta["metadatas"])
+            if not meta["ids"]:
+                break
+            try:
+                data["matrix"] = np.load(self.path / meta["matrix_file"], mmap_mode="r")
+                break
+            except FileNotFoundError:
+                # Two commits landed since we read the JSON: read it again
+                if attempt == 2:
+                    raise
+        data["row"] = {item_id: i for i, item_id in enumerate(data["ids"])}
+        self._loaded[name] = data
+        return data
+
+    def count(self, name: str) -> int:
+        return len(self._load(name)["ids"])
+
+    def reset(self, name: str) -> None:
+        self._loaded[name] = {"mtime": None, "ids": [], "documents": [], "metadatas": [], "matrix": None, "row": {}}
+        self._dirty.add(name)
+
+    def upsert(self, name: str, ids: list[str], embeddings: list[list[float]], documents: list[str], metadatas: list[dict]) -> None:
+        data = self._load(name)
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+
+        matrix = np.array(data["matrix"]) if data["matrix"] is not None else np.empty((0, vectors.shape[1]), dtype=np.float32)
+        new_rows = []
+        for item_id, vector, document, metadata in zip(ids, vectors, documents, metadatas):
+            row = data["row"].get(item_id)
+            if row is None:
+                data["row"][item_id] = len(data["ids"])
+                data["ids"].append(item_id)
+                data["documents"].append(document)
+                data["metadatas"].append(metadata)
+                new_rows.append(vector)
+            else:
+                if row >= len(matrix):
+                    new_rows[row - len(matrix)] = vector
+                else:
+                    matrix[row] = vector
+                data["documents"][row] = document
+                data["metadatas"][row] = metadata
+        if new_rows:
+            matrix = np.vstack([matrix, np.stack(new_rows)])
+
+        data["matrix"] = matrix
+        self._dirty.add(name)
+
+    def delete(self, name: str, ids: list[str]) -> None:
+        data = self._load(name)
+        drop = {data["row"][item_id] for item_id in ids if item_id in data["row"]}
+        if not drop:
+            return
+        keep = [i for i in range(len(data["ids"])) if i not in drop]
+        data["ids"] = [data["ids"][i] for i in keep]
+        data["documents"] = [data["documents"][i] for i in keep]
+        data["metadatas"] = [data["metadatas"][i] for i in keep]
+        data["matrix"] = np.array(data["matrix"])[keep] if keep else None
+        data["row"] = {item_id: i for i, item_id in enumerate(data["ids"])}
+        self._dirty.add(name)
+
+    def commit(self, name: str) -> None:
+        """Persist buffered writes for a collection."""
+        if name not in self._dirty:
+            return
+        data = self._loaded[name]
+        self.path.mkdir(parents=True, exist_ok=True)
+        meta_path = self._meta_path(name)
+
+        # Readers that have just read the current JSON may still open its
+        # matrix, so it is kept until the next commit
+        previous = None
+        if meta_path.exists():
+            previous = json.loads(meta_path.read_text(encoding="utf-8")).get("matrix_file")
+        matrix_file = f"{name}.{uuid.uuid4().hex[:12]}.npy"
+        if data["matrix"] is not None:
+            np.save(self.path / matrix_file, np.ascontiguousarray(data["matrix"], dtype=np.float32))
+
+        tmp = meta_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({
+            "matrix_file": matrix_file,
+            "ids": data["ids"],
+            "documents": data["documents"],
+            "metadatas": data["metadatas"],
+        }, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, meta_path)
+
+        for old_file in self.path.glob(f"{name}.*.npy"):
+            if old_file.name not in (matrix_file, previous):
+                try:
+                    old_file.unlink()
+                except OSError:
+                    # Still mapped by a reader (Windows); retried next commit
+                    pass
+
+        self._dirty.discard(name)
+        self._loaded.pop(name, None)
+
+    def query(self, name: str, embedding: list[float], top_k: int) -> list[tuple[dict, float]]:
+        data = self._load(name)
+        if data["matrix"] is None or top_k <= 0:
+            return []
+
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        scores = data["matrix"] @ query
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        # Cosine distance, same scale as Chroma's "cosine" space
+        return [(dict(data["metadatas"][i]), float(1.0 - scores[i])) for i in top]
+
+    def distances(self, name: str, embedding: list[float], ids: list[str]) -> dict[str, float]:
+        data = self._load(name)
+        rows = [data["row"][item_id] for item_id in ids if item_id in data["row"]]
+        if data["matrix"] is None or not rows:
+            return {}
+        found = [data["ids"][row] for row in rows]
+        return dict(zip(found, _cosine_distances(np.asarray(data["matrix"][rows]), embedding)))
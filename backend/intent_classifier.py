@@ -1,5 +1,9 @@
 import re
-from config import INTENT_DEFINITIONS
+from collections.abc import Callable
+
+import numpy as np
+
+from config import settings, INTENT_DEFINITIONS
 
 
 def _has_keyword(text: str, words: set, keywords: list[str]) -> bool:
@@ -16,29 +20,165 @@ def _has_keyword(text: str, words: set, keywords: list[str]) -> bool:
     return False
 
 
+def _keyword_pattern(kw: str) -> str:
+    """Same matching rules as _has_keyword: word boundaries for single words,
+    plain substring for multi-word phrases."""
+    if " " in kw:
+        return re.escape(kw)
+    return r"\b" + re.escape(kw) + r"\b"
+
+
+def _keyword_units(kw: str) -> list[str]:
+    """Split a keyword into regex units (escaped characters and a trailing
+    word boundary for single words). The leading boundary is checked by
+    the caller, so that all keywords starting with the same characters
+    share one trie branch."""
+    units = [re.escape(ch) for ch in kw]
+    if " " not in kw:
+        units.append(r"\b")
+    return units
+
+
+def _trie_regex(keywords: list[str]) -> str:
+    """Combine keywords into one regex whose alternations follow a prefix trie,
+    so a failing position is rejected after one or two characters instead of
+    trying every keyword. Longer continuations are tried before shorter
+    ones, so the longest keyword at a position wins."""
+    trie: dict = {}
+    for kw in keywords:
+        node = trie
+        for unit in _keyword_units(kw):
+            node = node.setdefault(unit, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        branches = [unit + build(child) for unit, child in node.items() if unit]
+        if not branches:
+            return ""
+        optional = "" in node
+        if len(branches) == 1 and not optional:
+            return branches[0]
+        return "(?:" + "|".join(branches) + ")" + ("?" if optional else "")
+
+    return build(trie)
+
+
+def _compile(definitions: dict) -> tuple[re.Pattern, dict, dict, dict]:
+    """Build the single-pass matcher for all intent keywords.
+
+    The pattern is one trie-shaped alternation inside a lookahead, so
+    finditer() reports a match at every position where some keyword starts
+    (matches may overlap). At each position the longest keyword wins
+    (single words still need a word boundary before them, checked in
+    classify_all); shorter keywords of *other* intents that start the same way (e.g.
+    "money" inside "money back") are checked separately through the prefix
+    table.
+
+    Returns (pattern, keyword -> intent, keyword -> [(prefix regex, intent)],
+    intent -> (priority, confidence)).
+    """
+    keyword_intent = {}
+    for intent_name, intent_config in definitions.items():
+        for kw in intent_config["keywords"]:
+            keyword_intent.setdefault(kw, intent_name)
+
+    keywords = sorted(keyword_intent, key=len, reverse=True)
+    pattern = re.compile("(?=(" + _trie_regex(keywords) + "))")
+
+    prefixes = {}
+    for kw in keywords:
+        prefixes[kw] = [
+            (re.compile(_keyword_pattern(other)), keyword_intent[other])
+            for other in keywords
+            if other != kw and kw.startswith(other) and keyword_intent[other] != keyword_intent[kw]
+        ]
+
+    ranking = {
+        intent_name: (
+            intent_config["priority"],
+            # Higher priority intents get higher confidence
+            max(0.5, 1.0 - (intent_config["priority"] - 1) * 0.02),
+        )
+        for intent_name, intent_config in definitions.items()
+    }
+    return pattern, keyword_intent, prefixes, ranking
+
+
+# Compiled once at import
+_PATTERN, _KEYWORD_INTENT, _PREFIXES, _RANKING = _compile(INTENT_DEFINITIONS)
+_WORD_CHAR = re.compile(r"\w")
+
+
+def classify_all(message: str) -> list[tuple[str, float]]:
+    """Return every intent whose keywords appear in the message as
+    [(intent_name, confidence), ...], highest priority first."""
+    lower = message.lower().strip()
+
+    matched = set()
+    for match in _PATTERN.finditer(lower):
+        kw, start = match.group(1), match.start()
+        if " " not in kw and start and _WORD_CHAR.match(lower, start - 1):
+            # Single word inside a longer word. Any shorter keyword at this
+            # position would be a single word too, so nothing matches here.
+            continue
+        matched.add(_KEYWORD_INTENT[kw])
+        for prefix_pattern, intent_name in _PREFIXES[kw]:
+            if prefix_pattern.match(lower, start):
+                matched.add(intent_name)
+
+    ranked = sorted(matched, key=lambda name: _RANKING[name][0])
+    return [(name, _RANKING[name][1]) for name in ranked]
+
+
 def classify_intent(message: str) -> tuple[str | None, float]:
     """Classify user message intent using keyword matching.
 
     Returns (intent_name, confidence) or (None, 0.0) if no match.
     Priority ordering ensures greeting > refund > pricing > organizer > support > general.
     """
-    lower = message.lower().strip()
-    clean = re.sub(r"[^\w\s]", "", lower).strip()
-    words = set(clean.split())
+    matches = classify_all(message)
+    if matches:
+        return matches[0]
+    return None, 0.0
 
-    # Sort intents by priority
-    sorted_intents = sorted(
-        INTENT_DEFINITIONS.items(), key=lambda x: x[1]["priority"]
-    )
 
-    for intent_name, intent_config in sorted_intents:
-        keywords = intent_config["keywords"]
-        if _has_keyword(lower, words, keywords):
-            # Higher priority intents get higher confidence
-            confidence = max(0.5, 1.0 - (intent_config["priority"] - 1) * 0.02)
-            return intent_name, confidence
+# Semantic intent centroids: (intent names, normalized centroid matrix)
+_centroids: tuple[list[str], np.ndarray] | None = None
 
-    return None, 0.0
+
+def _normalize_rows(vectors) -> np.ndarray:
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def build_intent_centroids(encode: Callable[[list[str]], list[list[float]]]) -> None:
+    """Precompute one centroid embedding per intent from its keywords and
+    example utterances. `encode` maps a list of texts to embeddings (the
+    same model used for query embeddings)."""
+    global _centroids
+    names, rows = [], []
+    for intent_name, intent_config in INTENT_DEFINITIONS.items():
+        texts = intent_config["keywords"] + intent_config.get("examples", [])
+        centroid = _normalize_rows(encode(texts)).mean(axis=0)
+        names.append(intent_name)
+        rows.append(centroid)
+    _centroids = (names, _normalize_rows(rows))
+
+
+def classify_intent_semantic(embedding: list[float]) -> tuple[str | None, float]:
+    """Classify by cosine similarity between a query embedding and the intent
+    centroids. Returns (intent_name, similarity), or (None, 0.0) if the
+    centroids are not built or no intent reaches
+    settings.semantic_intent_threshold."""
+    if _centroids is None:
+        return None, 0.0
+    names, matrix = _centroids
+    sims = matrix @ _normalize_rows(embedding)[0]
+    best = int(np.argmax(sims))
+    if sims[best] < settings.semantic_intent_threshold:
+        return None, 0.0
+    return names[best], float(sims[best])
 
 
 if __name__ == "__main__":
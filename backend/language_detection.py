@@ -0,0 +1,179 @@
+"""Language detection for user messages.
+
+Cheapest first:
+1. Script: messages written mostly in a non-Latin script (Devanagari,
+   Tamil, Telugu, Arabic, ...) map straight to a language.
+2. Short Latin messages ("hi", "price?") are too short to tell; they keep
+   the session's language (English for a new session).
+3. Latin messages that are at least half common English words are
+   English, and so is romanized Hindi ("mujhe tickets chahiye"), which
+   langdetect misreads as Dutch, Indonesian, etc.
+4. Anything else goes to langdetect (seeded, so results are repeatable).
+   Below settings.language_min_confidence its guess is only used when
+   nothing better is known: the script's language for Arabic/Cyrillic,
+   the session's language for an ongoing conversation.
+
+The language found for a session is remembered (LRU over
+settings.language_cache_size sessions) and reused for short and
+ambiguous messages.
+"""
+
+import re
+from bisect import bisect_right
+from collections import OrderedDict
+
+from config import settings
+import metrics
+
+# Try langdetect, fall back gracefully
+try:
+    from langdetect import DetectorFactory, detect_langs as _detect_langs
+
+    DetectorFactory.seed = 0
+except ImportError:
+    _detect_langs = None
+
+DEFAULT_LANGUAGE = "en"
+LATIN = "latin"
+
+# (first code point, last code point, language) of scripts that identify a
+# language well enough; codes as returned by langdetect
+_SCRIPTS = sorted([
+    (0x0370, 0x03FF, "el"),     # Greek
+    (0x0400, 0x04FF, "ru"),     # Cyrillic
+    (0x0590, 0x05FF, "he"),     # Hebrew
+    (0x0600, 0x06FF, "ar"),     # Arabic (Urdu and Persian are told apart by langdetect)
+    (0x0900, 0x097F, "hi"),     # Devanagari
+    (0x0980, 0x09FF, "bn"),     # Bengali
+    (0x0A00, 0x0A7F, "pa"),     # Gurmukhi
+    (0x0A80, 0x0AFF, "gu"),     # Gujarati
+    (0x0B00, 0x0B7F, "or"),     # Oriya
+    (0x0B80, 0x0BFF, "ta"),     # Tamil
+    (0x0C00, 0x0C7F, "te"),     # Telugu
+    (0x0C80, 0x0CFF, "kn"),     # Kannada
+    (0x0D00, 0x0D7F, "ml"),     # Malayalam
+    (0x0E00, 0x0E7F, "th"),     # Thai
+    (0x3040, 0x30FF, "ja"),     # Hiragana, Katakana
+    (0x4E00, 0x9FFF, "zh-cn"),  # CJK ideographs
+    (0xAC00, 0xD7AF, "ko"),     # Hangul
+])
+_SCRIPT_STARTS = [start for start, _, _ in _SCRIPTS]
+# Scripts shared by several languages: detected by script, refined by langdetect
+_AMBIGUOUS_SCRIPTS = {"ar", "ru"}
+
+# Frequent English words that are not also words in Spanish, Portuguese,
+# French, German, Italian or Dutch ("a", "no", "me", "in", "die", "will", ...);
+# when they make up half of a Latin message's words, it is English
+_ENGLISH_WORDS = frozenset("""
+    the are were been does did have had you she it we they my your our their
+    this that these those what which who how when where why can could would
+    should shall may might must not yes to of at for with from about by and if
+    any some much many there here please want need get buy price cost
+""".split())
+# Frequent romanized Hindi words, not found in European languages either
+_HINGLISH_WORDS = frozenset("""
+    hai hain kya kaise kaisa kab kahan kyun mujhe mera meri mere aap aapka
+    hum tum nahi nahin haan bhi aur chahiye karna karne karo sakte sakta
+    sakti hoga raha rahi batao bataye kitna kitne wala wali milega milenge
+""".split())
+_WORD = re.compile(r"[^\W\d_]+")
+
+# session id -> language, least recently used first
+_session_languages: OrderedDict[str, str] = OrderedDict()
+
+
+def _char_language(ch: str) -> str | None:
+    code = ord(ch)
+    if code < 0x0250:
+        return LATIN
+    i = bisect_right(_SCRIPT_STARTS, code) - 1
+    if i >= 0 and code <= _SCRIPTS[i][1]:
+        return _SCRIPTS[i][2]
+    return None
+
+
+def script_language(text: str) -> str | None:
+    """Language of the dominant script among the letters of `text`: LATIN,
+    a language code, or None if there are no letters."""
+    if text.isascii():
+        return LATIN if any(ch.isalpha() for ch in text) else None
+    counts: dict[str, int] = {}
+    for ch in text:
+        if ch.isalpha():
+            language = _char_language(ch)
+            if language:
+                counts[language] = counts.get(language, 0) + 1
+    if not counts:
+        return None
+    # Ties go to the non-Latin script ("मुझे tickets chahiye")
+    return max(counts, key=lambda language: (counts[language], language != LATIN))
+
+
+def _looks_english(words: list[str]) -> bool:
+    """English, or romanized Hindi (answered in English as well)."""
+    english = sum(1 for word in words if word in _ENGLISH_WORDS)
+    hinglish = sum(1 for word in words if word in _HINGLISH_WORDS)
+    return hinglish >= 2 or (english + hinglish) * 2 >= len(words) > 0
+
+
+def _detect(text: str) -> tuple[str | None, bool]:
+    """langdetect's best guess and whether it is confident about it."""
+    if _detect_langs is None:
+        return None, False
+    try:
+        best = _detect_langs(text)[0]
+    except Exception:
+        return None, False
+    return best.lang, best.prob >= settings.language_min_confidence
+
+
+def warm_up() -> None:
+    """Load langdetect's language profiles now instead of on the first
+    ambiguous message (about a quarter of a second)."""
+    if _detect_langs is not None:
+        _detect("warm up the language profiles")
+
+
+def _remember(session_id: str | None, language: str) -> None:
+    if session_id is None:
+        return
+    _session_languages[session_id] = language
+    _session_languages.move_to_end(session_id)
+    while len(_session_languages) > settings.language_cache_size:
+        _session_languages.popitem(last=False)
+
+
+def session_language(session_id: str | None) -> str:
+    """Language last detected for a session (DEFAULT_LANGUAGE if none)."""
+    if session_id is None:
+        return DEFAULT_LANGUAGE
+    return _session_languages.get(session_id, DEFAULT_LANGUAGE)
+
+
+def detect_language(text: str, session_id: str | None = None) -> str:
+    """Detect the language of a user message. Returns a langdetect (ISO 639-1) code."""
+    script = script_language(text)
+    if script is None:
+        method, language = "short", None
+    elif script != LATIN and (script not in _AMBIGUOUS_SCRIPTS or len(text) < settings.language_min_chars):
+        method, language = "script", script
+    elif len(text.strip()) < settings.language_min_chars:
+        method, language = "short", None
+    elif script == LATIN and _looks_english(_WORD.findall(text.lower())):
+        method, language = "english", DEFAULT_LANGUAGE
+    else:
+        method = "detector"
+        language, confident = _detect(text)
+        if not confident:
+            # Unsure: an ambiguous script keeps its language, a Latin message
+            # keeps the session's, and a new session takes the best guess
+            if script != LATIN:
+                language = script
+            elif session_id in _session_languages:
+                language = None
+
+    metrics.inc("language_detections", method=method if language else "session")
+    if language is None:
+        return session_language(session_id)
+    _remember(session_id, language)
+    return language
@@ -0,0 +1,290 @@
+"""Lead capture pipeline.
+
+/api/leads validates a lead and puts it on an in-process queue, then
+returns immediately. A writer task drains the queue in batches into a
+local SQLite database (WAL, one transaction per batch), dropping leads
+already captured for the same brand with the same email or phone. A
+forwarder task sends stored leads to the CRM (api_integrations.submit_lead
+by default) and retries failures with exponential backoff; without a CRM
+webhook configured, leads stay pending until one is. Pending leads
+survive restarts, and rows are leased while being forwarded, so several
+workers can share one database without sending a lead twice.
+"""
+
+import re
+import json
+import time
+import sqlite3
+import asyncio
+import threading
+from collections.abc import Awaitable, Callable
+from datetime import datetime
+from typing import Any
+
+from config import settings, BRAND_CONFIGS
+import api_integrations
+
+_EMAIL = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+_PHONE_JUNK = re.compile(r"[\s\-().]")
+# Optional fields the widgets send, kept as given
+_EXTRA_FIELDS = ("type", "partnerType", "eventType", "plan", "sessionId")
+
+# Forwarded rows are leased for this long, so a crashed worker's lease expires
+_FORWARD_LEASE = 60.0
+
+
+def validate_lead(data: Any) -> tuple[dict | None, str | None]:
+    """Check and normalize a submitted lead. Returns (lead, None) or (None, error)."""
+    if not isinstance(data, dict):
+        return None, "Invalid lead"
+
+    brand = data.get("brand")
+    if brand not in BRAND_CONFIGS:
+        return None, "Unknown brand"
+
+    name = str(data.get("name") or "").strip()
+    if not name or len(name) > 200:
+        return None, "Name is required"
+
+    email = str(data.get("email") or "").strip().lower()
+    if not _EMAIL.match(email) or len(email) > 254:
+        return None, "A valid email is required"
+
+    phone = _PHONE_JUNK.sub("", str(data.get("phone") or ""))
+    if phone and not re.fullmatch(r"\+?\d{7,15}", phone):
+        return None, "Invalid phone number"
+
+    lead = {"brand": brand, "name": name, "email": email, "phone": phone}
+    for field in _EXTRA_FIELDS:
+        value = data.get(field)
+        if isinstance(value, str) and value.strip():
+            lead[field] = value.strip()[:200]
+    lead["timestamp"] = datetime.now().isoformat()
+    lead["source"] = "chatbot"
+    return lead, None
+
+
+class LeadStore:
+    """Leads in a local SQLite database, with their forwarding state."""
+
+    def __init__(self, path: str) -> None:
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS leads (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    brand TEXT NOT NULL,
+                    email TEXT NOT NULL,
+                    phone TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt REAL NOT NULL,
+                    last_error TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_leads_email ON leads (brand, email);
+                CREATE INDEX IF NOT EXISTS idx_leads_phone ON leads (brand, phone);
+                CREATE INDEX IF NOT EXISTS idx_leads_due ON leads (status, next_attempt);
+            """)
+
+    def insert_batch(self, leads: list[dict]) -> tuple[int, int]:
+        """Store leads in one transaction, skipping duplicates (same brand
+        and email, or same brand and phone). Returns (inserted, duplicates)."""
+        inserted = duplicates = 0
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for lead in leads:
+                    exists = self._conn.execute(
+                        "SELECT 1 FROM leads WHERE brand = ? AND (email = ? OR (phone != '' AND phone = ?)) LIMIT 1",
+                        (lead["brand"], lead["email"], lead["phone"]),
+                    ).fetchone()
+                    if exists:
+                        duplicates += 1
+                        continue
+                    self._conn.execute(
+                        "INSERT INTO leads (brand, email, phone, payload, created_at, next_attempt) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (lead["brand"], lead["email"], lead["phone"], json.dumps(lead, ensure_ascii=False), now, now),
+                    )
+                    inserted += 1
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return inserted, duplicates
+
+    def claim_due(self, limit: int, lease: float) -> list[tuple[int, int, dict]]:
+        """Lease up to `limit` pending leads that are due for (re)sending.
+        Returns [(id, attempts, lead)]."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT id, attempts, payload FROM leads WHERE status = 'pending' AND next_attempt <= ? "
+                    "ORDER BY next_attempt LIMIT ?",
+                    (now, limit),
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE leads SET next_attempt = ? WHERE id = ?",
+                    [(now + lease, row[0]) for row in rows],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [(lead_id, attempts, json.loads(payload)) for lead_id, attempts, payload in rows]
+
+    def mark_forwarded(self, lead_id: int) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE leads SET status = 'forwarded', attempts = attempts + 1, last_error = NULL WHERE id = ?",
+                (lead_id,),
+            )
+
+    def mark_failed(self, lead_id: int, error: str, retry_at: float | None) -> None:
+        """Record a failed attempt; retry_at None gives up on the lead."""
+        with self._lock:
+            if retry_at is None:
+                self._conn.execute(
+                    "UPDATE leads SET status = 'failed', attempts = attempts + 1, last_error = ? WHERE id = ?",
+                    (error, lead_id),
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE leads SET attempts = attempts + 1, next_attempt = ?, last_error = ? WHERE id = ?",
+                    (retry_at, error, lead_id),
+                )
+
+    def counts(self) -> dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM leads GROUP BY status").fetchall()
+        return dict(rows)
+
+
+class LeadPipeline:
+    def __init__(
+        self,
+        store: LeadStore,
+        forward: Callable[[dict], Awaitable[Any]] | None = api_integrations.submit_lead,
+        queue_size: int = 10000,
+        batch_size: int = 100,
+        flush_interval: float = 0.5,
+    ) -> None:
+        self.store = store
+        self.forward = forward
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._batch: list[dict] = []
+        self._failed: list[dict] = []  # last batch that could not be written
+        self.duplicates = 0
+
+    def submit(self, lead: dict) -> bool:
+        """Queue a validated lead. False if the queue is full."""
+        try:
+            self._queue.put_nowait(lead)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def _write(self, batch: list[dict]) -> None:
+        try:
+            inserted, duplicates = await asyncio.to_thread(self.store.insert_batch, batch)
+        except Exception as e:
+            # Keep the leads: the writer retries them before taking new ones
+            print(f"  [WARN] Lead write failed ({len(batch)} leads): {type(e).__name__}: {e}")
+            self._failed = batch
+            await asyncio.sleep(self.flush_interval)
+            return
+        self.duplicates += duplicates
+        print(f"  [LEAD] Stored {inserted} new leads ({duplicates} duplicates)")
+
+    async def run_writer(self) -> None:
+        """Background task: write queued leads in batches. A batch is written
+        when it is full or flush_interval after its first lead arrived."""
+        loop = asyncio.get_running_loop()
+        while True:
+            # Kept on self so that flush_sync() finds it if we are cancelled
+            if self._failed:
+                self._batch, self._failed = self._failed, []
+            else:
+                self._batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(self._batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    self._batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            batch, self._batch = self._batch, []
+            await self._write(batch)
+
+    def flush_sync(self) -> None:
+        """Write the batch being collected and whatever is still queued (shutdown)."""
+        batch, self._batch, self._failed = self._failed + self._batch, [], []
+        while not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        if batch:
+            self.store.insert_batch(batch)
+
+    async def forward_due(self) -> int:
+        """Send due leads to the CRM once. Returns how many succeeded."""
+        if self.forward is None:
+            return 0
+        sent = 0
+        claimed = await asyncio.to_thread(self.store.claim_due, self.batch_size, _FORWARD_LEASE)
+        for lead_id, attempts, lead in claimed:
+            try:
+                await self.forward(lead)
+            except Exception as e:
+                attempts += 1
+                retry_at = None
+                if attempts < settings.lead_max_attempts:
+                    retry_at = time.time() + settings.lead_retry_base * 2 ** (attempts - 1)
+                error = f"{type(e).__name__}: {e}"
+                await asyncio.to_thread(self.store.mark_failed, lead_id, error, retry_at)
+                print(f"  [WARN] Lead {lead_id} forward failed (attempt {attempts}): {error}")
+                continue
+            await asyncio.to_thread(self.store.mark_forwarded, lead_id)
+            sent += 1
+        return sent
+
+    async def run_forwarder(self) -> None:
+        """Background task: forward due leads every settings.lead_forward_interval."""
+        if self.forward is None:
+            print("  [LEAD] No CRM webhook configured, leads are kept pending locally")
+            return
+        while True:
+            try:
+                await self.forward_due()
+            except Exception as e:
+                print(f"  [WARN] Lead forwarding error: {type(e).__name__}: {e}")
+            await asyncio.sleep(settings.lead_forward_interval)
+
+    def stats(self) -> dict:
+        return {"queued": self._queue.qsize(), "duplicates": self.duplicates, **self.store.counts()}
+
+
+_pipeline: LeadPipeline | None = None
+
+
+def get_lead_pipeline() -> LeadPipeline:
+    global _pipeline
+    if _pipeline is None:
+        _pipeline = LeadPipeline(
+            LeadStore(settings.leads_db_path),
+            forward=api_integrations.submit_lead if settings.crm_webhook_url else None,
+            queue_size=settings.lead_queue_size,
+            batch_size=settings.lead_batch_size,
+            flush_interval=settings.lead_flush_interval,
+        )
+    return _pipeline
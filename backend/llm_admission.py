@@ -0,0 +1,105 @@
+"""Admission control for LLM calls.
+
+Bounds how many generations run against Ollama at once. Extra requests
+wait in a priority queue; a request is turned away immediately (and the
+caller serves the fallback response) when the queue is full or when its
+predicted wait exceeds the latency budget, and after waiting longer than
+the queue timeout.
+"""
+
+import time
+import heapq
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+
+# Lower value = served first
+PRIORITY_CHAT = 0
+PRIORITY_MESSAGING = 1
+PRIORITY_BACKGROUND = 2
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is not admitted to the LLM."""
+
+
+class AdmissionController:
+    def __init__(self, max_inflight: int, max_queue: int, queue_timeout: float, wait_budget: float) -> None:
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.wait_budget = wait_budget
+        self.inflight = 0
+        self.rejected = 0
+        # EWMA of how long a generation holds its slot (seconds)
+        self.service_time: float | None = None
+        # Heap of (priority, seq, future); cancelled futures are skipped lazily
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    def predicted_wait(self) -> float:
+        """Expected queueing delay for a new request, in seconds."""
+        if self.inflight < self.max_inflight or self.service_time is None:
+            return 0.0
+        return (self.queued + 1) * self.service_time / self.max_inflight
+
+    def _reject(self, reason: str) -> None:
+        self.rejected += 1
+        raise AdmissionRejected(reason)
+
+    async def acquire(self, priority: int = PRIORITY_CHAT) -> None:
+        if self.inflight < self.max_inflight and not self.queued:
+            self.inflight += 1
+            return
+
+        if self.queued >= self.max_queue:
+            self._reject(f"queue full ({self.queued} waiting)")
+        wait = self.predicted_wait()
+        if wait > self.wait_budget:
+            self._reject(f"predicted wait {wait:.1f}s over budget")
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        try:
+            # The slot is handed over by release(); inflight is already counted
+            await asyncio.wait_for(future, timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._reject(f"waited over {self.queue_timeout:.0f}s")
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Slot was granted just as the caller went away
+                self.release()
+            raise
+
+    def release(self, held_for: float | None = None) -> None:
+        if held_for is not None:
+            self.service_time = held_for if self.service_time is None else 0.8 * self.service_time + 0.2 * held_for
+
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.inflight -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_CHAT):
+        """Hold an LLM slot for the duration of the block."""
+        await self.acquire(priority)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+    def stats(self) -> dict:
+        return {
+            "inflight": self.inflight,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "predicted_wait": round(self.predicted_wait(), 2),
+        }
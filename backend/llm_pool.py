@@ -0,0 +1,95 @@
+"""Pool of Ollama endpoints used by rag_chain.
+
+Each request goes to the healthy endpoint with the fewest outstanding
+requests (ties broken by lower latency EWMA). Every endpoint has its own
+circuit breaker, so a failing node is ejected from the rotation until a
+half-open attempt succeeds. The models an endpoint serves are learned from
+its /api/tags health probe; until then it is assumed to serve every model.
+"""
+
+import time
+from contextlib import contextmanager
+
+from circuit_breaker import CircuitBreaker, CLOSED
+
+
+class NoEndpointAvailable(Exception):
+    """Raised when every endpoint's circuit is open."""
+
+
+def _model_name(model: str) -> str:
+    """Ollama treats "phi3" as "phi3:latest"."""
+    return model if ":" in model else f"{model}:latest"
+
+
+class Endpoint:
+    def __init__(self, url: str, failure_threshold: int, reset_timeout: float) -> None:
+        self.url = url.rstrip("/")
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.outstanding = 0
+        # EWMA of request duration (seconds), None until the first success
+        self.latency: float | None = None
+        # Models reported by the last successful probe, None if unknown
+        self.models: set[str] | None = None
+        self.last_check: float | None = None
+
+    def serves(self, model: str) -> bool:
+        return self.models is None or _model_name(model) in self.models
+
+    def observe_latency(self, seconds: float) -> None:
+        self.latency = seconds if self.latency is None else 0.8 * self.latency + 0.2 * seconds
+
+    def stats(self) -> dict:
+        return {
+            "url": self.url,
+            "circuit": self.breaker.state,
+            "outstanding": self.outstanding,
+            "latency": round(self.latency, 3) if self.latency is not None else None,
+            "models": sorted(self.models) if self.models is not None else None,
+            "last_check": self.last_check,
+        }
+
+
+class EndpointPool:
+    def __init__(self, urls: list[str], failure_threshold: int, reset_timeout: float) -> None:
+        if not urls:
+            raise ValueError("EndpointPool needs at least one URL")
+        self.endpoints = [Endpoint(url, failure_threshold, reset_timeout) for url in urls]
+
+    def pick(self, model: str) -> Endpoint:
+        """Choose an endpoint for a request. Raises NoEndpointAvailable if
+        all are ejected.
+
+        Endpoints known to serve `model` are preferred; if none does, all
+        endpoints are considered (Ollama pulls or errors on its own).
+        """
+        candidates = [e for e in self.endpoints if e.serves(model)] or self.endpoints
+        closed = [e for e in candidates if e.breaker.state == CLOSED]
+        if closed:
+            return min(closed, key=lambda e: (e.outstanding, e.latency or 0.0))
+        # Everything is ejected: let one through as a half-open trial if due
+        for endpoint in sorted(candidates, key=lambda e: e.outstanding):
+            if endpoint.breaker.allow():
+                return endpoint
+        raise NoEndpointAvailable("all Ollama endpoints are unavailable")
+
+    @contextmanager
+    def track(self, endpoint: Endpoint):
+        """Count a request as outstanding on `endpoint` for the duration of
+        the block, and record its latency if it completes. A half-open trial
+        is released however the block ends; callers record success or
+        failure right after it, before anything else can pick the endpoint."""
+        endpoint.outstanding += 1
+        start = time.monotonic()
+        try:
+            yield
+            endpoint.observe_latency(time.monotonic() - start)
+        finally:
+            endpoint.outstanding -= 1
+            endpoint.breaker.release_trial()
+
+    def healthy(self) -> bool:
+        return any(e.breaker.state == CLOSED for e in self.endpoints)
+
+    def stats(self) -> list[dict]:
+        return [e.stats() for e in self.endpoints]
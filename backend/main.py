@@ -1,27 +1,45 @@
 import os
-import re
 import time
 import json
+import asyncio
 from datetime import datetime
 from contextlib import asynccontextmanager
 from pathlib import Path
 
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 
 from config import settings, BRAND_CONFIGS
-from rag_chain import generate_response, check_ollama_health
+from rag_chain import (
+    generate_response,
+    stream_response,
+    check_ollama_health,
+    monitor_ollama,
+    ollama_status,
+    llm_queue_stats,
+    extract_lead_form,
+    LeadFormFilter,
+    schedule_summary,
+)
 from conversation_manager import (
     add_message,
-    get_or_create_session,
+    touch_session,
+    run_session_io,
     get_message_count,
     clear_session,
-    cleanup_expired,
+    sweep_expired_sessions,
+    open_session_journal,
+    run_session_journal,
+    close_session_journal,
 )
 import vector_store
-from whatsapp_handler import verify_webhook, handle_message
+import language_detection
+import metrics
+from lead_pipeline import validate_lead, get_lead_pipeline
+from intent_classifier import build_intent_centroids
+from whatsapp_handler import verify_webhook, handle_message, get_dispatcher
 
 BASE_DIR = Path(__file__).resolve().parent
 FRONTEND_DIR = BASE_DIR.parent / "frontend"
@@ -39,6 +57,19 @@ async def lifespan(app: FastAPI):
     print("\n  Initializing knowledge base...")
     vector_store.initialize()
 
+    if settings.intent_mode != "keyword":
+        build_intent_centroids(vector_store.embed_texts)
+        print(f"  [OK] Semantic intent centroids ready ({settings.intent_mode} mode)")
+
+    language_detection.warm_up()
+
+    journal = None
+    if settings.session_journal_enabled:
+        restored = open_session_journal()
+        if restored is not None:
+            print(f"  [OK] Session journal on ({restored} sessions restored)")
+            journal = asyncio.create_task(run_session_journal())
+
     # Check Ollama
     ollama_ok = await check_ollama_health()
     if ollama_ok:
@@ -50,10 +81,25 @@ async def lifespan(app: FastAPI):
     print(f"  Demo page: http://localhost:{settings.app_port}/demo")
     print("=" * 55 + "\n")
 
+    monitor = asyncio.create_task(monitor_ollama())
+    sweeper = asyncio.create_task(sweep_expired_sessions())
+    leads = get_lead_pipeline()
+    lead_tasks = [asyncio.create_task(leads.run_writer()), asyncio.create_task(leads.run_forwarder())]
+    whatsapp = asyncio.create_task(get_dispatcher().run())
+
     yield
 
     # Shutdown
     print("\n  Server shutting down...")
+    monitor.cancel()
+    sweeper.cancel()
+    whatsapp.cancel()
+    for task in lead_tasks:
+        task.cancel()
+    leads.flush_sync()
+    if journal:
+        journal.cancel()
+        close_session_journal()
 
 
 app = FastAPI(title="Dual-Brand AI Chatbot", lifespan=lifespan)
@@ -83,25 +129,20 @@ async def _handle_chat(brand: str, request: Request) -> JSONResponse:
         conversation_id = session_id or f"{brand}_{int(time.time() * 1000)}"
 
         # Ensure session exists
-        get_or_create_session(conversation_id)
+        await run_session_io(touch_session, conversation_id)
 
         # Add user message
-        add_message(conversation_id, "user", message)
+        await run_session_io(add_message, conversation_id, "user", message)
 
         # Generate response
         assistant_message = await generate_response(brand, message, conversation_id)
 
         # Check for lead form trigger
-        show_form = None
-        clean_message = assistant_message
-
-        form_match = re.search(r"\[SHOW_LEAD_FORM:(\w+)\]", assistant_message)
-        if form_match:
-            show_form = form_match.group(1)
-            clean_message = re.sub(r"\s*\[SHOW_LEAD_FORM:\w+\]", "", assistant_message).strip()
+        clean_message, show_form = extract_lead_form(assistant_message)
 
         # Add assistant message to history
-        add_message(conversation_id, "assistant", clean_message)
+        await run_session_io(add_message, conversation_id, "assistant", clean_message)
+        schedule_summary(brand, conversation_id)
 
         return JSONResponse({
             "success": True,
@@ -119,6 +160,89 @@ async def _handle_chat(brand: str, request: Request) -> JSONResponse:
         )
 
 
+# Replies saved after the client disconnected (kept referenced until done)
+_background_writes: set[asyncio.Task] = set()
+
+
+def _sse(event: str, data: dict) -> str:
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _handle_chat_stream(brand: str, request: Request):
+    """Shared streaming chat handler. Relays tokens as Server-Sent Events.
+
+    Emits `token` events ({"text": ...}) while the model generates, then a
+    final `done` event with the same fields as the non-streaming response.
+    """
+    try:
+        data = await request.json()
+        message = data.get("message", "").strip()
+        session_id = data.get("sessionId")
+    except Exception as e:
+        print(f"  [ERROR] Chat stream error ({brand}): {e}")
+        return JSONResponse(
+            {"error": "Failed to process message", "details": str(e)},
+            status_code=500,
+        )
+
+    if not message:
+        return JSONResponse({"error": "Message is required"}, status_code=400)
+
+    conversation_id = session_id or f"{brand}_{int(time.time() * 1000)}"
+    await run_session_io(touch_session, conversation_id)
+    await run_session_io(add_message, conversation_id, "user", message)
+
+    async def event_stream():
+        form_filter = LeadFormFilter()
+        parts = []
+        saved = None
+
+        async def save_reply() -> tuple[str, bool]:
+            # Once, also when the client disconnects mid-stream (finally)
+            nonlocal saved
+            if saved is None:
+                saved = extract_lead_form("".join(parts).strip())
+                if saved[0]:
+                    await run_session_io(add_message, conversation_id, "assistant", saved[0])
+                    schedule_summary(brand, conversation_id)
+            return saved
+
+        try:
+            async for chunk in stream_response(brand, message, conversation_id):
+                parts.append(chunk)
+                text = form_filter.feed(chunk)
+                if text:
+                    yield _sse("token", {"text": text})
+            text = form_filter.flush()
+            if text:
+                yield _sse("token", {"text": text})
+
+            clean_message, show_form = await save_reply()
+            yield _sse("done", {
+                "success": True,
+                "message": clean_message,
+                "sessionId": conversation_id,
+                "showForm": show_form or form_filter.form,
+                "brand": brand,
+            })
+        except Exception as e:
+            print(f"  [ERROR] Chat stream error ({brand}): {e}")
+            yield _sse("error", {"error": "Failed to process message", "details": str(e)})
+        finally:
+            if saved is None:
+                # Disconnected: awaiting here would be cancelled as well
+                task = asyncio.create_task(save_reply())
+                _background_writes.add(task)
+                task.add_done_callback(_background_writes.discard)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.post("/api/ticket99/chat")
 async def ticket99_chat(request: Request):
     return await _handle_chat("ticket99", request)
@@ -129,16 +253,29 @@ async def eventitans_chat(request: Request):
     return await _handle_chat("eventitans", request)
 
 
+@app.post("/api/ticket99/chat/stream")
+async def ticket99_chat_stream(request: Request):
+    return await _handle_chat_stream("ticket99", request)
+
+
+@app.post("/api/eventitans/chat/stream")
+async def eventitans_chat_stream(request: Request):
+    return await _handle_chat_stream("eventitans", request)
+
+
 # --- Leads endpoint ---
 
 @app.post("/api/leads")
 async def capture_lead(request: Request):
     try:
-        lead_data = await request.json()
-        lead_data["timestamp"] = datetime.now().isoformat()
-        lead_data["source"] = "chatbot"
+        lead, error = validate_lead(await request.json())
+        if error:
+            return JSONResponse({"error": error}, status_code=400)
 
-        print(f"  [LEAD] {json.dumps(lead_data, indent=2)}")
+        # Stored and forwarded in the background
+        if not get_lead_pipeline().submit(lead):
+            print("  [WARN] Lead queue full, rejecting lead")
+            return JSONResponse({"error": "Busy, please try again"}, status_code=503)
 
         return JSONResponse({"success": True, "message": "Lead captured successfully"})
     except Exception as e:
@@ -163,22 +300,36 @@ async def whatsapp_incoming(request: Request):
 
 @app.get("/health")
 async def health():
-    ollama_ok = await check_ollama_health()
-
-    # Cleanup expired sessions periodically
-    cleaned = cleanup_expired()
-    if cleaned:
-        print(f"  [CLEANUP] Removed {cleaned} expired sessions")
-
     return JSONResponse({
         "status": "ok",
-        "ollama": "connected" if ollama_ok else "unavailable",
+        **ollama_status(),
         "model": settings.ollama_model,
         "brands": list(BRAND_CONFIGS.keys()),
+        "requests_by_path": metrics.counter_totals("chat_requests", by="path"),
+        "llm_queue": llm_queue_stats(),
+        "stage_latency": metrics.histogram_stats("stage_seconds", by="stage"),
+        "leads": get_lead_pipeline().stats(),
+        "whatsapp": get_dispatcher().stats(),
         "timestamp": datetime.now().isoformat(),
     })
 
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus scrape endpoint: counters, per-stage and per-brand latency
+    histograms, Ollama token stats, plus current queue and endpoint gauges."""
+    for name, value in llm_queue_stats().items():
+        metrics.set_gauge(f"llm_{name}", value)
+    for endpoint in ollama_status()["endpoints"]:
+        metrics.set_gauge("ollama_outstanding", endpoint["outstanding"], endpoint=endpoint["url"])
+        metrics.set_gauge("ollama_up", int(endpoint["circuit"] == "closed"), endpoint=endpoint["url"])
+    for name, value in get_lead_pipeline().stats().items():
+        metrics.set_gauge(f"leads_{name}", value)
+    for name, value in get_dispatcher().stats().items():
+        metrics.set_gauge(f"whatsapp_{name}", value)
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
 # --- Clear session ---
 
 @app.post("/api/clear")
@@ -207,10 +358,21 @@ if FRONTEND_DIR.exists():
 
 if __name__ == "__main__":
     import uvicorn
+
+    if settings.workers > 1:
+        # Build the index once here; workers only open it read-only
+        print("\n  Building knowledge base for multi-worker mode...")
+        vector_store.initialize()
+        os.environ["INDEX_READ_ONLY"] = "true"
+        if settings.vector_backend == "chroma":
+            print("  [WARN] ChromaDB is not designed for multi-process access; set VECTOR_BACKEND=numpy")
+        if settings.session_store == "memory":
+            print("  [WARN] In-memory sessions are per worker; set SESSION_STORE=sqlite or redis")
+
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=settings.app_port,
-        workers=1,  # Single worker to avoid ChromaDB file locking on Windows
+        workers=settings.workers,
         reload=False,
     )
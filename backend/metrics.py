@@ -0,0 +1,148 @@
+"""Lightweight in-process metrics: counters, gauges and latency histograms
+keyed by name + labels, rendered in the Prometheus text format for /metrics."""
+
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the default latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Prefix of every exported metric name
+PREFIX = "chatbot_"
+
+# (name, ((label, value), ...)) -> count
+_counters: Counter = Counter()
+# (name, labels) -> value
+_gauges: dict[tuple, float] = {}
+# (name, labels) -> _Histogram
+_histograms: dict[tuple, "_Histogram"] = {}
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self.buckets = buckets
+        # One slot per bucket plus +Inf; not cumulative (summed on render)
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _key(name: str, labels: dict[str, str]) -> tuple:
+    return (name, tuple(sorted(labels.items())))
+
+
+def inc(name: str, amount: int = 1, **labels: str) -> None:
+    """Increment a counter, e.g. inc("chat_requests", brand="ticket99", path="llm")."""
+    _counters[_key(name, labels)] += amount
+
+
+def set_gauge(name: str, value: float, **labels: str) -> None:
+    """Set a gauge to its current value, e.g. set_gauge("llm_queued", 3)."""
+    _gauges[_key(name, labels)] = value
+
+
+def observe(name: str, value: float, buckets: tuple[float, ...] = DEFAULT_BUCKETS, **labels: str) -> None:
+    """Add a value to a histogram, e.g. observe("stage_seconds", 0.12, stage="embed").
+    `buckets` only matters for the first observation of a name + labels."""
+    key = _key(name, labels)
+    histogram = _histograms.get(key)
+    if histogram is None:
+        histogram = _histograms[key] = _Histogram(buckets)
+    histogram.observe(value)
+
+
+@contextmanager
+def timer(name: str, **labels: str):
+    """Observe the duration of the block in seconds, also when it raises:
+    with metrics.timer("stage_seconds", stage="retrieve"): ..."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def counter_totals(name: str, by: str) -> dict[str, int]:
+    """Sum a counter over all labels except `by`, e.g. requests per path."""
+    totals: Counter = Counter()
+    for (counter_name, labels), value in _counters.items():
+        if counter_name == name:
+            totals[dict(labels).get(by, "")] += value
+    return dict(totals)
+
+
+def histogram_stats(name: str, by: str) -> dict[str, dict]:
+    """Count and mean of a histogram per value of label `by`, e.g. the
+    average duration of each pipeline stage."""
+    totals: dict[str, list] = {}
+    for (hist_name, labels), histogram in _histograms.items():
+        if hist_name == name:
+            entry = totals.setdefault(dict(labels).get(by, ""), [0, 0.0])
+            entry[0] += histogram.count
+            entry[1] += histogram.sum
+    return {
+        value: {"count": count, "mean": round(total / count, 6) if count else 0.0}
+        for value, (count, total) in totals.items()
+    }
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: tuple, extra: str = "") -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def render_prometheus() -> str:
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    lines: list[str] = []
+
+    typed: set[str] = set()
+    for (name, labels), value in sorted(_counters.items()):
+        metric = f"{PREFIX}{name}_total"
+        if metric not in typed:
+            typed.add(metric)
+            lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric}{_labels(labels)} {value}")
+
+    for (name, labels), value in sorted(_gauges.items()):
+        metric = f"{PREFIX}{name}"
+        if metric not in typed:
+            typed.add(metric)
+            lines.append(f"# TYPE {metric} gauge")
+        lines.append(f"{metric}{_labels(labels)} {value:g}")
+
+    for (name, labels), histogram in sorted(_histograms.items(), key=lambda item: item[0]):
+        metric = f"{PREFIX}{name}"
+        if metric not in typed:
+            typed.add(metric)
+            lines.append(f"# TYPE {metric} histogram")
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            le = 'le="%g"' % bound
+            lines.append(f"{metric}_bucket{_labels(labels, le)} {cumulative}")
+        le = 'le="+Inf"'
+        lines.append(f"{metric}_bucket{_labels(labels, le)} {histogram.count}")
+        lines.append(f"{metric}_sum{_labels(labels)} {histogram.sum:.6f}")
+        lines.append(f"{metric}_count{_labels(labels)} {histogram.count}")
+
+    return "\n".join(lines) + "\n"
+
+
+def reset() -> None:
+    _counters.clear()
+    _gauges.clear()
+    _histograms.clear()
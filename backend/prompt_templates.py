@@ -0,0 +1,74 @@
+"""System prompt templates.
+
+Prompt files are read once and kept in memory, re-read only when their
+modification time changes (hot reload without a restart). The file text is
+used verbatim as the first part of the system message, so every request
+for a brand starts with the same bytes and Ollama can reuse the KV cache of
+that prefix; per-request sections (RAG context, intent, language) are
+appended after it.
+"""
+
+import os
+from pathlib import Path
+
+from config import BRAND_CONFIGS
+
+# path -> (mtime_ns, text)
+_templates: dict[str, tuple[int, str]] = {}
+
+
+def load_template(path: str) -> str | None:
+    """Return the contents of a prompt file, or None if it does not exist."""
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        _templates.pop(path, None)
+        return None
+
+    cached = _templates.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    text = Path(path).read_text(encoding="utf-8")
+    _templates[path] = (mtime, text)
+    return text
+
+
+def system_prefix(brand: str) -> str:
+    """Static part of a brand's system prompt."""
+    brand_config = BRAND_CONFIGS.get(brand, {})
+    text = load_template(brand_config.get("prompt_file", ""))
+    if text is None:
+        return f"You are a helpful assistant for {brand_config.get('name', brand)}."
+    return text
+
+
+def render_system_prompt(
+    brand: str,
+    rag_context: list[dict],
+    intent: str | None,
+    language: str,
+) -> str:
+    """Static prefix followed by the per-request sections."""
+    sections = [system_prefix(brand)]
+
+    # Add RAG context
+    if rag_context:
+        sections.append("\n\nRelevant information from our knowledge base:\n")
+        for i, chunk in enumerate(rag_context, 1):
+            if chunk["question"]:
+                sections.append(f"{i}. Q: {chunk['question']}\n   A: {chunk['answer']}\n")
+            elif chunk.get("section"):
+                sections.append(f"{i}. {chunk['section']}:\n   {chunk['answer']}\n")
+            else:
+                sections.append(f"{i}. {chunk['answer']}\n")
+
+    # Add intent hint
+    if intent:
+        sections.append(f"\n\nDetected user intent: {intent}. Tailor your response accordingly.")
+
+    # Add language instruction
+    if language != "en":
+        sections.append(f"\n\nIMPORTANT: The user is writing in '{language}'. You MUST respond in the same language.")
+
+    return "".join(sections)
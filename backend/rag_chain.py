@@ -1,38 +1,90 @@
-import traceback
+import re
+import time
+import json
+import asyncio
+from collections.abc import AsyncIterator
 import httpx
-from pathlib import Path
 
 from config import settings, BRAND_CONFIGS
-from intent_classifier import classify_intent
-from vector_store import search as vector_search
-from conversation_manager import get_recent_history
-
-# Try langdetect, fall back gracefully
-try:
-    from langdetect import detect as _detect_lang
-except ImportError:
-    _detect_lang = None
+from intent_classifier import classify_all, classify_intent_semantic
+from vector_store import search as vector_search, embed_query_async, normalize_query
+from conversation_manager import (
+    get_recent_history,
+    get_message_count,
+    get_summary,
+    get_unsummarized_messages,
+    set_summary,
+    estimate_tokens,
+    run_session_io,
+)
+from prompt_templates import render_system_prompt
+from language_detection import detect_language
+from llm_admission import AdmissionController, AdmissionRejected, PRIORITY_CHAT, PRIORITY_BACKGROUND
+from circuit_breaker import CLOSED
+from llm_pool import EndpointPool, Endpoint, NoEndpointAvailable
+from single_flight import SingleFlight
+import response_cache
+import metrics
+
+# Marker the LLM appends when the lead capture form should be shown
+_LEAD_FORM_MARKER = re.compile(r"\[SHOW_LEAD_FORM:(\w+)\]")
+_LEAD_FORM_PREFIX = "[SHOW_LEAD_FORM:"
+
+
+def extract_lead_form(text: str) -> tuple[str, str | None]:
+    """Strip the lead form marker from a response. Returns (clean_text, form_type)."""
+    match = _LEAD_FORM_MARKER.search(text)
+    if not match:
+        return text, None
+    return re.sub(r"\s*\[SHOW_LEAD_FORM:\w+\]", "", text).strip(), match.group(1)
+
+
+class LeadFormFilter:
+    """Incrementally removes the lead form marker from a token stream.
+
+    Text that could still turn into a marker is held back until it either
+    completes one (dropped, and recorded in `form`) or diverges from it.
+    """
 
+    def __init__(self) -> None:
+        self.form: str | None = None
+        self._pending = ""
+
+    def feed(self, chunk: str) -> str:
+        """Add a chunk of streamed text and return the part safe to emit."""
+        self._pending += chunk
+        out = []
+        while self._pending:
+            idx = self._pending.find("[")
+            if idx == -1:
+                out.append(self._pending)
+                self._pending = ""
+                break
+            out.append(self._pending[:idx])
+            rest = self._pending[idx:]
+            match = _LEAD_FORM_MARKER.match(rest)
+            if match:
+                self.form = match.group(1)
+                self._pending = rest[match.end():]
+            elif _is_marker_prefix(rest):
+                self._pending = rest
+                break
+            else:
+                out.append("[")
+                self._pending = rest[1:]
+        return "".join(out)
 
-def detect_language(text: str) -> str:
-    """Detect language of user message. Returns ISO 639-1 code."""
-    if _detect_lang is None:
-        return "en"
-    try:
-        lang = _detect_lang(text)
-        return lang
-    except Exception:
-        return "en"
+    def flush(self) -> str:
+        """Release any held-back text at the end of the stream."""
+        remaining, self._pending = self._pending, ""
+        return remaining
 
 
-def _load_system_prompt(brand: str) -> str:
-    """Load the system prompt from file for a brand."""
-    brand_config = BRAND_CONFIGS.get(brand, {})
-    prompt_file = brand_config.get("prompt_file", "")
-    path = Path(prompt_file)
-    if path.exists():
-        return path.read_text(encoding="utf-8")
-    return f"You are a helpful assistant for {brand_config.get('name', brand)}."
+def _is_marker_prefix(text: str) -> bool:
+    """True if text is an incomplete but so far valid lead form marker."""
+    if len(text) <= len(_LEAD_FORM_PREFIX):
+        return _LEAD_FORM_PREFIX.startswith(text)
+    return text.startswith(_LEAD_FORM_PREFIX) and re.fullmatch(r"\w+", text[len(_LEAD_FORM_PREFIX):]) is not None
 
 
 def _build_prompt(
@@ -43,33 +95,39 @@ def _build_prompt(
     language: str,
     rag_context: list[dict],
 ) -> list[dict[str, str]]:
-    """Assemble the full prompt for the LLM."""
-    system_prompt = _load_system_prompt(brand)
+    """Assemble the full prompt for the LLM within settings.prompt_token_budget.
 
-    # Add RAG context
-    if rag_context:
-        context_text = "\n\nRelevant information from our knowledge base:\n"
-        for i, chunk in enumerate(rag_context, 1):
-            if chunk["question"]:
-                context_text += f"{i}. Q: {chunk['question']}\n   A: {chunk['answer']}\n"
-            else:
-                context_text += f"{i}. {chunk['answer']}\n"
-        system_prompt += context_text
-
-    # Add intent hint
-    if intent:
-        system_prompt += f"\n\nDetected user intent: {intent}. Tailor your response accordingly."
-
-    # Add language instruction
-    if language != "en":
-        system_prompt += f"\n\nIMPORTANT: The user is writing in '{language}'. You MUST respond in the same language."
+    The system prompt and the user message always go in. If the RAG context
+    leaves no room, its lowest-ranked chunks are dropped (keeping at least
+    one); the summary and as much recent history as fits use the rest.
+    """
+    budget = settings.prompt_token_budget - estimate_tokens(user_message)
+    system_prompt = render_system_prompt(brand, rag_context, intent, language)
+    while estimate_tokens(system_prompt) > budget and len(rag_context) > 1:
+        rag_context = rag_context[:-1]
+        system_prompt = render_system_prompt(brand, rag_context, intent, language)
+    budget -= estimate_tokens(system_prompt)
 
     messages = [{"role": "system", "content": system_prompt}]
 
-    # Add conversation history
-    history = get_recent_history(session_id)
-    for msg in history:
-        messages.append({"role": msg["role"], "content": msg["content"]})
+    # Running summary of the turns that fell out of the history window
+    summary = get_summary(session_id)
+    if summary:
+        summary_message = f"Summary of the earlier conversation: {summary}"
+        if estimate_tokens(summary_message) <= budget:
+            messages.append({"role": "system", "content": summary_message})
+            budget -= estimate_tokens(summary_message)
+
+    # Add conversation history. The current message is normally stored
+    # already; it is appended below, so it must not come back as history.
+    history = get_recent_history(
+        session_id,
+        settings.history_max_messages + 1,
+        token_budget=max(budget, 0) + estimate_tokens(user_message),
+    )
+    if history and history[-1] == {"role": "user", "content": user_message}:
+        history.pop()
+    messages.extend(history[-settings.history_max_messages:])
 
     # Add current user message
     messages.append({"role": "user", "content": user_message})
@@ -166,6 +224,44 @@ def _fallback_response(brand: str, user_message: str, rag_context: list[dict], i
     return f"I can help you with {brand_name}! Ask me about events, pricing, features, or how to get started."
 
 
+# Ollama endpoints (settings.ollama_endpoints, or just ollama_base_url).
+# Each has its own circuit breaker, so a failing node drops out of rotation.
+_pool = EndpointPool(
+    [url.strip() for url in settings.ollama_endpoints.split(",") if url.strip()] or [settings.ollama_base_url],
+    failure_threshold=settings.ollama_failure_threshold,
+    reset_timeout=settings.ollama_reset_timeout,
+)
+
+# Bounds concurrent Ollama generations (llm_max_inflight per endpoint)
+_admission = AdmissionController(
+    max_inflight=settings.llm_max_inflight * len(_pool.endpoints),
+    max_queue=settings.llm_max_queue,
+    queue_timeout=settings.llm_queue_timeout,
+    wait_budget=settings.llm_wait_budget,
+)
+
+
+def llm_queue_stats() -> dict:
+    """In-flight/queued/rejected counts of the LLM admission controller."""
+    return _admission.stats()
+
+
+def _is_ollama_failure(exc: Exception) -> bool:
+    """Connection problems, timeouts and 5xx responses count against the
+    breaker; other errors (bad request, unknown model) do not."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500
+    return isinstance(exc, httpx.TransportError)
+
+
+def ollama_status() -> dict:
+    """Cached Ollama state for /health (no request is made)."""
+    return {
+        "ollama": "connected" if _pool.healthy() else "unavailable",
+        "endpoints": _pool.stats(),
+    }
+
+
 # Persistent HTTP client (reused across requests)
 _http_client: httpx.AsyncClient | None = None
 
@@ -174,65 +270,454 @@ def _get_http_client() -> httpx.AsyncClient:
     global _http_client
     if _http_client is None or _http_client.is_closed:
         _http_client = httpx.AsyncClient(
-            timeout=httpx.Timeout(connect=10.0, read=90.0, write=10.0, pool=10.0)
+            timeout=httpx.Timeout(connect=3.0, read=90.0, write=10.0, pool=10.0)
         )
     return _http_client
 
 
-async def generate_response(
+def _brand_model(brand: str) -> str:
+    """Ollama model for a brand (BRAND_CONFIGS "model", else settings.ollama_model)."""
+    return BRAND_CONFIGS.get(brand, {}).get("model") or settings.ollama_model
+
+
+# Histogram buckets for Ollama's generation speed (tokens per second)
+_TOKENS_PER_SECOND_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 200)
+
+
+def _record_ollama_stats(data: dict, model: str) -> None:
+    """Token counts and timings Ollama reports in its final response object
+    (durations are in nanoseconds)."""
+    if "eval_count" not in data:
+        return
+    metrics.inc("ollama_eval_tokens", data["eval_count"], model=model)
+    metrics.inc("ollama_prompt_tokens", data.get("prompt_eval_count", 0), model=model)
+    for phase in ("load", "prompt_eval", "eval"):
+        nanoseconds = data.get(f"{phase}_duration")
+        if nanoseconds:
+            metrics.observe("ollama_duration_seconds", nanoseconds / 1e9, model=model, phase=phase)
+    if data.get("eval_duration"):
+        metrics.observe(
+            "ollama_tokens_per_second",
+            data["eval_count"] / (data["eval_duration"] / 1e9),
+            buckets=_TOKENS_PER_SECOND_BUCKETS,
+            model=model,
+        )
+
+
+def _record_request(brand: str, path: str, start: float) -> None:
+    """Count a chat request and its latency by brand and answer path."""
+    metrics.inc("chat_requests", brand=brand, path=path)
+    metrics.observe("request_seconds", time.perf_counter() - start, brand=brand, path=path)
+
+
+def _ollama_error(endpoint: Endpoint | None, exc: Exception) -> None:
+    """Feed a failed Ollama call to the endpoint's breaker and count it."""
+    if endpoint is not None and _is_ollama_failure(exc):
+        endpoint.breaker.record_failure()
+    metrics.inc("ollama_errors", endpoint=endpoint.url if endpoint else "-", error=type(exc).__name__)
+
+
+def _ollama_payload(messages: list[dict[str, str]], stream: bool, model: str) -> dict:
+    """Request body for Ollama's /api/chat endpoint."""
+    return {
+        "model": model,
+        "messages": messages,
+        "stream": stream,
+        # Keep the model (and its cached prompt prefix) loaded between requests
+        "keep_alive": settings.ollama_keep_alive,
+        "options": {
+            "temperature": 0.3,
+            "num_predict": 256,
+        },
+    }
+
+
+def _is_first_turn(session_id: str) -> bool:
+    """True if the current user message is the first in the session.
+    Only such messages are answered from / stored in the semantic cache,
+    since later answers can depend on the conversation so far."""
+    return get_message_count(session_id, "user") <= 1
+
+
+def _fast_path_intent(brand: str, user_message: str, matches: list[tuple[str, float]]) -> str | None:
+    """Return the intent to answer from templates, or None.
+
+    Applies when the message is short and every matched intent is one of
+    the brand's canned intents with enough confidence, so "hi" qualifies
+    but "hi, how much does it cost?" (greeting + pricing) does not.
+    """
+    if not settings.fast_path_enabled or not matches:
+        return None
+    if len(user_message.split()) > settings.fast_path_max_words:
+        return None
+    canned = BRAND_CONFIGS.get(brand, {}).get("canned_intents", {})
+    for intent, confidence in matches:
+        if intent not in canned or confidence < canned[intent]:
+            return None
+    return matches[0][0]
+
+
+async def _prepare(
     brand: str,
     user_message: str,
     session_id: str,
-) -> str:
-    """Core RAG pipeline: detect language -> classify intent -> search vectors -> call LLM.
+) -> dict:
+    """Run the retrieval half of the pipeline.
 
-    Falls back to intent-based response if Ollama is unavailable.
+    Returns a dict with intent, language, query_embedding, rag_context and
+    messages. If the request can be answered without the LLM, "answer" is
+    set and "path" says how ("fast_path" or "cache"); the remaining steps
+    are skipped.
     """
-    # Step 1: Detect language
-    language = detect_language(user_message)
+    # Step 1: Classify intent
+    with metrics.timer("stage_seconds", stage="intent"):
+        matches = classify_all(user_message)
+    intent, confidence = matches[0] if matches else (None, 0.0)
+
+    fast_intent = _fast_path_intent(brand, user_message, matches)
+    if fast_intent:
+        return {
+            "intent": fast_intent,
+            "answer": _fallback_response(brand, user_message, [], fast_intent),
+            "path": "fast_path",
+        }
+
+    # Step 2: Detect language
+    with metrics.timer("stage_seconds", stage="language"):
+        language = detect_language(user_message, session_id)
+
+    # Step 3: Embed query once (off the event loop), reused by the intent
+    # centroids, the cache and the vector search
+    with metrics.timer("stage_seconds", stage="embed"):
+        query_embedding = await embed_query_async(user_message)
+
+    if settings.intent_mode == "semantic" or (settings.intent_mode == "hybrid" and intent is None):
+        semantic_intent, semantic_confidence = classify_intent_semantic(query_embedding)
+        if semantic_intent:
+            intent, confidence = semantic_intent, semantic_confidence
+
+    prepared = {
+        "intent": intent,
+        "language": language,
+        "query_embedding": query_embedding,
+        "rag_context": [],
+        "messages": [],
+        "answer": None,
+        "path": None,
+        "cacheable": await run_session_io(_is_first_turn, session_id),
+    }
+
+    if prepared["cacheable"]:
+        with metrics.timer("stage_seconds", stage="cache"):
+            prepared["answer"] = response_cache.lookup(brand, query_embedding, language)
+        if prepared["answer"]:
+            prepared["path"] = "cache"
+            return prepared
+
+    # Step 4: Search vector store for relevant context (index query, BM25
+    # and distance lookups run in a worker thread, off the event loop)
+    with metrics.timer("stage_seconds", stage="retrieve"):
+        prepared["rag_context"] = await asyncio.to_thread(
+            vector_search, brand, user_message, top_k=3, query_embedding=query_embedding
+        )
 
-    # Step 2: Classify intent
-    intent, confidence = classify_intent(user_message)
+    # Step 5: Build prompt
+    with metrics.timer("stage_seconds", stage="prompt"):
+        prepared["messages"] = await run_session_io(
+            _build_prompt, brand, user_message, session_id, intent, language, prepared["rag_context"]
+        )
 
-    # Step 3: Search vector store for relevant context
-    rag_context = vector_search(brand, user_message, top_k=3)
+    return prepared
 
-    # Step 4: Build prompt and call Ollama
-    messages = _build_prompt(brand, user_message, session_id, intent, language, rag_context)
 
-    try:
-        client = _get_http_client()
-        response = await client.post(
-            f"{settings.ollama_base_url}/api/chat",
-            json={
-                "model": settings.ollama_model,
-                "messages": messages,
-                "stream": False,
-                "options": {
-                    "temperature": 0.3,
-                    "num_predict": 256,
-                },
-            },
+def _cache_answer(brand: str, user_message: str, prepared: dict, answer: str) -> None:
+    """Store an LLM answer in the semantic cache if the request allows it."""
+    if prepared["cacheable"]:
+        response_cache.store(
+            brand, user_message, prepared["query_embedding"], answer, prepared["language"]
         )
-        response.raise_for_status()
+
+
+async def _generate_response(brand: str, user_message: str, session_id: str, priority: int) -> str:
+    start = time.perf_counter()
+    prepared = await _prepare(brand, user_message, session_id)
+    if prepared["answer"]:
+        _record_request(brand, prepared["path"], start)
+        return prepared["answer"]
+
+    model = _brand_model(brand)
+    endpoint = None
+    try:
+        queued = time.perf_counter()
+        async with _admission.slot(priority):
+            metrics.observe("stage_seconds", time.perf_counter() - queued, stage="llm_queue")
+            endpoint = _pool.pick(model)
+            client = _get_http_client()
+            with _pool.track(endpoint), metrics.timer("stage_seconds", stage="llm"):
+                response = await client.post(
+                    f"{endpoint.url}/api/chat",
+                    json=_ollama_payload(prepared["messages"], stream=False, model=model),
+                )
+                response.raise_for_status()
+        endpoint.breaker.record_success()
         data = response.json()
+        _record_ollama_stats(data, model)
         answer = data.get("message", {}).get("content", "").strip()
         if answer:
+            _cache_answer(brand, user_message, prepared, answer)
+            _record_request(brand, "llm", start)
             return answer
         print("  [WARN] Ollama returned empty response, using fallback")
+    except NoEndpointAvailable:
+        # Every circuit is open; monitor_ollama logs when that changes
+        metrics.inc("llm_unavailable", reason="circuit_open")
+    except AdmissionRejected as e:
+        metrics.inc("llm_unavailable", reason="busy")
+        print(f"  [WARN] LLM busy ({e}), using fallback")
     except Exception as e:
-        print(f"  [WARN] Ollama error: {type(e).__name__}: {e}")
-        traceback.print_exc()
+        _ollama_error(endpoint, e)
+        print(f"  [WARN] Ollama error ({endpoint.url if endpoint else '-'}): {type(e).__name__}: {e}")
 
     # Fallback: use intent-based response
-    return _fallback_response(brand, user_message, rag_context, intent)
+    _record_request(brand, "fallback", start)
+    return _fallback_response(brand, user_message, prepared["rag_context"], prepared["intent"])
 
 
-async def check_ollama_health() -> bool:
-    """Check if Ollama is reachable."""
+async def _stream_response(brand: str, user_message: str, session_id: str, priority: int) -> AsyncIterator[str]:
+    start = time.perf_counter()
+    prepared = await _prepare(brand, user_message, session_id)
+    if prepared["answer"]:
+        _record_request(brand, prepared["path"], start)
+        yield prepared["answer"]
+        return
+
+    model = _brand_model(brand)
+    endpoint = None
+    parts = []
+    try:
+        queued = time.perf_counter()
+        async with _admission.slot(priority):
+            metrics.observe("stage_seconds", time.perf_counter() - queued, stage="llm_queue")
+            endpoint = _pool.pick(model)
+            client = _get_http_client()
+            with _pool.track(endpoint), metrics.timer("stage_seconds", stage="llm"):
+                async with client.stream(
+                    "POST",
+                    f"{endpoint.url}/api/chat",
+                    json=_ollama_payload(prepared["messages"], stream=True, model=model),
+                ) as response:
+                    response.raise_for_status()
+                    endpoint.breaker.record_success()
+                    # Ollama streams newline-delimited JSON objects
+                    async for line in response.aiter_lines():
+                        if not line.strip():
+                            continue
+                        data = json.loads(line)
+                        chunk = data.get("message", {}).get("content", "")
+                        if chunk:
+                            if not parts:
+                                metrics.observe("first_token_seconds", time.perf_counter() - start, brand=brand)
+                            parts.append(chunk)
+                            yield chunk
+                        if data.get("done"):
+                            _record_ollama_stats(data, model)
+                            break
+        if parts:
+            _cache_answer(brand, user_message, prepared, "".join(parts).strip())
+            _record_request(brand, "llm", start)
+            return
+        print("  [WARN] Ollama returned empty stream, using fallback")
+    except NoEndpointAvailable:
+        metrics.inc("llm_unavailable", reason="circuit_open")
+    except AdmissionRejected as e:
+        metrics.inc("llm_unavailable", reason="busy")
+        print(f"  [WARN] LLM busy ({e}), using fallback")
+    except Exception as e:
+        _ollama_error(endpoint, e)
+        print(f"  [WARN] Ollama stream error ({endpoint.url if endpoint else '-'}): {type(e).__name__}: {e}")
+        if parts:
+            _record_request(brand, "llm", start)
+            return
+
+    _record_request(brand, "fallback", start)
+    yield _fallback_response(brand, user_message, prepared["rag_context"], prepared["intent"])
+
+
+# Identical first-turn questions asked while one is being answered share it
+_flights = SingleFlight()
+
+
+async def _flight_key(brand: str, user_message: str, session_id: str, mode: str) -> tuple | None:
+    """Coalescing key for a request, or None if it must run on its own.
+    Only first-turn messages are coalesced, since their answer does not
+    depend on the conversation so far."""
+    if not settings.coalesce_requests or not await run_session_io(_is_first_turn, session_id):
+        return None
+    return (mode, brand, normalize_query(user_message))
+
+
+async def generate_response(
+    brand: str,
+    user_message: str,
+    session_id: str,
+    priority: int = PRIORITY_CHAT,
+) -> str:
+    """Core RAG pipeline: classify intent -> (fast path) -> detect language ->
+    check cache -> search vectors -> call LLM.
+
+    Falls back to intent-based response if Ollama is unavailable.
+    Concurrent identical first-turn questions are answered by one run.
+    """
+    key = await _flight_key(brand, user_message, session_id, "generate")
+    if key is None:
+        return await _generate_response(brand, user_message, session_id, priority)
+
+    start = time.perf_counter()
+    answer, shared = await _flights.do(
+        key, lambda: _generate_response(brand, user_message, session_id, priority)
+    )
+    if shared:
+        _record_request(brand, "coalesced", start)
+    return answer
+
+
+async def stream_response(
+    brand: str,
+    user_message: str,
+    session_id: str,
+    priority: int = PRIORITY_CHAT,
+) -> AsyncIterator[str]:
+    """Streaming variant of generate_response. Yields raw text chunks as Ollama
+    produces them (lead form marker included).
+
+    Fast path and cache answers are yielded as a single chunk. If Ollama
+    fails before producing any text, yields the fallback response as a
+    single chunk. A failure mid-stream ends the stream with what was already
+    generated. Callers that join an identical in-flight first-turn question
+    get its chunks replayed from the start.
+    """
+    key = await _flight_key(brand, user_message, session_id, "stream")
+    if key is None:
+        async for chunk in _stream_response(brand, user_message, session_id, priority):
+            yield chunk
+        return
+
+    start = time.perf_counter()
+    shared = False
+    async for chunk, shared in _flights.stream(
+        key, lambda: _stream_response(brand, user_message, session_id, priority)
+    ):
+        yield chunk
+    if shared:
+        _record_request(brand, "coalesced", start)
+
+
+_SUMMARY_INSTRUCTIONS = (
+    "Summarize this customer support conversation in at most 3 sentences. "
+    "Keep names, events, dates, ticket or booking details and what the user "
+    "still wants. Reply with the summary only."
+)
+# Sessions with a summary being generated
+_summarizing: set[str] = set()
+
+
+async def _summarize_history(brand: str, session_id: str) -> None:
+    """Fold the messages that fell out of the history window into the
+    session summary. Runs at background priority, on the brand's model so
+    Ollama does not load a second one."""
+    messages = await run_session_io(get_unsummarized_messages, session_id)
+    older = messages[:-settings.history_max_messages]
+    if len(older) < settings.history_summary_min_messages:
+        return
+
+    previous = await run_session_io(get_summary, session_id)
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in older)
+    prompt = [
+        {"role": "system", "content": _SUMMARY_INSTRUCTIONS},
+        {"role": "user", "content": (f"Summary so far: {previous}\n\n" if previous else "") + f"Conversation:\n{transcript}"},
+    ]
+    model = _brand_model(brand)
+    endpoint = None
+    try:
+        async with _admission.slot(PRIORITY_BACKGROUND):
+            endpoint = _pool.pick(model)
+            client = _get_http_client()
+            with _pool.track(endpoint):
+                response = await client.post(
+                    f"{endpoint.url}/api/chat",
+                    json=_ollama_payload(prompt, stream=False, model=model),
+                )
+                response.raise_for_status()
+        endpoint.breaker.record_success()
+        data = response.json()
+        _record_ollama_stats(data, model)
+        summary = data.get("message", {}).get("content", "").strip()
+    except (NoEndpointAvailable, AdmissionRejected):
+        return
+    except Exception as e:
+        _ollama_error(endpoint, e)
+        print(f"  [WARN] History summary failed: {type(e).__name__}: {e}")
+        return
+
+    if summary:
+        await run_session_io(set_summary, session_id, summary, older[-1]["timestamp"])
+
+
+def schedule_summary(brand: str, session_id: str) -> None:
+    """Update the session summary in the background (off the request path)
+    if settings.history_summary_enabled and enough turns have piled up."""
+    if not settings.history_summary_enabled or session_id in _summarizing:
+        return
+    _summarizing.add(session_id)
+    task = asyncio.create_task(_summarize_history(brand, session_id))
+    task.add_done_callback(lambda _task: _summarizing.discard(session_id))
+
+
+async def _probe(endpoint: Endpoint) -> bool:
+    """Health-check one endpoint, learn its models, and feed the result to
+    its circuit breaker."""
     try:
         client = _get_http_client()
-        resp = await client.get(f"{settings.ollama_base_url}/api/tags")
-        return resp.status_code == 200
+        resp = await client.get(f"{endpoint.url}/api/tags", timeout=5.0)
+        ok = resp.status_code == 200
+        if ok:
+            endpoint.models = {m["name"] for m in resp.json().get("models", [])}
     except Exception:
-        return False
+        ok = False
+
+    if ok:
+        endpoint.breaker.record_success()
+    else:
+        endpoint.breaker.record_failure()
+    endpoint.last_check = time.time()
+    return ok
+
+
+async def check_ollama_health() -> bool:
+    """Check every Ollama endpoint. True if at least one is reachable."""
+    results = await asyncio.gather(*(_probe(endpoint) for endpoint in _pool.endpoints))
+    return any(results)
+
+
+async def monitor_ollama() -> None:
+    """Background health probe. Each endpoint is checked every
+    settings.ollama_probe_interval while its circuit is closed; while it is
+    open, as soon as the breaker allows a half-open attempt."""
+    last_state = {endpoint.url: endpoint.breaker.state for endpoint in _pool.endpoints}
+    while True:
+        interval = settings.ollama_probe_interval
+        if not all(endpoint.breaker.state == CLOSED for endpoint in _pool.endpoints):
+            interval = min(interval, settings.ollama_reset_timeout)
+        await asyncio.sleep(interval)
+
+        due = [e for e in _pool.endpoints if e.breaker.state == CLOSED or e.breaker.allow()]
+        await asyncio.gather(*(_probe(endpoint) for endpoint in due))
+        for endpoint in _pool.endpoints:
+            state = endpoint.breaker.state
+            if state == last_state[endpoint.url]:
+                continue
+            if state == CLOSED:
+                print(f"  [OK] Ollama at {endpoint.url} is back, circuit closed")
+            else:
+                print(f"  [WARN] Ollama at {endpoint.url} unavailable, circuit {state}")
+            last_state[endpoint.url] = state
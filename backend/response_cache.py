@@ -0,0 +1,99 @@
+"""Semantic answer cache in front of the LLM.
+
+Stores generated answers per brand together with the embedding of the
+question that produced them. A new question whose embedding is close enough
+(cosine similarity >= settings.semantic_cache_threshold) to a stored one is
+answered from the cache instead of calling Ollama.
+"""
+
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from config import settings
+
+# brand -> OrderedDict[question_key, entry], least recently used first
+_caches: dict[str, OrderedDict[str, dict]] = {}
+
+_stats = {"hits": 0, "misses": 0}
+
+
+def _normalize(embedding) -> np.ndarray:
+    vec = np.asarray(embedding, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+def _best_match(cache: OrderedDict[str, dict], vec: np.ndarray, language: str) -> tuple[str | None, float]:
+    """Return (key, similarity) of the closest entry in the same language."""
+    keys = [k for k, entry in cache.items() if entry["language"] == language]
+    if not keys:
+        return None, 0.0
+    matrix = np.stack([cache[k]["embedding"] for k in keys])
+    sims = matrix @ vec
+    best = int(np.argmax(sims))
+    return keys[best], float(sims[best])
+
+
+def _purge_expired(cache: OrderedDict[str, dict], now: float) -> None:
+    expired = [k for k, entry in cache.items() if now - entry["created_at"] > settings.semantic_cache_ttl]
+    for k in expired:
+        del cache[k]
+
+
+def lookup(brand: str, embedding, language: str = "en") -> str | None:
+    """Return a cached answer for a semantically equivalent question, or None."""
+    if not settings.semantic_cache_enabled:
+        return None
+
+    cache = _caches.get(brand)
+    if cache:
+        _purge_expired(cache, time.time())
+    if not cache:
+        _stats["misses"] += 1
+        return None
+
+    key, similarity = _best_match(cache, _normalize(embedding), language)
+    if key is None or similarity < settings.semantic_cache_threshold:
+        _stats["misses"] += 1
+        return None
+
+    cache.move_to_end(key)
+    _stats["hits"] += 1
+    return cache[key]["answer"]
+
+
+def store(brand: str, question: str, embedding, answer: str, language: str = "en") -> None:
+    """Cache an answer. Replaces an existing entry for an equivalent question."""
+    if not settings.semantic_cache_enabled or not answer:
+        return
+
+    cache = _caches.setdefault(brand, OrderedDict())
+    vec = _normalize(embedding)
+
+    key, similarity = _best_match(cache, vec, language)
+    if key is not None and similarity >= settings.semantic_cache_threshold:
+        del cache[key]
+
+    cache[question.lower().strip()] = {
+        "embedding": vec,
+        "answer": answer,
+        "language": language,
+        "created_at": time.time(),
+    }
+    while len(cache) > settings.semantic_cache_max_entries:
+        cache.popitem(last=False)
+
+
+def invalidate(brand: str | None = None) -> None:
+    """Drop cached answers for a brand (or all brands), e.g. after a knowledge rebuild."""
+    if brand is None:
+        _caches.clear()
+    else:
+        _caches.pop(brand, None)
+
+
+def stats() -> dict[str, int]:
+    """Hit/miss counters and current size across brands."""
+    return {**_stats, "entries": sum(len(c) for c in _caches.values())}
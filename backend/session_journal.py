@@ -0,0 +1,161 @@
+"""Write-behind journal for the in-memory session store.
+
+Chat requests only queue journal records in memory; a background task
+appends them to a log file and fsyncs once per flush interval. Periodic
+compaction writes the whole store to a snapshot and drops the logs it
+covers. On startup, snapshot + logs are replayed into the store, keeping
+only sessions that have not expired.
+
+Layout under `path`:
+  snapshot.json        {"gen": N, "sessions": {id: state}}
+  sessions.<gen>.log   JSON lines: {"op": "append" | "summary" | "delete", "sid": ...}
+
+A snapshot with gen N covers everything in logs with a lower generation.
+"""
+
+import os
+import json
+import asyncio
+from pathlib import Path
+from typing import Any
+
+SNAPSHOT_FILE = "snapshot.json"
+
+
+def new_state(created_at: float) -> dict[str, Any]:
+    """Replay state of one session (the format of MemorySessionStore.export())."""
+    return {
+        "created_at": created_at,
+        "last_active": created_at,
+        "counts": {},
+        "messages": [],
+        "summary": None,
+        "summary_until": 0.0,
+    }
+
+
+class SessionJournal:
+    def __init__(self, path: str) -> None:
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._pending: list[str] = []
+        # Logs older than the snapshot are skipped on replay: never write to one
+        gens = self._log_gens()
+        self._gen = max(self._read_snapshot()[0], (gens[-1] + 1) if gens else 1)
+
+    def _read_snapshot(self) -> tuple[int, dict[str, dict]]:
+        snapshot_path = self.path / SNAPSHOT_FILE
+        if not snapshot_path.exists():
+            return 0, {}
+        snapshot = json.loads(snapshot_path.read_text(encoding="utf-8"))
+        return snapshot["gen"], snapshot["sessions"]
+
+    def _log_path(self, gen: int) -> Path:
+        return self.path / f"sessions.{gen:06d}.log"
+
+    def _log_gens(self) -> list[int]:
+        gens = []
+        for log in self.path.glob("sessions.*.log"):
+            try:
+                gens.append(int(log.name.split(".")[1]))
+            except ValueError:
+                continue
+        return sorted(gens)
+
+    # --- Recording (chat path: no I/O) ---
+
+    def _record(self, entry: dict[str, Any]) -> None:
+        self._pending.append(json.dumps(entry, ensure_ascii=False))
+
+    def record_append(self, session_id: str, message: dict[str, Any]) -> None:
+        self._record({"op": "append", "sid": session_id, "m": message})
+
+    def record_summary(self, session_id: str, summary: str, until: float) -> None:
+        self._record({"op": "summary", "sid": session_id, "summary": summary, "until": until})
+
+    def record_delete(self, session_id: str) -> None:
+        self._record({"op": "delete", "sid": session_id})
+
+    # --- Writing ---
+
+    def _write(self, gen: int, lines: list[str]) -> None:
+        with open(self._log_path(gen), "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def flush(self) -> None:
+        """Append queued records to the current log (one fsync per batch)."""
+        if not self._pending:
+            return
+        lines, self._pending = self._pending, []
+        await asyncio.to_thread(self._write, self._gen, lines)
+
+    def flush_sync(self) -> None:
+        """Blocking flush, for shutdown."""
+        if self._pending:
+            lines, self._pending = self._pending, []
+            self._write(self._gen, lines)
+
+    def _write_snapshot(self, gen: int, sessions: dict[str, dict]) -> None:
+        tmp = self.path / (SNAPSHOT_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"gen": gen, "sessions": sessions}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path / SNAPSHOT_FILE)
+        for old in self._log_gens():
+            if old < gen:
+                try:
+                    self._log_path(old).unlink(missing_ok=True)
+                except OSError as e:
+                    # Harmless: replay skips it, the next compaction retries
+                    print(f"  [WARN] Could not remove {self._log_path(old).name}: {e}")
+
+    async def compact(self, sessions: dict[str, dict]) -> None:
+        """Replace snapshot + logs with a snapshot of `sessions`, the store's
+        current state. Must be called right after exporting it (no await in
+        between), so that queued records are already part of it. If the
+        snapshot cannot be written, those records stay queued for the log."""
+        covered = len(self._pending)
+        gen = self._gen + 1
+        await asyncio.to_thread(self._write_snapshot, gen, sessions)
+        # Records queued while the snapshot was written are newer than it
+        del self._pending[:covered]
+        self._gen = gen
+
+    # --- Replay ---
+
+    def replay(self, ttl: float, now: float) -> dict[str, dict]:
+        """Rebuild session states from snapshot + logs, dropping sessions
+        idle for more than ttl seconds."""
+        snapshot_gen, sessions = self._read_snapshot()
+
+        for gen in self._log_gens():
+            if gen < snapshot_gen:
+                continue
+            with open(self._log_path(gen), encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Torn last line after a crash
+                        continue
+                    self._apply(sessions, entry)
+
+        return {sid: state for sid, state in sessions.items() if now - state["last_active"] <= ttl}
+
+    @staticmethod
+    def _apply(sessions: dict[str, dict], entry: dict[str, Any]) -> None:
+        sid = entry["sid"]
+        if entry["op"] == "append":
+            message = entry["m"]
+            state = sessions.setdefault(sid, new_state(message["timestamp"]))
+            state["messages"].append(message)
+            state["counts"][message["role"]] = state["counts"].get(message["role"], 0) + 1
+            state["last_active"] = max(state["last_active"], message["timestamp"])
+        elif entry["op"] == "summary" and sid in sessions:
+            sessions[sid]["summary"] = entry["summary"]
+            sessions[sid]["summary_until"] = entry["until"]
+        elif entry["op"] == "delete":
+            sessions.pop(sid, None)
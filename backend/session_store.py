@@ -0,0 +1,477 @@
+"""Session storage backends for conversation_manager.
+
+- MemorySessionStore: process-local, bounded in messages per session and
+  total memory (default, single worker only).
+- SqliteSessionStore: local SQLite file in WAL mode, shared by all workers
+  on one machine.
+- RedisSessionStore: any server speaking the Redis protocol (Redis, Valkey,
+  KeyDB, or a local stand-in), shared across machines. Requires the
+  optional `redis` package.
+
+Messages are dicts with keys role, content, timestamp and tokens (an
+estimate). Each session can also carry a running summary of the turns
+before `summary_until` (a message timestamp).
+"""
+
+import sys
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+from collections.abc import Callable
+from itertools import islice
+from typing import Any
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+class _Message:
+    __slots__ = ("role", "content", "timestamp", "tokens")
+
+    def __init__(self, role: str, content: str, timestamp: float, tokens: int | None) -> None:
+        # Roles come from a tiny set; interning shares one string per role
+        self.role = sys.intern(role)
+        self.content = content
+        self.timestamp = timestamp
+        self.tokens = tokens
+
+    def as_dict(self) -> dict[str, Any]:
+        message = {"role": self.role, "content": self.content, "timestamp": self.timestamp}
+        if self.tokens is not None:
+            message["tokens"] = self.tokens
+        return message
+
+    def size(self) -> int:
+        return sys.getsizeof(self.content) + _MESSAGE_OVERHEAD
+
+
+class _Session:
+    __slots__ = ("messages", "counts", "created_at", "last_active", "summary", "summary_until", "size")
+
+    def __init__(self, now: float, max_messages: int) -> None:
+        self.messages: deque[_Message] = deque(maxlen=max_messages)
+        # Per-role totals, including messages already dropped from the buffer
+        self.counts: dict[str, int] = {}
+        self.created_at = now
+        self.last_active = now
+        self.summary: str | None = None
+        self.summary_until = 0.0
+        self.size = _SESSION_OVERHEAD
+
+
+# Approximate bytes per message / session beyond the message text
+# (slotted objects, floats, deque and dict slots)
+_MESSAGE_OVERHEAD = 120
+_SESSION_OVERHEAD = 600
+
+
+class MemorySessionStore:
+    """In-process session storage.
+
+    Sessions sit in an OrderedDict ordered by last activity, which serves
+    both expiry (expired sessions are at the front) and LRU eviction when
+    the approximate memory use passes `max_bytes`. Each session keeps its
+    last `max_messages` messages in a ring buffer.
+    """
+
+    def __init__(self, max_messages: int = 50, max_bytes: int = 64 * 1024 * 1024) -> None:
+        self._sessions: OrderedDict[str, _Session] = OrderedDict()
+        self._max_messages = max_messages
+        self._max_bytes = max_bytes
+        self._bytes = 0
+        # Called with the id of each session dropped by eviction or expiry
+        # (the session journal records them as deletes)
+        self.on_evict: Callable[[str], None] | None = None
+
+    def _touch(self, session_id: str, now: float) -> _Session:
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = _Session(now, self._max_messages)
+            self._bytes += session.size
+        else:
+            session.last_active = now
+            self._sessions.move_to_end(session_id)
+        return session
+
+    def _drop(self, session_id: str) -> None:
+        session = self._sessions.pop(session_id, None)
+        if session is not None:
+            self._bytes -= session.size
+
+    def _evict(self, session_id: str) -> None:
+        self._drop(session_id)
+        if self.on_evict:
+            self.on_evict(session_id)
+
+    def touch(self, session_id: str) -> None:
+        self._touch(session_id, time.time())
+
+    def get_or_create(self, session_id: str) -> dict[str, Any]:
+        session = self._touch(session_id, time.time())
+        return {
+            "messages": [m.as_dict() for m in session.messages],
+            "created_at": session.created_at,
+            "last_active": session.last_active,
+        }
+
+    def append(self, session_id: str, message: dict[str, Any]) -> None:
+        session = self._touch(session_id, time.time())
+        item = _Message(message["role"], message["content"], message["timestamp"], message.get("tokens"))
+        growth = item.size()
+        if len(session.messages) == session.messages.maxlen:
+            # The ring buffer is about to drop its oldest message
+            growth -= session.messages[0].size()
+        session.messages.append(item)
+        session.counts[item.role] = session.counts.get(item.role, 0) + 1
+
+        session.size += growth
+        self._bytes += growth
+        # Evict least recently active sessions (never the current one)
+        while self._bytes > self._max_bytes and len(self._sessions) > 1:
+            self._evict(next(iter(self._sessions)))
+
+    def recent(self, session_id: str, limit: int) -> list[dict[str, Any]]:
+        session = self._sessions.get(session_id)
+        if not session:
+            return []
+        n = len(session.messages)
+        return [m.as_dict() for m in islice(session.messages, max(0, n - limit), n)]
+
+    def count(self, session_id: str, role: str) -> int:
+        session = self._sessions.get(session_id)
+        if not session:
+            return 0
+        return session.counts.get(role, 0)
+
+    def get_summary(self, session_id: str) -> tuple[str, float] | None:
+        session = self._sessions.get(session_id)
+        if not session or session.summary is None:
+            return None
+        return session.summary, session.summary_until
+
+    def set_summary(self, session_id: str, summary: str, until: float) -> None:
+        session = self._sessions.get(session_id)
+        if session:
+            old = sys.getsizeof(session.summary) if session.summary is not None else 0
+            session.summary, session.summary_until = summary, until
+            session.size += sys.getsizeof(summary) - old
+            self._bytes += sys.getsizeof(summary) - old
+
+    def delete(self, session_id: str) -> None:
+        self._drop(session_id)
+
+    def cleanup(self, ttl: float) -> int:
+        """Drop sessions idle for more than ttl seconds. Only the expired
+        sessions (at the front of the activity order) are visited."""
+        cutoff = time.time() - ttl
+        removed = 0
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.last_active >= cutoff:
+                break
+            self._evict(session_id)
+            removed += 1
+        return removed
+
+    def memory_usage(self) -> int:
+        """Approximate bytes held by all sessions."""
+        return self._bytes
+
+    def export(self) -> dict[str, dict[str, Any]]:
+        """Copy of every session's state, least recently active first
+        (the format used by session_journal)."""
+        return {
+            session_id: {
+                "created_at": session.created_at,
+                "last_active": session.last_active,
+                "counts": dict(session.counts),
+                "messages": [m.as_dict() for m in session.messages],
+                "summary": session.summary,
+                "summary_until": session.summary_until,
+            }
+            for session_id, session in self._sessions.items()
+        }
+
+    def restore(self, session_id: str, state: dict[str, Any]) -> None:
+        """Insert a session from an exported/replayed state as the most
+        recently active one."""
+        self._drop(session_id)
+        session = _Session(state["created_at"], self._max_messages)
+        session.last_active = state["last_active"]
+        session.counts = dict(state["counts"])
+        for message in state["messages"]:
+            item = _Message(message["role"], message["content"], message["timestamp"], message.get("tokens"))
+            if len(session.messages) == session.messages.maxlen:
+                session.size -= session.messages[0].size()
+            session.messages.append(item)
+            session.size += item.size()
+        if state["summary"] is not None:
+            session.summary, session.summary_until = state["summary"], state["summary_until"]
+            session.size += sys.getsizeof(session.summary)
+        self._sessions[session_id] = session
+        self._bytes += session.size
+
+
+class SqliteSessionStore:
+    """Sessions in a local SQLite database, safe to share between worker
+    processes. Each session keeps its last `max_messages` messages; per-role
+    counts cover all of them."""
+
+    def __init__(self, path: str, max_messages: int = 50) -> None:
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self._max_messages = max_messages
+        with self._lock:
+            had_counts = self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'message_counts'"
+            ).fetchone()
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    id TEXT PRIMARY KEY,
+                    created_at REAL NOT NULL,
+                    last_active REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS messages (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id TEXT NOT NULL,
+                    role TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    timestamp REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (session_id, seq);
+                CREATE INDEX IF NOT EXISTS idx_sessions_active ON sessions (last_active);
+                CREATE TABLE IF NOT EXISTS message_counts (
+                    session_id TEXT NOT NULL,
+                    role TEXT NOT NULL,
+                    n INTEGER NOT NULL,
+                    PRIMARY KEY (session_id, role)
+                );
+            """)
+            # Columns added after the first release
+            self._add_column("sessions", "summary", "TEXT")
+            self._add_column("sessions", "summary_until", "REAL")
+            self._add_column("messages", "tokens", "INTEGER")
+            if not had_counts:
+                # Databases from before messages were trimmed: count what is there
+                self._conn.execute(
+                    "INSERT INTO message_counts (session_id, role, n) "
+                    "SELECT session_id, role, COUNT(*) FROM messages GROUP BY session_id, role"
+                )
+
+    def _add_column(self, table: str, column: str, decl: str) -> None:
+        columns = {row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+        if column not in columns:
+            self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+    def _touch(self, session_id: str, now: float) -> None:
+        self._conn.execute(
+            "INSERT INTO sessions (id, created_at, last_active) VALUES (?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET last_active = excluded.last_active",
+            (session_id, now, now),
+        )
+
+    def touch(self, session_id: str) -> None:
+        with self._lock:
+            self._touch(session_id, time.time())
+
+    def get_or_create(self, session_id: str) -> dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            self._touch(session_id, now)
+            created_at, last_active = self._conn.execute(
+                "SELECT created_at, last_active FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+            rows = self._conn.execute(
+                "SELECT role, content, timestamp, tokens FROM messages WHERE session_id = ? ORDER BY seq",
+                (session_id,),
+            ).fetchall()
+        return {
+            "messages": [self._message(row) for row in rows],
+            "created_at": created_at,
+            "last_active": last_active,
+        }
+
+    @staticmethod
+    def _message(row: tuple) -> dict[str, Any]:
+        role, content, timestamp, tokens = row
+        message = {"role": role, "content": content, "timestamp": timestamp}
+        if tokens is not None:
+            message["tokens"] = tokens
+        return message
+
+    def append(self, session_id: str, message: dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._touch(session_id, message["timestamp"])
+                self._conn.execute(
+                    "INSERT INTO messages (session_id, role, content, timestamp, tokens) VALUES (?, ?, ?, ?, ?)",
+                    (session_id, message["role"], message["content"], message["timestamp"], message.get("tokens")),
+                )
+                self._conn.execute(
+                    "INSERT INTO message_counts (session_id, role, n) VALUES (?, ?, 1) "
+                    "ON CONFLICT(session_id, role) DO UPDATE SET n = n + 1",
+                    (session_id, message["role"]),
+                )
+                # Keep the last max_messages
+                self._conn.execute(
+                    "DELETE FROM messages WHERE session_id = ? AND seq <= "
+                    "(SELECT seq FROM messages WHERE session_id = ? ORDER BY seq DESC LIMIT 1 OFFSET ?)",
+                    (session_id, session_id, self._max_messages),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def recent(self, session_id: str, limit: int) -> list[dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT role, content, timestamp, tokens FROM messages WHERE session_id = ? "
+                "ORDER BY seq DESC LIMIT ?",
+                (session_id, limit),
+            ).fetchall()
+        return [self._message(row) for row in reversed(rows)]
+
+    def count(self, session_id: str, role: str) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT n FROM message_counts WHERE session_id = ? AND role = ?",
+                (session_id, role),
+            ).fetchone()
+        return row[0] if row else 0
+
+    def get_summary(self, session_id: str) -> tuple[str, float] | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary, summary_until FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+        if not row or row[0] is None:
+            return None
+        return row[0], row[1]
+
+    def set_summary(self, session_id: str, summary: str, until: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE sessions SET summary = ?, summary_until = ? WHERE id = ?",
+                (summary, until, session_id),
+            )
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM message_counts WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def cleanup(self, ttl: float) -> int:
+        cutoff = time.time() - ttl
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for table in ("messages", "message_counts"):
+                    self._conn.execute(
+                        f"DELETE FROM {table} WHERE session_id IN "
+                        "(SELECT id FROM sessions WHERE last_active < ?)",
+                        (cutoff,),
+                    )
+                removed = self._conn.execute(
+                    "DELETE FROM sessions WHERE last_active < ?", (cutoff,)
+                ).rowcount
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return removed
+
+
+class RedisSessionStore:
+    """Sessions in a Redis-protocol server. Expiry is delegated to key TTLs.
+
+    Keys per session:
+      chat:session:<id>   hash with created_at, last_active, per-role counts
+                          and the summary
+      chat:messages:<id>  list of the last `max_messages` JSON-encoded messages
+    """
+
+    def __init__(self, url: str, ttl: float, max_messages: int = 50) -> None:
+        if redis is None:
+            raise RuntimeError("session_store='redis' requires the 'redis' package (pip install redis)")
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._ttl = int(ttl)
+        self._max_messages = max_messages
+
+    @staticmethod
+    def _keys(session_id: str) -> tuple[str, str]:
+        return f"chat:session:{session_id}", f"chat:messages:{session_id}"
+
+    def touch(self, session_id: str) -> None:
+        meta_key, messages_key = self._keys(session_id)
+        now = time.time()
+        pipe = self._redis.pipeline()
+        pipe.hsetnx(meta_key, "created_at", now)
+        pipe.hset(meta_key, "last_active", now)
+        pipe.expire(meta_key, self._ttl)
+        pipe.expire(messages_key, self._ttl)
+        pipe.execute()
+
+    def get_or_create(self, session_id: str) -> dict[str, Any]:
+        meta_key, messages_key = self._keys(session_id)
+        now = time.time()
+        pipe = self._redis.pipeline()
+        pipe.hsetnx(meta_key, "created_at", now)
+        pipe.hset(meta_key, "last_active", now)
+        pipe.expire(meta_key, self._ttl)
+        pipe.expire(messages_key, self._ttl)
+        pipe.hgetall(meta_key)
+        pipe.lrange(messages_key, 0, -1)
+        *_, meta, raw_messages = pipe.execute()
+        return {
+            "messages": [json.loads(m) for m in raw_messages],
+            "created_at": float(meta["created_at"]),
+            "last_active": float(meta["last_active"]),
+        }
+
+    def append(self, session_id: str, message: dict[str, Any]) -> None:
+        meta_key, messages_key = self._keys(session_id)
+        pipe = self._redis.pipeline()
+        pipe.hsetnx(meta_key, "created_at", message["timestamp"])
+        pipe.hset(meta_key, "last_active", message["timestamp"])
+        pipe.hincrby(meta_key, f"count:{message['role']}", 1)
+        pipe.rpush(messages_key, json.dumps(message))
+        pipe.ltrim(messages_key, -self._max_messages, -1)
+        pipe.expire(meta_key, self._ttl)
+        pipe.expire(messages_key, self._ttl)
+        pipe.execute()
+
+    def recent(self, session_id: str, limit: int) -> list[dict[str, Any]]:
+        _, messages_key = self._keys(session_id)
+        return [json.loads(m) for m in self._redis.lrange(messages_key, -limit, -1)]
+
+    def count(self, session_id: str, role: str) -> int:
+        meta_key, _ = self._keys(session_id)
+        return int(self._redis.hget(meta_key, f"count:{role}") or 0)
+
+    def get_summary(self, session_id: str) -> tuple[str, float] | None:
+        meta_key, _ = self._keys(session_id)
+        summary, until = self._redis.hmget(meta_key, "summary", "summary_until")
+        if summary is None:
+            return None
+        return summary, float(until)
+
+    def set_summary(self, session_id: str, summary: str, until: float) -> None:
+        meta_key, _ = self._keys(session_id)
+        if self._redis.exists(meta_key):
+            self._redis.hset(meta_key, mapping={"summary": summary, "summary_until": until})
+
+    def delete(self, session_id: str) -> None:
+        self._redis.delete(*self._keys(session_id))
+
+    def cleanup(self, ttl: float) -> int:
+        """Nothing to do: Redis expires idle sessions itself."""
+        return 0
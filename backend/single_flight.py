@@ -0,0 +1,82 @@
+"""Single-flight request coalescing.
+
+Concurrent calls with the same key share one execution: the first caller
+starts it as a separate task, later callers attach to it, and everyone
+gets the same result. The shared task is not cancelled when a caller goes
+away, so the remaining waiters still get their answer.
+"""
+
+import asyncio
+from collections.abc import AsyncIterator, Awaitable, Callable, Hashable
+
+
+class _Broadcast:
+    """Buffers the chunks of one async iterator and replays them to any
+    number of subscribers, including ones that attach mid-stream."""
+
+    def __init__(self) -> None:
+        self.chunks: list = []
+        self.done = False
+        self.error: BaseException | None = None
+        self._changed = asyncio.Event()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def pump(self, source: AsyncIterator) -> None:
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+
+    async def subscribe(self) -> AsyncIterator:
+        i = 0
+        while True:
+            while i < len(self.chunks):
+                yield self.chunks[i]
+                i += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+
+class SingleFlight:
+    def __init__(self) -> None:
+        self._calls: dict[Hashable, asyncio.Task] = {}
+        self._streams: dict[Hashable, _Broadcast] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable]) -> tuple[object, bool]:
+        """Run fn() unless a call with the same key is in flight.
+        Returns (result, shared), shared being True for callers that
+        attached to an existing call."""
+        task = self._calls.get(key)
+        shared = task is not None
+        if not shared:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._calls.pop(key, None) if self._calls.get(key) is t else None)
+        return await asyncio.shield(task), shared
+
+    async def stream(self, key: Hashable, fn: Callable[[], AsyncIterator]) -> AsyncIterator[tuple[object, bool]]:
+        """Streaming variant of do(): yields (chunk, shared) for the chunks
+        of fn(), which runs once for all concurrent callers with this key."""
+        broadcast = self._streams.get(key)
+        shared = broadcast is not None
+        if not shared:
+            broadcast = _Broadcast()
+            self._streams[key] = broadcast
+            task = asyncio.ensure_future(broadcast.pump(fn()))
+            task.add_done_callback(lambda t: self._streams.pop(key, None) if self._streams.get(key) is broadcast else None)
+        async for chunk in broadcast.subscribe():
+            yield chunk, shared
+
+    def inflight(self) -> int:
+        return len(self._calls) + len(self._streams)
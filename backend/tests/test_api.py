@@ -1,6 +1,7 @@
 """Tests for API endpoints."""
 
 import sys
+import json
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -10,10 +11,26 @@ from fastapi.testclient import TestClient
 
 
 @pytest.fixture(scope="module")
-def client():
+def client(tmp_path_factory):
+    from config import settings
     from main import app
-    with TestClient(app) as c:
-        yield c
+
+    # Keep the app's databases and journal out of the source tree
+    tmp = tmp_path_factory.mktemp("app_data")
+    paths = {
+        "leads_db_path": str(tmp / "leads.db"),
+        "session_db_path": str(tmp / "sessions.db"),
+        "session_journal_path": str(tmp / "session_journal"),
+    }
+    old = {name: getattr(settings, name) for name in paths}
+    for name, path in paths.items():
+        setattr(settings, name, path)
+    try:
+        with TestClient(app) as c:
+            yield c
+    finally:
+        for name, path in old.items():
+            setattr(settings, name, path)
 
 
 def test_health_endpoint(client):
@@ -50,6 +67,52 @@ def test_eventitans_chat(client):
     assert len(data["message"]) > 0
 
 
+def test_ticket99_chat_stream(client):
+    resp = client.post("/api/ticket99/chat/stream", json={
+        "message": "hello",
+        "sessionId": "test_stream_session",
+    })
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/event-stream")
+
+    events = [block for block in resp.text.split("\n\n") if block.strip()]
+    assert events[-1].startswith("event: done")
+    done = json.loads(events[-1].split("data: ", 1)[1])
+    assert done["success"] is True
+    assert done["sessionId"] == "test_stream_session"
+    assert len(done["message"]) > 0
+    assert "[SHOW_LEAD_FORM" not in done["message"]
+
+
+def test_chat_stream_disconnect_keeps_partial_reply(monkeypatch):
+    import asyncio
+    import main
+    from conversation_manager import get_recent_history
+
+    async def fake_stream(brand, message, session_id):
+        yield "Tickets go on sale "
+        yield "at noon."
+        yield " More details follow."
+
+    class FakeRequest:
+        async def json(self):
+            return {"message": "when do tickets go on sale?", "sessionId": "test_stream_disconnect"}
+
+    async def run():
+        response = await main._handle_chat_stream("ticket99", FakeRequest())
+        events = response.body_iterator
+        await events.__anext__()
+        # The client goes away after the first token
+        await events.aclose()
+        await asyncio.sleep(0.05)
+
+    monkeypatch.setattr(main, "stream_response", fake_stream)
+    asyncio.run(run())
+    history = get_recent_history("test_stream_disconnect")
+    assert [m["role"] for m in history] == ["user", "assistant"]
+    assert history[1]["content"].startswith("Tickets go on sale")
+
+
 def test_chat_empty_message(client):
     resp = client.post("/api/ticket99/chat", json={
         "message": "",
@@ -90,3 +153,13 @@ def test_demo_page(client):
     resp = client.get("/demo")
     assert resp.status_code == 200
     assert "Dual-Brand" in resp.text
+
+
+def test_metrics_endpoint(client):
+    client.post("/api/ticket99/chat", json={"message": "hello", "sessionId": None})
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+    assert "chatbot_chat_requests_total{" in resp.text
+    assert "# TYPE chatbot_request_seconds histogram" in resp.text
+    assert "chatbot_llm_inflight " in resp.text
@@ -53,6 +53,16 @@ def test_word_boundary_no_false_positive():
     assert _has_keyword("what is the rate", set(), ["rate"])
 
 
+def test_classify_all_returns_every_intent():
+    from intent_classifier import classify_all
+    matches = classify_all("Hi! I want my money back for the Hyderabad show")
+    assert [name for name, _ in matches] == ["greeting", "refund", "pricing", "cities"]
+    assert all(0.5 <= score <= 1.0 for _, score in matches)
+    # Single-word keywords still need word boundaries ("hy" in "hyderabad")
+    assert classify_all("hyderabad") == [("cities", matches[3][1])]
+    assert classify_all("integrate with api") == []
+
+
 def test_phrase_matching():
     """Multi-word phrases use substring matching."""
     from intent_classifier import _has_keyword
@@ -96,3 +106,895 @@ def test_conversation_manager():
 
     clear_session(sid)
     assert get_recent_history(sid) == []
+
+
+def test_extract_lead_form():
+    from rag_chain import extract_lead_form
+    clean, form = extract_lead_form("Sure, let me connect you! [SHOW_LEAD_FORM:organizer]")
+    assert clean == "Sure, let me connect you!"
+    assert form == "organizer"
+    assert extract_lead_form("No marker here") == ("No marker here", None)
+
+
+def test_lead_form_filter_streaming():
+    """The marker is removed even when split across streamed chunks."""
+    from rag_chain import LeadFormFilter
+    f = LeadFormFilter()
+    chunks = ["Great [choice]! Fill ", "this in [SHOW_", "LEAD_FO", "RM:partner", "] thanks"]
+    out = "".join(f.feed(c) for c in chunks) + f.flush()
+    assert out == "Great [choice]! Fill this in  thanks"
+    assert f.form == "partner"
+
+
+def test_semantic_cache_lookup_and_invalidate():
+    import response_cache
+
+    response_cache.invalidate()
+    response_cache.store("ticket99", "how much does it cost?", [1.0, 0.0, 0.0], "2-5% commission.")
+
+    # Near-identical embedding hits, unrelated one misses
+    assert response_cache.lookup("ticket99", [0.99, 0.05, 0.0]) == "2-5% commission."
+    assert response_cache.lookup("ticket99", [0.0, 1.0, 0.0]) is None
+    # Cache is per brand and per language
+    assert response_cache.lookup("eventitans", [1.0, 0.0, 0.0]) is None
+    assert response_cache.lookup("ticket99", [1.0, 0.0, 0.0], language="hi") is None
+
+    response_cache.invalidate("ticket99")
+    assert response_cache.lookup("ticket99", [1.0, 0.0, 0.0]) is None
+
+
+def test_query_embedding_memoized():
+    import asyncio
+    import vector_store
+
+    first = vector_store.embed_query("How much does it cost?")
+    # Normalized variants reuse the memoized vector
+    assert vector_store.embed_query("  how much   DOES it cost?") is first
+    assert asyncio.run(vector_store.embed_query_async("how much does it cost?")) is first
+    assert len(first) == 384
+
+
+def test_embedding_batcher_groups_concurrent_queries():
+    import asyncio
+    from vector_store import _EmbeddingBatcher
+
+    calls = []
+
+    def fake_encode(texts):
+        calls.append(list(texts))
+        return [[float(len(t))] for t in texts]
+
+    async def run():
+        batcher = _EmbeddingBatcher(fake_encode, window_ms=20, max_batch=8)
+        queries = ["hi", "pricing", "hi", "refund policy", "cities"]
+        return await asyncio.gather(*(batcher.embed(q) for q in queries))
+
+    results = asyncio.run(run())
+    assert results == [[2.0], [7.0], [2.0], [13.0], [6.0]]
+    # One encode call, duplicates encoded once
+    assert calls == [["hi", "pricing", "refund policy", "cities"]]
+
+
+def test_vector_store_incremental_sync():
+    """A second sync with unchanged knowledge files embeds nothing."""
+    import vector_store
+
+    vector_store.initialize()
+    assert vector_store.rebuild_collection("ticket99") == (0, 0)
+    assert vector_store.rebuild_collection("unknown_brand") == (0, 0)
+
+
+def test_numpy_index_roundtrip(tmp_path):
+    """NumPy backend persists, reloads and ranks like a cosine index."""
+    from index_backends import NumpyIndex
+
+    index = NumpyIndex(str(tmp_path))
+    index.upsert(
+        "kb",
+        ids=["a", "b", "c"],
+        embeddings=[[1.0, 0.0], [0.0, 2.0], [1.0, 1.0]],
+        documents=["A", "B", "C"],
+        metadatas=[{"answer": "A"}, {"answer": "B"}, {"answer": "C"}],
+    )
+    index.commit("kb")
+
+    reader = NumpyIndex(str(tmp_path))
+    results = reader.query("kb", [1.0, 0.1], top_k=2)
+    assert [m["answer"] for m, _ in results] == ["A", "C"]
+    assert abs(results[0][1] - (1 - 1 / (1.01 ** 0.5))) < 1e-5
+
+    index.delete("kb", ["a"])
+    index.upsert("kb", ids=["b"], embeddings=[[1.0, 0.0]], documents=["B2"], metadatas=[{"answer": "B2"}])
+    index.commit("kb")
+    assert reader.count("kb") == 2
+    assert reader.query("kb", [1.0, 0.0], top_k=1)[0][0]["answer"] == "B2"
+    assert reader.query("missing", [1.0, 0.0], top_k=3) == []
+
+    # The previous matrix outlives one commit, for readers of the old JSON
+    index.delete("kb", ["c"])
+    index.commit("kb")
+    assert len(list(tmp_path.glob("kb.*.npy"))) == 2
+    assert reader.count("kb") == 1
+
+
+def test_sqlite_session_store(tmp_path):
+    """SQLite sessions are shared between store instances (i.e. workers)."""
+    from session_store import SqliteSessionStore
+
+    path = str(tmp_path / "sessions.db")
+    worker_a = SqliteSessionStore(path)
+    worker_b = SqliteSessionStore(path)
+
+    worker_a.get_or_create("s1")
+    for i, role in enumerate(["user", "assistant", "user"]):
+        worker_a.append("s1", {"role": role, "content": f"m{i}", "timestamp": 1000.0 + i})
+
+    assert [m["content"] for m in worker_b.recent("s1", 2)] == ["m1", "m2"]
+    assert worker_b.count("s1", "user") == 2
+    assert len(worker_b.get_or_create("s1")["messages"]) == 3
+
+    worker_a.set_summary("s1", "User asked about m0.", 1000.0)
+    assert worker_b.get_summary("s1") == ("User asked about m0.", 1000.0)
+
+    assert worker_b.cleanup(ttl=3600) == 0
+    worker_b.delete("s1")
+    assert worker_a.recent("s1", 6) == []
+
+    # Only the last max_messages are kept; counts cover every message
+    bounded = SqliteSessionStore(path, max_messages=4)
+    bounded.touch("s2")
+    for i in range(10):
+        bounded.append("s2", {"role": "user", "content": f"q{i}", "timestamp": 2000.0 + i})
+    assert [m["content"] for m in bounded.get_or_create("s2")["messages"]] == ["q6", "q7", "q8", "q9"]
+    assert bounded.count("s2", "user") == 10
+
+
+def test_semantic_intent_centroids():
+    """Centroids are built from keywords + examples and matched by cosine."""
+    import intent_classifier
+    from config import INTENT_DEFINITIONS
+
+    names = list(INTENT_DEFINITIONS)
+
+    def fake_encode(texts):
+        # One axis per intent: every text of an intent maps to that axis
+        lookup = {}
+        for i, name in enumerate(names):
+            for text in INTENT_DEFINITIONS[name]["keywords"] + INTENT_DEFINITIONS[name].get("examples", []):
+                lookup.setdefault(text, i)
+        return [[1.0 if j == lookup[t] else 0.0 for j in range(len(names))] for t in texts]
+
+    intent_classifier.build_intent_centroids(fake_encode)
+    try:
+        query = [0.0] * len(names)
+        query[names.index("refund")] = 0.9
+        query[names.index("cancel")] = 0.3
+        intent, score = intent_classifier.classify_intent_semantic(query)
+        assert intent == "refund"
+        assert score > 0.9
+
+        # Nothing close enough -> no intent
+        assert intent_classifier.classify_intent_semantic([1.0] * len(names)) == (None, 0.0)
+    finally:
+        intent_classifier._centroids = None
+
+
+def test_fast_path_policy():
+    from rag_chain import _fast_path_intent
+    from intent_classifier import classify_all
+
+    def fast(message, brand="ticket99"):
+        return _fast_path_intent(brand, message, classify_all(message))
+
+    assert fast("hello") == "greeting"
+    assert fast("thanks a lot!") == "gratitude"
+    # Mixed intents and long messages go through the full pipeline
+    assert fast("hi, how much does it cost?") is None
+    assert fast("hi there, I have a few questions about your platform today") is None
+    assert fast("refund") is None
+    assert fast("hello", brand="unknown") is None
+
+
+def test_fast_path_skips_retrieval_and_llm():
+    """Canned intents are answered without embedding or calling Ollama."""
+    import asyncio
+    import metrics
+    import vector_store
+    from rag_chain import generate_response
+
+    metrics.reset()
+    answer = asyncio.run(generate_response("ticket99", "bye!", "test_fast_path"))
+    assert "Goodbye" in answer
+    assert metrics.counter_totals("chat_requests", by="path") == {"fast_path": 1}
+    assert "bye!" not in vector_store._query_embeddings
+
+
+def test_prompt_template_cached_and_hot_reloaded(tmp_path):
+    import os
+    from prompt_templates import load_template, render_system_prompt, system_prefix
+
+    path = tmp_path / "brand_system.txt"
+    path.write_text("You are v1.", encoding="utf-8")
+    assert load_template(str(path)) == "You are v1."
+
+    path.write_text("You are v2.", encoding="utf-8")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert load_template(str(path)) == "You are v2."
+    assert load_template(str(tmp_path / "missing.txt")) is None
+
+    # Static prefix first, per-request sections after it
+    prompt = render_system_prompt("ticket99", [{"question": "Q?", "answer": "A."}], "pricing", "hi")
+    assert prompt.startswith(system_prefix("ticket99"))
+    assert "1. Q: Q?\n   A: A." in prompt
+    assert prompt.endswith("You MUST respond in the same language.")
+
+
+def test_llm_admission_queue_priority_and_shedding():
+    import asyncio
+    import pytest
+    from llm_admission import AdmissionController, AdmissionRejected
+
+    async def run():
+        ctl = AdmissionController(max_inflight=1, max_queue=2, queue_timeout=5, wait_budget=100)
+        order = []
+
+        async def job(name, priority):
+            async with ctl.slot(priority):
+                order.append(name)
+                await asyncio.sleep(0.01)
+
+        await ctl.acquire()  # occupy the only slot
+        low = asyncio.create_task(job("low", 2))
+        high = asyncio.create_task(job("high", 0))
+        await asyncio.sleep(0)
+        assert ctl.stats()["queued"] == 2
+
+        # Queue full -> rejected immediately
+        with pytest.raises(AdmissionRejected):
+            await ctl.acquire()
+
+        ctl.release(held_for=1.0)
+        await asyncio.gather(low, high)
+        assert order == ["high", "low"]
+        assert ctl.inflight == 0
+
+        # Predicted wait over budget -> rejected without queueing
+        ctl.wait_budget = 0.5
+        await ctl.acquire()
+        with pytest.raises(AdmissionRejected):
+            await ctl.acquire()
+        ctl.release()
+        assert ctl.stats()["rejected"] == 2
+
+    asyncio.run(run())
+
+
+def test_circuit_breaker_opens_and_half_opens():
+    from circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=lambda: now[0])
+    breaker.record_failure()
+    assert breaker.allow() and breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN and not breaker.allow()
+
+    # After the reset timeout exactly one trial is let through
+    now[0] = 10
+    assert breaker.allow() and breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    # A trial that ends without an outcome (a 4xx) is released
+    now[0] = 20
+    assert breaker.allow() and not breaker.allow()
+    breaker.release_trial()
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.allow()
+
+
+def test_open_circuit_serves_fallback_without_calling_ollama():
+    import asyncio
+    import rag_chain
+
+    class Unreachable:
+        async def post(self, *args, **kwargs):
+            raise AssertionError("Ollama should not be called while the circuit is open")
+
+    breakers = [endpoint.breaker for endpoint in rag_chain._pool.endpoints]
+    saved_client = rag_chain._http_client
+    rag_chain._http_client = Unreachable()
+    rag_chain._http_client.is_closed = False
+    for breaker in breakers:
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+    try:
+        answer = asyncio.run(rag_chain.generate_response("ticket99", "what are your service charges for events", "cb-test"))
+        assert answer
+    finally:
+        rag_chain._http_client = saved_client
+        for breaker in breakers:
+            breaker.record_success()
+
+
+def test_endpoint_pool_least_outstanding_and_ejection():
+    import pytest
+    from llm_pool import EndpointPool, NoEndpointAvailable
+
+    pool = EndpointPool(["http://a:11434", "http://b:11434/"], failure_threshold=1, reset_timeout=60)
+    a, b = pool.endpoints
+    assert b.url == "http://b:11434"
+
+    with pool.track(a):
+        assert pool.pick("phi3:mini") is b
+    # Equal load: lower latency EWMA wins
+    a.latency, b.latency = 2.0, 1.0
+    assert pool.pick("phi3:mini") is b
+
+    # Endpoints known not to serve the model are skipped
+    b.models = {"qwen2.5:1.5b"}
+    assert pool.pick("phi3:mini") is a
+    assert pool.pick("qwen2.5:1.5b") is b
+    b.models = None
+
+    # Failing node is ejected
+    a.breaker.record_failure()
+    assert pool.pick("phi3:mini") is b
+    b.breaker.record_failure()
+    with pytest.raises(NoEndpointAvailable):
+        pool.pick("phi3:mini")
+    assert not pool.healthy()
+
+    # A half-open trial that ends in neither success nor failure (a 4xx)
+    # does not keep the endpoint blocked
+    a.breaker.opened_at -= 60
+    assert pool.pick("phi3:mini") is a
+    with pytest.raises(NoEndpointAvailable):
+        pool.pick("phi3:mini")
+    with pool.track(a):
+        pass
+    assert pool.pick("phi3:mini") is a
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    import asyncio
+    from single_flight import SingleFlight
+
+    async def run():
+        flights = SingleFlight()
+        calls = []
+
+        async def answer():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "shared answer"
+
+        results = await asyncio.gather(*(flights.do(("ticket99", "is the event cancelled?"), answer) for _ in range(5)))
+        assert len(calls) == 1
+        assert [r for r, _ in results] == ["shared answer"] * 5
+        assert sum(shared for _, shared in results) == 4
+        assert flights.inflight() == 0
+
+        async def chunks():
+            calls.append(1)
+            for part in ["No, ", "it is ", "on."]:
+                await asyncio.sleep(0.01)
+                yield part
+
+        async def consume(delay):
+            await asyncio.sleep(delay)
+            return [c async for c, _ in flights.stream("key", chunks)]
+
+        # A late subscriber gets the chunks it missed replayed
+        streams = await asyncio.gather(consume(0), consume(0.015))
+        assert len(calls) == 2
+        assert streams == [["No, ", "it is ", "on."]] * 2
+
+    asyncio.run(run())
+
+
+def test_history_token_budget_and_summary():
+    from conversation_manager import (
+        add_message, get_recent_history, set_summary, clear_session, get_unsummarized_messages,
+    )
+
+    sid = "test_budget_session"
+    clear_session(sid)
+    add_message(sid, "user", "first question")
+    add_message(sid, "assistant", "word " * 400)  # ~500 tokens
+    add_message(sid, "user", "short follow-up")
+
+    assert len(get_recent_history(sid)) == 3
+    # The long answer does not fit, so it and everything before it is dropped
+    assert get_recent_history(sid, token_budget=100) == [{"role": "user", "content": "short follow-up"}]
+
+    first = get_unsummarized_messages(sid)[0]
+    set_summary(sid, "User asked a first question.", first["timestamp"])
+    assert len(get_recent_history(sid)) == 2
+    assert get_unsummarized_messages(sid)[0]["role"] == "assistant"
+    clear_session(sid)
+
+
+def test_build_prompt_budget_no_duplicate_message():
+    from config import settings
+    from conversation_manager import add_message, set_summary, clear_session
+    from rag_chain import _build_prompt
+
+    sid = "test_prompt_session"
+    clear_session(sid)
+    add_message(sid, "user", "hello")
+    add_message(sid, "assistant", "Hi! How can I help?")
+    add_message(sid, "user", "what is the refund policy")
+
+    context = [{"question": f"Q{i}", "answer": "refund " * 200, "category": "refund", "distance": 0.3} for i in range(3)]
+    messages = _build_prompt("ticket99", "what is the refund policy", sid, "refund", "en", context)
+    contents = [m["content"] for m in messages]
+    assert contents.count("what is the refund policy") == 1
+    assert contents[-3:] == ["hello", "Hi! How can I help?", "what is the refund policy"]
+
+    # Tight budget: RAG context is trimmed to one chunk and history dropped
+    saved = settings.prompt_token_budget
+    settings.prompt_token_budget = 600
+    try:
+        messages = _build_prompt("ticket99", "what is the refund policy", sid, "refund", "en", context)
+    finally:
+        settings.prompt_token_budget = saved
+    assert "Q1" not in messages[0]["content"] and "Q0" in messages[0]["content"]
+    assert [m["role"] for m in messages] == ["system", "user"]
+
+    set_summary(sid, "The user greeted us.", 0.0)
+    messages = _build_prompt("ticket99", "what is the refund policy", sid, "refund", "en", context)
+    assert messages[1] == {"role": "system", "content": "Summary of the earlier conversation: The user greeted us."}
+    clear_session(sid)
+
+
+def test_history_summary_uses_brand_model():
+    import asyncio
+    import httpx
+    import rag_chain
+    from config import BRAND_CONFIGS
+    from conversation_manager import add_message, clear_session, get_summary
+
+    models = []
+
+    class FakeClient:
+        is_closed = False
+
+        async def post(self, url, json):
+            models.append(json["model"])
+            request = httpx.Request("POST", url)
+            return httpx.Response(200, json={"message": {"content": "Asked about refunds."}}, request=request)
+
+    sid = "test_summary_model"
+    clear_session(sid)
+    for i in range(12):
+        add_message(sid, "user" if i % 2 == 0 else "assistant", f"turn {i}")
+    saved_client, saved_model = rag_chain._http_client, BRAND_CONFIGS["eventitans"].get("model")
+    rag_chain._http_client = FakeClient()
+    BRAND_CONFIGS["eventitans"]["model"] = "qwen2.5:1.5b"
+    try:
+        asyncio.run(rag_chain._summarize_history("eventitans", sid))
+    finally:
+        rag_chain._http_client = saved_client
+        BRAND_CONFIGS["eventitans"]["model"] = saved_model
+    assert models == ["qwen2.5:1.5b"]
+    assert get_summary(sid) == "Asked about refunds."
+    clear_session(sid)
+
+
+def test_memory_session_store_bounds():
+    import time
+    from session_store import MemorySessionStore
+
+    store = MemorySessionStore(max_messages=3, max_bytes=20_000)
+    for i in range(5):
+        store.append("s1", {"role": "user", "content": f"m{i}", "timestamp": time.time()})
+    # Ring buffer keeps the last 3, counters keep the total
+    assert [m["content"] for m in store.recent("s1", 10)] == ["m2", "m3", "m4"]
+    assert store.count("s1", "user") == 5
+
+    # Memory cap evicts the least recently active session, not the current one
+    store.append("s2", {"role": "user", "content": "x" * 8000, "timestamp": time.time()})
+    store.append("s1", {"role": "user", "content": "again", "timestamp": time.time()})
+    store.append("s3", {"role": "user", "content": "y" * 12000, "timestamp": time.time()})
+    assert store.count("s2", "user") == 0
+    assert store.count("s1", "user") == 6 and store.count("s3", "user") == 1
+    assert store.memory_usage() <= 20_000
+
+    # Expiry visits sessions in activity order
+    store._sessions["s1"].last_active -= 3600
+    store._sessions.move_to_end("s1", last=False)
+    assert store.cleanup(ttl=60) == 1
+    assert store.recent("s1", 10) == [] and store.count("s3", "user") == 1
+    store.delete("s3")
+    assert store.memory_usage() == 0
+
+
+def test_session_journal_replay_and_compaction(tmp_path):
+    import asyncio
+    import time
+    from session_journal import SessionJournal
+    from session_store import MemorySessionStore
+
+    now = time.time()
+    journal = SessionJournal(str(tmp_path))
+    store = MemorySessionStore()
+
+    def add(sid, role, content, ts):
+        message = {"role": role, "content": content, "timestamp": ts}
+        store.append(sid, message)
+        journal.record_append(sid, message)
+
+    async def run():
+        add("live", "user", "hello", now - 10)
+        add("live", "assistant", "hi there", now - 9)
+        add("stale", "user", "old question", now - 7200)
+        add("gone", "user", "bye", now - 5)
+        store.delete("gone")
+        journal.record_delete("gone")
+        await journal.flush()
+        store._sessions["stale"].last_active = now - 7200
+
+        # Compaction folds everything so far into a snapshot
+        await journal.compact(store.export())
+        add("live", "user", "after snapshot", now - 1)
+        journal.record_summary("live", "Greeted.", now - 9)
+        await journal.flush()
+
+    asyncio.run(run())
+    assert len(list(tmp_path.glob("sessions.*.log"))) == 1
+
+    # Torn line from a crash mid-write is ignored
+    with open(next(tmp_path.glob("sessions.*.log")), "a", encoding="utf-8") as f:
+        f.write('{"op": "append", "sid": "live", "m": {"role"')
+
+    states = SessionJournal(str(tmp_path)).replay(ttl=1800, now=now)
+    assert set(states) == {"live"}
+    live = states["live"]
+    assert [m["content"] for m in live["messages"]] == ["hello", "hi there", "after snapshot"]
+    assert live["counts"] == {"user": 2, "assistant": 1}
+    assert live["summary"] == "Greeted."
+
+    restored = MemorySessionStore()
+    restored.restore("live", live)
+    assert restored.count("live", "user") == 2
+    assert restored.get_summary("live") == ("Greeted.", now - 9)
+
+
+def test_session_journal_survives_failed_snapshot_and_records_evictions(tmp_path):
+    import asyncio
+    import time
+    from session_journal import SessionJournal
+    from session_store import MemorySessionStore
+
+    now = time.time()
+    journal = SessionJournal(str(tmp_path))
+    store = MemorySessionStore(max_bytes=2000)
+    store.on_evict = journal.record_delete
+
+    def add(sid, content, ts):
+        message = {"role": "user", "content": content, "timestamp": ts}
+        store.append(sid, message)
+        journal.record_append(sid, message)
+
+    def failing_snapshot(gen, sessions):
+        raise OSError("disk full")
+
+    async def run():
+        await journal.compact(store.export())
+        add("a", "first", now - 3)
+        write_snapshot, journal._write_snapshot = journal._write_snapshot, failing_snapshot
+        try:
+            await journal.compact(store.export())
+        except OSError:
+            pass
+        journal._write_snapshot = write_snapshot
+        # Not in any snapshot, so still queued for the log
+        await journal.flush()
+        assert set(SessionJournal(str(tmp_path)).replay(ttl=1800, now=now)) == {"a"}
+        add("b", "x" * 1500, now - 1)  # evicts "a"
+        await journal.flush()
+
+    asyncio.run(run())
+    assert set(store.export()) == {"b"}
+    assert set(SessionJournal(str(tmp_path)).replay(ttl=1800, now=now)) == {"b"}
+
+    # A snapshot without logs: new records go to a log that replay reads
+    (tmp_path / "snapshot_only").mkdir()
+    asyncio.run(SessionJournal(str(tmp_path / "snapshot_only")).compact({}))
+    for log in (tmp_path / "snapshot_only").glob("*.log"):
+        log.unlink()
+    journal = SessionJournal(str(tmp_path / "snapshot_only"))
+    journal.record_append("c", {"role": "user", "content": "hi", "timestamp": now})
+    journal.flush_sync()
+    assert set(SessionJournal(str(tmp_path / "snapshot_only")).replay(ttl=1800, now=now)) == {"c"}
+
+
+def test_lead_validation():
+    from lead_pipeline import validate_lead
+
+    lead, error = validate_lead({
+        "name": " Asha ", "email": "Asha@Example.com", "phone": "+91 98765-43210",
+        "brand": "ticket99", "type": "organizer", "eventType": "concert", "extra": "dropped",
+    })
+    assert error is None
+    assert lead["email"] == "asha@example.com" and lead["phone"] == "+919876543210"
+    assert lead["eventType"] == "concert" and "extra" not in lead
+
+    assert validate_lead({"name": "A", "email": "not-an-email", "brand": "ticket99"})[1]
+    assert validate_lead({"name": "A", "email": "a@b.co", "brand": "unknown"})[1]
+    assert validate_lead({"name": "A", "email": "a@b.co", "phone": "12", "brand": "eventitans"})[1]
+
+
+def test_lead_pipeline_batches_dedupes_and_retries(tmp_path):
+    import asyncio
+    from lead_pipeline import LeadPipeline, LeadStore, validate_lead
+
+    sent, failures = [], [1]
+
+    async def forward(lead):
+        if failures:
+            failures.pop()
+            raise ConnectionError("CRM down")
+        sent.append(lead["email"])
+
+    def lead(email, phone="", brand="ticket99"):
+        return validate_lead({"name": "X", "email": email, "phone": phone, "brand": brand})[0]
+
+    async def run():
+        store = LeadStore(str(tmp_path / "leads.db"))
+        pipeline = LeadPipeline(store, forward=forward, batch_size=10, flush_interval=0.05)
+        writer = asyncio.create_task(pipeline.run_writer())
+        for item in [
+            lead("a@x.com", "9999999999"),
+            lead("A@x.com"),                      # same email
+            lead("b@x.com", "9999999999"),        # same phone
+            lead("a@x.com", brand="eventitans"),  # other brand: kept
+            lead("c@x.com"),
+        ]:
+            assert pipeline.submit(item)
+        await asyncio.sleep(0.2)
+        writer.cancel()
+        assert store.counts() == {"pending": 3}
+        assert pipeline.duplicates == 2
+
+        # First attempt fails and is scheduled for a retry
+        assert await pipeline.forward_due() == 2
+        assert store.counts() == {"pending": 1, "forwarded": 2}
+        store._conn.execute("UPDATE leads SET next_attempt = 0 WHERE status = 'pending'")
+        assert await pipeline.forward_due() == 1
+        assert store.counts() == {"forwarded": 3}
+
+        # A failed write is retried, even with the queue full again meanwhile
+        store = LeadStore(str(tmp_path / "leads2.db"))
+        insert_batch, calls = store.insert_batch, []
+
+        def flaky_insert(batch):
+            calls.append(len(batch))
+            if len(calls) == 1:
+                raise OSError("disk full")
+            return insert_batch(batch)
+
+        store.insert_batch = flaky_insert
+        pipeline = LeadPipeline(store, forward=forward, queue_size=1, batch_size=10, flush_interval=0.05)
+        writer = asyncio.create_task(pipeline.run_writer())
+        assert pipeline.submit(lead("d@x.com"))
+        await asyncio.sleep(0.02)
+        assert pipeline.submit(lead("e@x.com"))
+        for _ in range(100):
+            if store.counts().get("pending") == 2:
+                break
+            await asyncio.sleep(0.02)
+        writer.cancel()
+        assert store.counts() == {"pending": 2}
+
+        # Without a CRM webhook leads stay pending until one is configured
+        pipeline.forward = None
+        assert await pipeline.forward_due() == 0
+        await pipeline.run_forwarder()
+        assert store.counts() == {"pending": 2}
+        pipeline.forward = forward
+        assert await pipeline.forward_due() == 2
+        assert store.counts() == {"forwarded": 2}
+
+    asyncio.run(run())
+    assert sorted(sent) == ["a@x.com", "a@x.com", "c@x.com", "d@x.com", "e@x.com"]
+
+
+def test_whatsapp_dispatcher_batches_dedupes_and_retries():
+    import asyncio
+    import httpx
+    from whatsapp_handler import WhatsAppDispatcher, extract_messages
+
+    prompts, sent, failures = [], [], [1]
+
+    async def generate(brand, message, session_id, priority=None):
+        prompts.append((brand, message, session_id))
+        return f"Reply to: {message}"
+
+    class FakeClient:
+        async def send_text(self, phone_number_id, to, body):
+            if failures:
+                failures.pop()
+                request = httpx.Request("POST", "http://wa.test")
+                raise httpx.HTTPStatusError("busy", request=request, response=httpx.Response(429, request=request))
+            sent.append((to, body, asyncio.get_running_loop().time()))
+
+    def payload(msg_id, text, sender="919800000001"):
+        return {"entry": [{"changes": [{"value": {
+            "metadata": {"phone_number_id": "123"},
+            "messages": [{"id": msg_id, "from": sender, "type": "text", "text": {"body": text}}],
+        }}]}]}
+
+    async def until(condition, timeout=10.0):
+        async def poll():
+            while not condition():
+                await asyncio.sleep(0.01)
+        await asyncio.wait_for(poll(), timeout)
+
+    async def run():
+        dispatcher = WhatsAppDispatcher(
+            FakeClient(), generate, workers=2, batch_window=0.05, min_interval=0.3, retries=3,
+        )
+        workers = asyncio.create_task(dispatcher.run())
+        for msg_id, text in [("m1", "hi"), ("m2", "any events this weekend?"), ("m1", "hi")]:
+            for message in extract_messages(payload(msg_id, text)):
+                dispatcher.receive(message)
+        await until(lambda: len(sent) == 1)
+        # A second turn from the same sender is spaced by min_interval
+        for message in extract_messages(payload("m3", "thanks")):
+            dispatcher.receive(message)
+        await until(lambda: len(sent) == 2)
+        workers.cancel()
+
+    asyncio.run(run())
+    assert prompts[0] == ("ticket99", "hi\nany events this weekend?", "wa_ticket99_919800000001")
+    assert len(prompts) == 2
+    assert [body for _, body, _ in sent] == ["Reply to: hi\nany events this weekend?", "Reply to: thanks"]
+    assert sent[1][2] - sent[0][2] >= 0.3 - 0.01
+
+
+def test_metrics_histograms_and_prometheus_text():
+    import metrics
+    from rag_chain import _record_ollama_stats
+
+    metrics.reset()
+    with metrics.timer("stage_seconds", stage="embed"):
+        pass
+    metrics.observe("stage_seconds", 0.3, stage="retrieve")
+    metrics.observe("stage_seconds", 7.0, stage="retrieve")
+    metrics.inc("chat_requests", brand="ticket99", path="cache")
+    _record_ollama_stats(
+        {"done": True, "eval_count": 40, "prompt_eval_count": 300,
+         "eval_duration": 2_000_000_000, "prompt_eval_duration": 500_000_000},
+        "phi3:mini",
+    )
+
+    stats = metrics.histogram_stats("stage_seconds", by="stage")
+    assert stats["retrieve"] == {"count": 2, "mean": 3.65}
+    assert stats["embed"]["count"] == 1
+
+    text = metrics.render_prometheus()
+    assert 'chatbot_chat_requests_total{brand="ticket99",path="cache"} 1' in text
+    assert 'chatbot_stage_seconds_bucket{stage="retrieve",le="0.5"} 1' in text
+    assert 'chatbot_stage_seconds_bucket{stage="retrieve",le="+Inf"} 2' in text
+    assert 'chatbot_ollama_eval_tokens_total{model="phi3:mini"} 40' in text
+    assert 'chatbot_ollama_tokens_per_second_bucket{model="phi3:mini",le="20"} 1' in text
+    assert 'chatbot_ollama_duration_seconds_count{model="phi3:mini",phase="prompt_eval"} 1' in text
+    metrics.reset()
+
+
+def test_benchmark_helpers_and_fake_ollama():
+    import json
+    from starlette.testclient import TestClient
+    from benchmarks.common import percentile, latency_summary
+    from benchmarks.fake_ollama import create_app
+
+    values = [i / 100 for i in range(1, 101)]
+    assert percentile(values, 50) == 0.5 and percentile(values, 99) == 0.99
+    assert latency_summary(values)["p95"] == 950.0
+
+    client = TestClient(create_app(tokens_per_second=0, prompt_delay=0, answer="Hello there friend"))
+    assert client.get("/api/tags").json() == {"models": [{"name": "phi3:mini"}]}
+    resp = client.post("/api/chat", json={"messages": [{"role": "user", "content": "hi"}], "stream": True})
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    assert "".join(line["message"]["content"] for line in lines) == "Hello there friend "
+    assert lines[-1]["done"] and lines[-1]["eval_count"] == 3
+
+
+def test_language_detection_script_short_and_session():
+    from language_detection import detect_language, script_language, LATIN
+
+    assert script_language("मुझे टिकट चाहिए") == "hi"
+    assert script_language("டிக்கெட் வேண்டும்") == "ta"
+    assert script_language("price?") == LATIN
+    assert script_language("123 ?!") is None
+
+    # Short messages never get a guessed language
+    assert detect_language("hi") == "en"
+    assert detect_language("price?") == "en"
+    assert detect_language("ఈవెంట్ టిక్కెట్లు", "lang_s1") == "te"
+    assert detect_language("ok", "lang_s1") == "te"
+    assert detect_language("thanks!", "lang_s2") == "en"
+
+    assert detect_language("how much does it cost to list an event?") == "en"
+    assert detect_language("kya aap mujhe concert ke tickets de sakte ho") == "en"
+
+    spanish = "Quiero comprar entradas para el concierto del sábado"
+    assert detect_language(spanish, "lang_s3") == "es"
+    assert detect_language("gracias", "lang_s3") == "es"
+    assert all(detect_language(spanish) == "es" for _ in range(5))
+
+    # Words shared with English ("in", "am", "no", "me", "tickets") don't make a message English
+    assert detect_language("Ich will Tickets für das Konzert am Samstag kaufen") == "de"
+    assert detect_language("Wo ist das Event in Berlin bitte?") == "de"
+    assert detect_language("Quero comprar tickets para o show no sábado") == "pt"
+    # langdetect is unsure about this one; the conversation's language decides
+    assert detect_language("No me gusta, quiero un reembolso a mi tarjeta", "lang_s3") == "es"
+
+
+def test_bm25_ranking_and_rank_fusion():
+    from bm25 import BM25Index, reciprocal_rank_fusion, tokenize
+
+    assert tokenize("How much are the Tickets?") == ["ticket"]
+    index = BM25Index().build([
+        ("a", "Payment processing is 2% + GST on every ticket", {"answer": "fees"}),
+        ("b", "Buy a ticket online and get your ticket by email", {"answer": "buy"}),
+        ("c", "Refunds for cancelled events are automatic", {"answer": "refund"}),
+    ])
+    results = index.search("GST on my ticket", top_k=3)
+    assert [item_id for item_id, *_ in results] == ["a", "b"]
+    assert results[0][3] == 1.0 and 0 < results[1][3] < 0.5
+    assert index.search("weather", top_k=3) == []
+
+    fused = reciprocal_rank_fusion([["x", "y", "z"], ["y", "w"]], k=60)
+    assert [key for key, _ in fused] == ["y", "x", "w", "z"]
+
+
+def test_hybrid_search_finds_exact_terms_and_applies_threshold():
+    import vector_store
+    from config import settings
+
+    vector_store.initialize()
+    results = vector_store.search("ticket99", "GST")
+    assert results and any("GST" in r["answer"] for r in results)
+    assert all(r["distance"] is not None for r in results)
+
+    old = settings.retrieval_max_distance
+    settings.retrieval_max_distance = -1.0
+    try:
+        # Only keyword hits covering the query survive an impossible distance cutoff
+        assert all("GST" in r["answer"] for r in vector_store.search("ticket99", "GST"))
+        assert vector_store.search("ticket99", "what is the weather like on mars?") == []
+    finally:
+        settings.retrieval_max_distance = old
+
+
+def test_chunking_follows_structure_and_token_budget():
+    from chunking import chunk_lines
+
+    count_words = lambda text: len(text.split())
+    document = [
+        "PRICING\n",
+        "\n",
+        "Listing is free. Payment processing is 2% + GST. Payouts are weekly.\n",
+        "\n",
+        "Refunds\n",
+        "=======\n",
+        "Refunds for cancelled events are automatic. They take five to seven days.\n",
+        "Organizers can also refund single tickets from the dashboard.\n",
+        "## Contact\n",
+        "Email info@example.com\n",
+    ]
+    chunks = list(chunk_lines(document, count_words, max_tokens=10, overlap_tokens=4))
+
+    assert [c.section for c in chunks] == ["PRICING", "PRICING", "Refunds", "Refunds", "Refunds", "Contact"]
+    assert all(c.tokens == count_words(c.text) <= 10 for c in chunks)
+    # Split at sentence ends only; the last short sentence is carried over
+    assert chunks[0].text == "Listing is free.\nPayment processing is 2% + GST."
+    assert chunks[1].text == "Payouts are weekly."
+    assert chunks[3].text.startswith("They take five to seven days.")
+    assert chunks[-1].text == "Email info@example.com"
@@ -1,185 +1,525 @@
+import os
+import sys
 import json
+import asyncio
+import hashlib
+from collections import OrderedDict
 from pathlib import Path
 
-import chromadb
-from chromadb.config import Settings as ChromaSettings
 from sentence_transformers import SentenceTransformer
 
 from config import settings, BRAND_CONFIGS
+from index_backends import ChromaIndex, NumpyIndex
+from bm25 import BM25Index, reciprocal_rank_fusion
+from chunking import chunk_file
+import response_cache
 
-_client: chromadb.ClientAPI | None = None
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+# Records the content hash of every indexed item, per brand, so restarts
+# only re-embed what changed in the knowledge files
+MANIFEST_FILE = "index_manifest.json"
+
+_index: ChromaIndex | NumpyIndex | None = None
 _embedder: SentenceTransformer | None = None
+# brand -> BM25 keyword index over the same items as the vector collection
+_keyword_indexes: dict[str, BM25Index] = {}
 
+# normalized query text -> embedding, least recently used first
+_query_embeddings: OrderedDict[str, list[float]] = OrderedDict()
 
-def _get_client() -> chromadb.ClientAPI:
-    global _client
-    if _client is None:
-        _client = chromadb.PersistentClient(
-            path=settings.chroma_db_path,
-            settings=ChromaSettings(anonymized_telemetry=False),
-        )
-    return _client
+
+def _get_index() -> ChromaIndex | NumpyIndex:
+    """Return the configured index backend (settings.vector_backend)."""
+    global _index
+    if _index is None:
+        if settings.vector_backend == "numpy":
+            _index = NumpyIndex(settings.numpy_index_path)
+        elif settings.vector_backend == "chroma":
+            _index = ChromaIndex(settings.chroma_db_path)
+        else:
+            raise ValueError(f"Unknown vector_backend: {settings.vector_backend}")
+    return _index
 
 
 def _get_embedder() -> SentenceTransformer:
     global _embedder
     if _embedder is None:
-        _embedder = SentenceTransformer("all-MiniLM-L6-v2")
+        _embedder = SentenceTransformer(EMBEDDING_MODEL)
     return _embedder
 
 
-def initialize() -> None:
-    """Load FAQ JSON files into brand-specific ChromaDB collections."""
-    client = _get_client()
-    embedder = _get_embedder()
+def _count_tokens(text: str) -> int:
+    """Length of text in embedding model tokens."""
+    return len(_get_embedder().tokenizer(text, add_special_tokens=False)["input_ids"])
 
-    for brand_key, brand_config in BRAND_CONFIGS.items():
-        collection_name = brand_config["collection"]
-        faq_path = Path(brand_config["faq_file"])
 
-        if not faq_path.exists():
-            print(f"  [WARN] FAQ file not found: {faq_path}")
-            continue
+def _chunk_token_limit() -> int:
+    # Leave room in the model's window for the section title and special tokens
+    return min(settings.chunk_max_tokens, _get_embedder().max_seq_length - 32)
+
+
+def _content_hash(document: str, metadata: dict) -> str:
+    payload = json.dumps([document, metadata], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _load_brand_items(brand_key: str, brand_config: dict) -> dict[str, dict]:
+    """Read a brand's FAQ file and docs into {id: {document, metadata, hash}}.
 
-        # Delete existing collection and recreate
+    IDs are derived from the item's source (FAQ question, doc file + chunk
+    number), so an edited item keeps its ID and only its hash changes.
+    """
+    items: dict[str, dict] = {}
+
+    def add(item_id: str, document: str, metadata: dict) -> None:
+        unique_id, n = item_id, 2
+        while unique_id in items:
+            unique_id, n = f"{item_id}_{n}", n + 1
+        items[unique_id] = {
+            "document": document,
+            "metadata": metadata,
+            "hash": _content_hash(document, metadata),
+        }
+
+    with open(brand_config["faq_file"], "r", encoding="utf-8") as f:
+        faqs = json.load(f)
+
+    for faq in faqs:
+        # Combine question and answer for richer embeddings
+        doc_text = f"Q: {faq['question']}\nA: {faq['answer']}"
+        question_key = hashlib.sha1(faq["question"].encode("utf-8")).hexdigest()[:12]
+        add(f"{brand_key}_faq_{question_key}", doc_text, {
+            "question": faq["question"],
+            "answer": faq["answer"],
+            "category": faq.get("category", "general"),
+            "brand": brand_key,
+        })
+
+    # Also load any text docs from the docs directory
+    docs_dir = Path(brand_config["docs_dir"])
+    if docs_dir.exists():
+        limit = _chunk_token_limit()
+        for doc_file in sorted(docs_dir.glob("*.txt")):
+            chunks = chunk_file(doc_file, _count_tokens, limit, settings.chunk_overlap_tokens)
+            for j, chunk in enumerate(chunks):
+                # The section title gives the embedding the chunk's context
+                document = f"{chunk.section}\n{chunk.text}" if chunk.section else chunk.text
+                add(f"{brand_key}_doc_{doc_file.stem}_{j}", document, {
+                    "question": "",
+                    "answer": chunk.text,
+                    "category": "document",
+                    "brand": brand_key,
+                    "source": doc_file.name,
+                    "section": chunk.section,
+                })
+
+    return items
+
+
+def _build_keyword_index(brand_key: str, items: dict[str, dict]) -> None:
+    _keyword_indexes[brand_key] = BM25Index().build(
+        (item_id, item["document"], item["metadata"]) for item_id, item in items.items()
+    )
+
+
+def _manifest_path() -> Path:
+    return _get_index().path / MANIFEST_FILE
+
+
+def _load_manifest() -> dict:
+    """Load the index manifest. Discarded if built with a different embedding model."""
+    path = _manifest_path()
+    if path.exists():
         try:
-            client.delete_collection(collection_name)
-        except Exception:
+            manifest = json.loads(path.read_text(encoding="utf-8"))
+            if manifest.get("model") == EMBEDDING_MODEL:
+                return manifest
+        except (OSError, ValueError):
             pass
+    return {"model": EMBEDDING_MODEL, "brands": {}}
+
+
+def _save_manifest(manifest: dict) -> None:
+    path = _manifest_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(manifest, indent=1), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _sync_brand(brand_key: str, full: bool = False) -> tuple[int, int]:
+    """Bring a brand's collection in line with its knowledge files.
+
+    Only items that are new or whose content hash changed are embedded and
+    upserted; items no longer present are deleted. With full=True (or if the
+    collection does not match the manifest) the collection is rebuilt from
+    scratch. Returns (upserted, deleted).
+    """
+    brand_config = BRAND_CONFIGS[brand_key]
+    collection_name = brand_config["collection"]
+    faq_path = Path(brand_config["faq_file"])
+
+    if not faq_path.exists():
+        print(f"  [WARN] FAQ file not found: {faq_path}")
+        return 0, 0
+
+    index = _get_index()
+    manifest = _load_manifest()
+    indexed: dict[str, str] = manifest["brands"].get(brand_key, {})
+    items = _load_brand_items(brand_key, brand_config)
+    _build_keyword_index(brand_key, items)
+
+    if full or index.count(collection_name) != len(indexed):
+        # Manifest is missing or out of sync with the stored collection
+        index.reset(collection_name)
+        indexed = {}
+
+    changed = [item_id for item_id, item in items.items() if indexed.get(item_id) != item["hash"]]
+    removed = [item_id for item_id in indexed if item_id not in items]
+
+    if removed:
+        index.delete(collection_name, removed)
+
+    # Embed and upsert in batches
+    embedder = _get_embedder()
+    batch_size = 64
+    for start in range(0, len(changed), batch_size):
+        batch_ids = changed[start:start + batch_size]
+        batch_docs = [items[item_id]["document"] for item_id in batch_ids]
+        index.upsert(
+            collection_name,
+            ids=batch_ids,
+            embeddings=embedder.encode(batch_docs).tolist(),
+            documents=batch_docs,
+            metadatas=[items[item_id]["metadata"] for item_id in batch_ids],
+        )
+    index.commit(collection_name)
+
+    manifest["brands"][brand_key] = {item_id: item["hash"] for item_id, item in items.items()}
+    _save_manifest(manifest)
+
+    if changed or removed:
+        print(
+            f"  [OK] {brand_config['name']}: {len(items)} chunks in '{collection_name}' "
+            f"({len(changed)} embedded, {len(removed)} removed)"
+        )
+        # Cached answers may be based on outdated knowledge
+        response_cache.invalidate(brand_key)
+    else:
+        print(f"  [OK] {brand_config['name']}: {len(items)} chunks in '{collection_name}' (up to date)")
+
+    return len(changed), len(removed)
+
+
+def initialize() -> None:
+    """Sync FAQ JSON files and docs into brand-specific index collections.
+
+    Incremental: only new or changed items are embedded. With
+    settings.index_read_only the index is only opened, never written.
+    """
+    if settings.index_read_only:
+        index = _get_index()
+        for brand_key, brand_config in BRAND_CONFIGS.items():
+            # The keyword index is cheap and kept in memory: built from the files
+            if Path(brand_config["faq_file"]).exists():
+                _build_keyword_index(brand_key, _load_brand_items(brand_key, brand_config))
+            count = index.count(brand_config["collection"])
+            if count:
+                print(f"  [OK] {brand_config['name']}: {count} chunks in '{brand_config['collection']}' (read-only)")
+            else:
+                print(f"  [WARN] {brand_config['name']}: index '{brand_config['collection']}' is empty - run the build step")
+        return
+
+    for brand_key in BRAND_CONFIGS:
+        _sync_brand(brand_key)
+
 
-        collection = client.get_or_create_collection(
-            name=collection_name,
-            metadata={"hnsw:space": "cosine"},
+def normalize_query(query: str) -> str:
+    """Canonical form of a query used as a memoization key.
+    MiniLM is uncased, so this does not change the resulting embedding."""
+    return " ".join(query.lower().split())
+
+
+def _cached_embedding(key: str) -> list[float] | None:
+    embedding = _query_embeddings.get(key)
+    if embedding is not None:
+        _query_embeddings.move_to_end(key)
+    return embedding
+
+
+def _remember_embedding(key: str, embedding: list[float]) -> None:
+    _query_embeddings[key] = embedding
+    _query_embeddings.move_to_end(key)
+    while len(_query_embeddings) > settings.embedding_cache_size:
+        _query_embeddings.popitem(last=False)
+
+
+def _encode_query(text: str) -> list[float]:
+    return _get_embedder().encode([text])[0].tolist()
+
+
+def _encode_queries(texts: list[str]) -> list[list[float]]:
+    return _get_embedder().encode(texts).tolist()
+
+
+def embed_texts(texts: list[str]) -> list[list[float]]:
+    """Embed a batch of texts (blocking) with the query embedding model."""
+    return _encode_queries(texts)
+
+
+class _EmbeddingBatcher:
+    """Micro-batches concurrent query embeddings.
+
+    Callers awaiting embed() within the same short window (or until the
+    batch is full) are served by a single encode() call in a worker thread.
+    Identical texts in a batch are only encoded once.
+    """
+
+    def __init__(self, encode_batch, window_ms: float, max_batch: int) -> None:
+        self._encode_batch = encode_batch
+        self._window = window_ms / 1000
+        self._max_batch = max_batch
+        self._pending: list[tuple[str, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def embed(self, text: str) -> list[float]:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Pending futures belong to a previous (closed) loop
+            self._loop, self._pending, self._timer = loop, [], None
+
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self._max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self._window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = self._loop.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: list[tuple[str, asyncio.Future]]) -> None:
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        try:
+            vectors = await self._loop.run_in_executor(None, self._encode_batch, texts)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        by_text = dict(zip(texts, vectors))
+        for text, future in batch:
+            if not future.done():
+                future.set_result(by_text[text])
+
+
+_batcher: _EmbeddingBatcher | None = None
+
+
+def _get_batcher() -> _EmbeddingBatcher:
+    global _batcher
+    if _batcher is None:
+        _batcher = _EmbeddingBatcher(
+            _encode_queries,
+            window_ms=settings.embed_batch_window_ms,
+            max_batch=settings.embed_batch_max_size,
         )
+    return _batcher
+
+
+def embed_query(query: str) -> list[float]:
+    """Embed a user query (blocking). The result can be passed to search() and
+    reused by other consumers (e.g. the semantic response cache)."""
+    key = normalize_query(query)
+    embedding = _cached_embedding(key)
+    if embedding is None:
+        embedding = _encode_query(key)
+        _remember_embedding(key, embedding)
+    return embedding
+
 
-        with open(faq_path, "r", encoding="utf-8") as f:
-            faqs = json.load(f)
-
-        documents = []
-        metadatas = []
-        ids = []
-
-        for i, faq in enumerate(faqs):
-            # Combine question and answer for richer embeddings
-            doc_text = f"Q: {faq['question']}\nA: {faq['answer']}"
-            documents.append(doc_text)
-            metadatas.append({
-                "question": faq["question"],
-                "answer": faq["answer"],
-                "category": faq.get("category", "general"),
-                "brand": brand_key,
-            })
-            ids.append(f"{brand_key}_{i}")
-
-        # Also load any PDF/text docs from the docs directory
-        docs_dir = Path(brand_config["docs_dir"])
-        if docs_dir.exists():
-            doc_idx = len(faqs)
-            for doc_file in docs_dir.glob("*.txt"):
-                content = doc_file.read_text(encoding="utf-8")
-                # Split into chunks of ~500 chars
-                chunks = _chunk_text(content, chunk_size=500, overlap=50)
-                for j, chunk in enumerate(chunks):
-                    documents.append(chunk)
-                    metadatas.append({
-                        "question": "",
-                        "answer": chunk,
-                        "category": "document",
-                        "brand": brand_key,
-                        "source": doc_file.name,
-                    })
-                    ids.append(f"{brand_key}_doc_{doc_idx}_{j}")
-                doc_idx += 1
-
-        if documents:
-            # Embed and add in batches
-            batch_size = 64
-            for start in range(0, len(documents), batch_size):
-                end = min(start + batch_size, len(documents))
-                batch_docs = documents[start:end]
-                batch_embeds = embedder.encode(batch_docs).tolist()
-                collection.add(
-                    documents=batch_docs[: end - start],
-                    embeddings=batch_embeds,
-                    metadatas=metadatas[start:end],
-                    ids=ids[start:end],
-                )
-
-            print(f"  [OK] {brand_config['name']}: {len(documents)} chunks indexed into '{collection_name}'")
-
-
-def search(brand: str, query: str, top_k: int = 3) -> list[dict]:
+async def embed_query_async(query: str) -> list[float]:
+    """Embed a user query without blocking the event loop.
+
+    Repeated queries are served from the memo; otherwise the query joins the
+    current micro-batch and the forward pass runs in a worker thread.
+    """
+    key = normalize_query(query)
+    embedding = _cached_embedding(key)
+    if embedding is None:
+        if settings.embed_batch_window_ms > 0:
+            embedding = await _get_batcher().embed(key)
+        else:
+            loop = asyncio.get_running_loop()
+            embedding = await loop.run_in_executor(None, _encode_query, key)
+        _remember_embedding(key, embedding)
+    return embedding
+
+
+def search(
+    brand: str,
+    query: str,
+    top_k: int = 3,
+    query_embedding: list[float] | None = None,
+) -> list[dict]:
     """Search brand-specific collection for relevant chunks.
 
-    Returns list of dicts with keys: answer, question, category, distance.
-    Filters out results with cosine distance > 1.5.
+    Pass query_embedding to reuse an embedding from embed_query(). In
+    "hybrid" retrieval mode the dense ranking is fused with the brand's
+    BM25 ranking (reciprocal rank fusion). Chunks with a cosine distance
+    above settings.retrieval_max_distance are dropped, except keyword hits
+    covering settings.bm25_min_coverage of the query.
+    Returns list of dicts with keys: answer, question, category, section,
+    distance.
     """
     brand_config = BRAND_CONFIGS.get(brand)
     if not brand_config:
         return []
 
-    client = _get_client()
-    embedder = _get_embedder()
-
-    try:
-        collection = client.get_collection(brand_config["collection"])
-    except Exception:
-        return []
+    if query_embedding is None:
+        query_embedding = embed_query(query)
+
+    collection = brand_config["collection"]
+    index = _get_index()
+    keyword_index = _keyword_indexes.get(brand) if settings.retrieval_mode == "hybrid" else None
+    if keyword_index is None:
+        return [
+            _chunk(metadata, distance)
+            for metadata, distance in index.query(collection, query_embedding, top_k)
+            if distance <= settings.retrieval_max_distance
+        ]
+
+    dense = index.query(collection, query_embedding, settings.retrieval_candidates)
+    keyword = keyword_index.search(query, settings.retrieval_candidates)
+
+    # key -> [metadata, distance, keyword coverage]
+    candidates: dict[tuple, list] = {_item_key(metadata): [metadata, distance, 0.0] for metadata, distance in dense}
+    missing: dict[str, tuple] = {}
+    for item_id, metadata, _score, coverage in keyword:
+        key = _item_key(metadata)
+        if key in candidates:
+            candidates[key][2] = coverage
+        else:
+            candidates[key] = [metadata, None, coverage]
+            missing[item_id] = key
+    if missing:
+        # Keyword-only hits: look up their distance so the threshold applies to them too
+        for item_id, distance in index.distances(collection, query_embedding, list(missing)).items():
+            candidates[missing[item_id]][1] = distance
+
+    fused = reciprocal_rank_fusion(
+        [[_item_key(metadata) for metadata, _ in dense], [_item_key(metadata) for _, metadata, _, _ in keyword]],
+        k=settings.rrf_k,
+    )
+    chunks = []
+    for key, _ in fused:
+        metadata, distance, coverage = candidates[key]
+        # No distance: item not in the vector index yet (read-only index older than the files)
+        distance = 1.0 if distance is None else distance
+        if distance <= settings.retrieval_max_distance or coverage >= settings.bm25_min_coverage:
+            chunks.append(_chunk(metadata, distance))
+            if len(chunks) == top_k:
+                break
+    return chunks
 
-    query_embedding = embedder.encode([query]).tolist()
 
-    results = collection.query(
-        query_embeddings=query_embedding,
-        n_results=top_k,
-        include=["metadatas", "distances"],
-    )
+def _item_key(metadata: dict) -> tuple[str, str]:
+    """Identifies an item across the dense and keyword results."""
+    return (metadata.get("question", ""), metadata.get("answer", ""))
 
-    chunks = []
-    if results and results["metadatas"] and results["distances"]:
-        for metadata, distance in zip(results["metadatas"][0], results["distances"][0]):
-            if distance <= 1.5:
-                chunks.append({
-                    "answer": metadata.get("answer", ""),
-                    "question": metadata.get("question", ""),
-                    "category": metadata.get("category", ""),
-                    "distance": distance,
-                })
 
-    return chunks
+def _chunk(metadata: dict, distance: float) -> dict:
+    return {
+        "answer": metadata.get("answer", ""),
+        "question": metadata.get("question", ""),
+        "category": metadata.get("category", ""),
+        "section": metadata.get("section", ""),
+        "distance": distance,
+    }
 
 
-def rebuild_collection(brand: str) -> None:
-    """Rebuild a single brand's collection."""
-    client = _get_client()
-    brand_config = BRAND_CONFIGS.get(brand)
-    if not brand_config:
-        print(f"  [ERROR] Unknown brand: {brand}")
-        return
+# Questions no brand's knowledge base answers, for calibrate_max_distance()
+_OFF_TOPIC_QUERIES = [
+    "what is the weather today?",
+    "write me a poem about the sea",
+    "who won the cricket match yesterday?",
+    "how do I fix my car engine?",
+    "what is the capital of France?",
+    "recommend a good pasta recipe",
+    "explain quantum physics simply",
+    "how tall is Mount Everest?",
+]
 
-    try:
-        client.delete_collection(brand_config["collection"])
-    except Exception:
-        pass
 
-    initialize()
+def calibrate_max_distance(recall: float = 0.95) -> dict:
+    """Suggest settings.retrieval_max_distance for the current index.
 
+    Each FAQ question is used as a query; the distance to its own entry is
+    a relevant distance. The closest entry to each off-topic query is an
+    irrelevant one. The suggestion keeps `recall` of the relevant chunks and
+    sits halfway to the irrelevant ones when the two do not overlap.
+    """
+    index = _get_index()
+    relevant, irrelevant = [], []
+    for brand_key, brand_config in BRAND_CONFIGS.items():
+        if not Path(brand_config["faq_file"]).exists():
+            continue
+        items = _load_brand_items(brand_key, brand_config)
+        faq_ids = [item_id for item_id, item in items.items() if item["metadata"]["question"]]
+        embeddings = _encode_queries([items[item_id]["metadata"]["question"] for item_id in faq_ids])
+        for item_id, embedding in zip(faq_ids, embeddings):
+            relevant.extend(index.distances(brand_config["collection"], embedding, [item_id]).values())
+        for embedding in _encode_queries(_OFF_TOPIC_QUERIES):
+            irrelevant.extend(distance for _, distance in index.query(brand_config["collection"], embedding, 1))
+
+    relevant.sort()
+    irrelevant.sort()
+    if not relevant:
+        return {}
+    keep = relevant[min(len(relevant) - 1, int(recall * len(relevant)))]
+    closest_irrelevant = irrelevant[0] if irrelevant else 1.0
+    suggested = (keep + closest_irrelevant) / 2 if keep < closest_irrelevant else keep
+    return {
+        "suggested": round(suggested, 3),
+        "relevant": {"median": round(relevant[len(relevant) // 2], 3), f"p{round(recall * 100)}": round(keep, 3)},
+        "irrelevant": {"min": round(closest_irrelevant, 3), "median": round(irrelevant[len(irrelevant) // 2], 3) if irrelevant else None},
+    }
+
+
+def rebuild_collection(brand: str, full: bool = False) -> tuple[int, int]:
+    """Re-sync a single brand's collection. Returns (upserted, deleted).
+
+    Pass full=True to discard the collection and re-embed everything.
+    """
+    if brand not in BRAND_CONFIGS:
+        print(f"  [ERROR] Unknown brand: {brand}")
+        return 0, 0
+    if settings.index_read_only:
+        print(f"  [ERROR] Index is read-only, cannot rebuild {brand}")
+        return 0, 0
 
-def _chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> list[str]:
-    """Split text into overlapping chunks."""
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = start + chunk_size
-        chunk = text[start:end]
-        if chunk.strip():
-            chunks.append(chunk.strip())
-        start = end - overlap
-    return chunks
+    return _sync_brand(brand, full=full)
 
 
 if __name__ == "__main__":
     print("Initializing vector store...")
     initialize()
+    if "--calibrate" in sys.argv:
+        print(f"\nDistance calibration: {json.dumps(calibrate_max_distance())}")
+        print("Set RETRIEVAL_MAX_DISTANCE to the suggested value.")
+        sys.exit(0)
     print("\nTesting search...")
     for brand in ["ticket99", "eventitans"]:
         results = search(brand, "how much does it cost?")
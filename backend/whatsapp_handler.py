@@ -1,8 +1,33 @@
-"""Placeholder WhatsApp webhook handler for future integration."""
+"""WhatsApp Business (Cloud API) webhook handler.
 
-import json
+The webhook only parses the payload, drops messages it has already seen
+(WhatsApp re-delivers when a webhook is slow) and queues the rest, so it
+answers within milliseconds. Queued messages from the same sender that
+arrive within settings.whatsapp_batch_window are answered together as one
+turn. A fixed pool of workers generates replies (at PRIORITY_MESSAGING, so
+web chat goes first) and sends them through the outbound client, with
+retries and a minimum interval between messages to the same number.
+"""
+
+import time
+import asyncio
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+
+import httpx
 from fastapi import Request, Response
 
+from config import settings, BRAND_CONFIGS
+from conversation_manager import add_message, run_session_io
+from rag_chain import generate_response, extract_lead_form
+from llm_admission import PRIORITY_MESSAGING
+import metrics
+
+# WhatsApp text messages are limited to 4096 characters
+MAX_REPLY_LENGTH = 4096
+# Message ids remembered for de-duplication (and rate limit entries kept)
+_SEEN_IDS_MAX = 10000
+
 
 async def verify_webhook(request: Request) -> Response:
     """Handle WhatsApp webhook verification (GET).
@@ -13,27 +38,212 @@ async def verify_webhook(request: Request) -> Response:
     token = params.get("hub.verify_token")
     challenge = params.get("hub.challenge")
 
-    # TODO: Replace with actual verify token from WhatsApp Business API settings
-    verify_token = "tickets99_whatsapp_verify"
-
-    if mode == "subscribe" and token == verify_token:
+    if mode == "subscribe" and token == settings.whatsapp_verify_token:
         print(f"  [WhatsApp] Webhook verified")
         return Response(content=challenge, media_type="text/plain")
 
     return Response(content="Forbidden", status_code=403)
 
 
+def _brand_for(phone_number_id: str) -> str:
+    """Brand whose BRAND_CONFIGS "whatsapp_phone_number_id" matches, else the default."""
+    for brand, cfg in BRAND_CONFIGS.items():
+        if cfg.get("whatsapp_phone_number_id") and cfg["whatsapp_phone_number_id"] == phone_number_id:
+            return brand
+    return settings.whatsapp_default_brand
+
+
+def extract_messages(body: dict) -> list[dict]:
+    """Text messages in a webhook payload as
+    [{id, sender, text, phone_number_id, brand}]. Status updates and
+    non-text messages are skipped."""
+    messages = []
+    for entry in body.get("entry", []):
+        for change in entry.get("changes", []):
+            value = change.get("value", {})
+            phone_number_id = value.get("metadata", {}).get("phone_number_id", "")
+            for msg in value.get("messages", []):
+                text = msg.get("text", {}).get("body", "").strip()
+                if msg.get("type") != "text" or not text:
+                    continue
+                messages.append({
+                    "id": msg.get("id", ""),
+                    "sender": msg.get("from", ""),
+                    "text": text,
+                    "phone_number_id": phone_number_id,
+                    "brand": _brand_for(phone_number_id),
+                })
+    return messages
+
+
+class CloudApiClient:
+    """Sends text messages through the WhatsApp Cloud API (or anything at
+    settings.whatsapp_api_url that speaks the same protocol, e.g. a local mock)."""
+
+    def __init__(self, api_url: str, access_token: str) -> None:
+        self.api_url = api_url.rstrip("/")
+        self._client = httpx.AsyncClient(
+            timeout=10.0,
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
+
+    async def send_text(self, phone_number_id: str, to: str, body: str) -> None:
+        resp = await self._client.post(
+            f"{self.api_url}/{phone_number_id}/messages",
+            json={
+                "messaging_product": "whatsapp",
+                "to": to,
+                "type": "text",
+                "text": {"body": body},
+            },
+        )
+        resp.raise_for_status()
+
+
+class LogOnlyClient:
+    """Stand-in when no access token is configured: prints the replies."""
+
+    async def send_text(self, phone_number_id: str, to: str, body: str) -> None:
+        print(f"  [WhatsApp] Reply to {to}: {body[:200]}")
+
+
+def _retryable(exc: Exception) -> bool:
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code == 429 or exc.response.status_code >= 500
+    return isinstance(exc, httpx.TransportError)
+
+
+class WhatsAppDispatcher:
+    def __init__(
+        self,
+        client,
+        generate: Callable[..., Awaitable[str]],
+        workers: int,
+        batch_window: float,
+        min_interval: float,
+        retries: int,
+    ) -> None:
+        self.client = client
+        self.generate = generate
+        self.workers = workers
+        self.batch_window = batch_window
+        self.min_interval = min_interval
+        self.retries = retries
+        self._queue: asyncio.Queue = asyncio.Queue()
+        # (brand, phone_number_id, sender) -> texts waiting to be answered
+        self._pending: dict[tuple, list[str]] = {}
+        # Senders whose reply is being generated (one at a time per sender)
+        self._active: set[tuple] = set()
+        self._seen: OrderedDict[str, None] = OrderedDict()
+        # Recipient number -> earliest time the next message may be sent
+        self._next_send: dict[str, float] = {}
+
+    def receive(self, message: dict) -> bool:
+        """Queue an incoming message. False if it is a re-delivery."""
+        if message["id"]:
+            if message["id"] in self._seen:
+                return False
+            self._seen[message["id"]] = None
+            if len(self._seen) > _SEEN_IDS_MAX:
+                self._seen.popitem(last=False)
+
+        key = (message["brand"], message["phone_number_id"], message["sender"])
+        if key in self._pending:
+            self._pending[key].append(message["text"])
+        else:
+            self._pending[key] = [message["text"]]
+            asyncio.get_running_loop().call_later(self.batch_window, self._queue.put_nowait, key)
+        return True
+
+    async def run(self) -> None:
+        """Run the worker pool (background task)."""
+        await asyncio.gather(*(self._worker() for _ in range(self.workers)))
+
+    async def _worker(self) -> None:
+        while True:
+            key = await self._queue.get()
+            if key in self._active:
+                # Previous turn of this sender still running: answer this one after it
+                asyncio.get_running_loop().call_later(self.batch_window, self._queue.put_nowait, key)
+                continue
+            texts = self._pending.pop(key, None)
+            if not texts:
+                continue
+            self._active.add(key)
+            try:
+                await self._reply(key, "\n".join(texts))
+            except Exception as e:
+                print(f"  [WhatsApp] Error answering {key[2]}: {type(e).__name__}: {e}")
+            finally:
+                self._active.discard(key)
+
+    async def _reply(self, key: tuple, text: str) -> None:
+        brand, phone_number_id, sender = key
+        session_id = f"wa_{brand}_{sender}"
+        await run_session_io(add_message, session_id, "user", text)
+        answer = await self.generate(brand, text, session_id, priority=PRIORITY_MESSAGING)
+        # The lead form only exists in the web widget
+        answer, _ = extract_lead_form(answer)
+        await run_session_io(add_message, session_id, "assistant", answer)
+        await self._send(phone_number_id, sender, answer[:MAX_REPLY_LENGTH])
+        metrics.inc("whatsapp_replies", brand=brand)
+
+    async def _send(self, phone_number_id: str, to: str, body: str) -> None:
+        """Send with per-recipient spacing and retries on 429/5xx/network errors."""
+        if len(self._next_send) > _SEEN_IDS_MAX:
+            now = time.monotonic()
+            self._next_send = {number: t for number, t in self._next_send.items() if t > now}
+
+        for attempt in range(1, self.retries + 1):
+            now = time.monotonic()
+            wait = self._next_send.get(to, 0.0) - now
+            self._next_send[to] = max(now, self._next_send.get(to, 0.0)) + self.min_interval
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                await self.client.send_text(phone_number_id, to, body)
+                return
+            except Exception as e:
+                if attempt == self.retries or not _retryable(e):
+                    raise
+                print(f"  [WhatsApp] Send to {to} failed ({type(e).__name__}), retrying")
+                await asyncio.sleep(0.5 * 2 ** attempt)
+
+    def stats(self) -> dict:
+        return {"pending": len(self._pending), "active": len(self._active), "queued": self._queue.qsize()}
+
+
+_dispatcher: WhatsAppDispatcher | None = None
+
+
+def get_dispatcher() -> WhatsAppDispatcher:
+    global _dispatcher
+    if _dispatcher is None:
+        if settings.whatsapp_access_token:
+            client = CloudApiClient(settings.whatsapp_api_url, settings.whatsapp_access_token)
+        else:
+            client = LogOnlyClient()
+        _dispatcher = WhatsAppDispatcher(
+            client,
+            generate=generate_response,
+            workers=settings.whatsapp_workers,
+            batch_window=settings.whatsapp_batch_window,
+            min_interval=settings.whatsapp_min_reply_interval,
+            retries=settings.whatsapp_send_retries,
+        )
+    return _dispatcher
+
+
 async def handle_message(request: Request) -> dict:
     """Handle incoming WhatsApp messages (POST).
-    Logs the incoming data for now.
+    Queues them for the worker pool and returns right away.
     """
     try:
         body = await request.json()
-        print(f"  [WhatsApp] Incoming: {json.dumps(body, indent=2)}")
-
-        # TODO: Extract message, determine brand, call generate_response,
-        # and send reply via WhatsApp Business API
-
+        dispatcher = get_dispatcher()
+        received = [m for m in extract_messages(body) if dispatcher.receive(m)]
+        if received:
+            print(f"  [WhatsApp] Queued {len(received)} message(s)")
         return {"status": "received"}
     except Exception as e:
         print(f"  [WhatsApp] Error: {e}")
@@ -3,6 +3,7 @@
 
   const CONFIG = {
     apiUrl: "/api/eventitans/chat",
+    streamUrl: "/api/eventitans/chat/stream",
     leadsUrl: "/api/leads",
     clearUrl: "/api/clear",
     brandName: "Eventitans",
@@ -359,6 +360,7 @@
     div.textContent = text;
     msgs.appendChild(div);
     msgs.scrollTop = msgs.scrollHeight;
+    return div;
   }
 
   function addUserMessage(text) {
@@ -441,11 +443,19 @@
     };
 
     try {
-      await fetch(CONFIG.leadsUrl, {
+      const resp = await fetch(CONFIG.leadsUrl, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify(leadData),
       });
+      if (!resp.ok) {
+        const data = await resp.json().catch(() => ({}));
+        if (resp.status === 400 && data.error) {
+          alert(data.error);
+          return;
+        }
+        throw new Error(`HTTP ${resp.status}`);
+      }
       document.getElementById(`${CONFIG.prefix}-quick-container`).innerHTML = "";
       addBotMessage("Thank you! Our team will contact you within 24 hours to get you started. Anything else I can help with?");
     } catch (e) {
@@ -467,23 +477,60 @@
     showTyping();
 
     try {
-      const resp = await fetch(CONFIG.apiUrl, {
+      const resp = await fetch(CONFIG.streamUrl, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({ message, sessionId: sessionId }),
       });
+      if (!resp.ok || !resp.body) throw new Error(`HTTP ${resp.status}`);
+
+      // Read Server-Sent Events: "token" chunks, then a final "done" event
+      const reader = resp.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let bubble = null;
+      let done = null;
+
+      while (!done) {
+        const { value, done: streamEnded } = await reader.read();
+        if (streamEnded) break;
+        buffer += decoder.decode(value, { stream: true });
 
-      const data = await resp.json();
+        let sep;
+        while ((sep = buffer.indexOf("\n\n")) !== -1) {
+          const raw = buffer.slice(0, sep);
+          buffer = buffer.slice(sep + 2);
+          const event = (raw.match(/^event: (.*)$/m) || [])[1];
+          const data = (raw.match(/^data: (.*)$/m) || [])[1];
+          if (!data) continue;
+          const payload = JSON.parse(data);
+
+          if (event === "token") {
+            if (!bubble) {
+              hideTyping();
+              bubble = addBotMessage("");
+            }
+            bubble.textContent += payload.text;
+            bubble.parentNode.scrollTop = bubble.parentNode.scrollHeight;
+          } else if (event === "done" || event === "error") {
+            done = payload;
+          }
+        }
+      }
       hideTyping();
 
-      if (data.success) {
-        sessionId = data.sessionId;
-        addBotMessage(data.message);
+      if (done && done.success) {
+        sessionId = done.sessionId;
+        if (bubble) {
+          bubble.textContent = done.message;
+        } else {
+          addBotMessage(done.message);
+        }
 
-        if (data.showForm) {
-          showLeadForm(data.showForm);
+        if (done.showForm) {
+          showLeadForm(done.showForm);
         }
-      } else {
+      } else if (!bubble) {
         addBotMessage("Sorry, something went wrong. Please try again!");
       }
     } catch (e) {